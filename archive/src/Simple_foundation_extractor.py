@@ -1,17 +1,28 @@
 #!/usr/bin/env python3
 import os
-import base64
 import json
-import matplotlib.pyplot as plt
 import cv2
 import numpy as np
 import re
 import argparse
-import copy
+import platform
+import hashlib
+import time
+import threading
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache, wraps
 from pathlib import Path
 import requests
 from typing import List, Dict, Tuple, Any, Sequence, Optional, Union
 
+try:
+    # SIMD-accelerated drop-in replacement for the standard library module
+    import pybase64 as base64
+except ImportError:
+    import base64
+
 try:
     from google.cloud import vision
 except ImportError:
@@ -26,9 +37,11 @@ except ImportError:
 
 try:
     import google.generativeai as genai
+    from google.api_core import retry as google_retry
 except ImportError:
     print("Warning: Google Generative AI package not installed. Gemini features will not work.")
     genai = None
+    google_retry = None
 
 try:
     # Import Anthropic for Claude API
@@ -38,6 +51,12 @@ except ImportError:
     Anthropic = None
     AnthropicError = Exception  # Fallback for type checking
 
+try:
+    # Fast C JSON encoder, used when available
+    import orjson
+except ImportError:
+    orjson = None
+
 # --- Helper Functions ---
 def resize_image_for_vision_api(image, max_dim=1000):
     """
@@ -106,27 +125,92 @@ def feet_inches_to_inches(feet_str):
         print(f"Error parsing dimension '{feet_str}': {e}")
         return None
 
-def detect_corners(image_path, show_steps=False):
+def load_image(image_or_path):
+    """
+    Returns a BGR image, decoding it from disk only if a path was given.
+    
+    Args:
+        image_or_path: Path to image, or an already-decoded BGR image array.
+        
+    Returns:
+        image: BGR image array.
+    """
+    if isinstance(image_or_path, np.ndarray):
+        return image_or_path
+    
+    image = cv2.imread(image_or_path)
+    if image is None:
+        raise FileNotFoundError(f"Could not open/find image: {image_or_path}")
+    return image
+
+def cluster_nearby_points(points, radius, image_shape):
+    """
+    Groups points that lie within roughly `radius` pixels of each other.
+    
+    The points are rasterized into a mask, grown into discs that touch when
+    their centers are `radius` apart and labelled with connected components,
+    which closely approximates
+    DBSCAN(eps=radius, min_samples=1) in a single linear scan of the image.
+    
+    Args:
+        points: Array-like of (x, y) coordinates.
+        radius: Maximum distance in pixels between neighbouring points of a cluster.
+        image_shape: Shape of the image the points were detected in.
+        
+    Returns:
+        clustered_points: List of (x, y) cluster centers (mean of the member points).
+    """
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    if len(points) == 0:
+        return []
+    
+    height, width = image_shape[:2]
+    xs = np.clip(points[:, 0], 0, width - 1)
+    ys = np.clip(points[:, 1], 0, height - 1)
+    
+    # Grow each point into a disc so points closer than `radius` connect
+    mask = np.zeros((height, width), dtype=np.uint8)
+    mask[ys, xs] = 255
+    half = max(0, int((radius - 1) // 2))
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * half + 1, 2 * half + 1))
+    mask = cv2.dilate(mask, kernel)
+    
+    num_labels, labels = cv2.connectedComponents(mask, connectivity=8)
+    
+    # Average the original points of each component
+    point_labels = labels[ys, xs]
+    counts = np.bincount(point_labels, minlength=num_labels)
+    sum_x = np.bincount(point_labels, weights=points[:, 0], minlength=num_labels)
+    sum_y = np.bincount(point_labels, weights=points[:, 1], minlength=num_labels)
+    
+    present = counts > 0
+    center_x = (sum_x[present] / counts[present]).astype(int)
+    center_y = (sum_y[present] / counts[present]).astype(int)
+    
+    return list(zip(center_x.tolist(), center_y.tolist()))
+
+def detect_corners(image_path, show_steps=False, steps_dir=".", gray=None):
     """
     Detects the corners of the building in the foundation plan.
     
     Args:
-        image_path: Path to image.
+        image_path: Path to image, or an already-decoded BGR image.
         show_steps: If True, save intermediate images for debugging.
+        steps_dir: Directory the intermediate images are written to.
+        gray: Optional grayscale version of the image, to skip converting it again.
         
     Returns:
         corners: List of corner points (x, y) coordinates.
         debug_image: Image with detected corners for visualization.
     """
-    image = cv2.imread(image_path)
-    if image is None:
-        raise FileNotFoundError(f"Could not open/find image: {image_path}")
+    image = load_image(image_path)
     
     # Create a copy for visualization
     debug_image = image.copy()
     
     # Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if gray is None:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     
     # Step 1: Target the gray color range of the walls
     lower_gray = np.array([110], dtype=np.uint8)  # Lower bound for gray
@@ -134,7 +218,7 @@ def detect_corners(image_path, show_steps=False):
     gray_mask = cv2.inRange(gray, lower_gray, upper_gray)
     
     if show_steps:
-        cv2.imwrite("1_gray_mask.png", gray_mask)
+        cv2.imwrite(os.path.join(steps_dir, "1_gray_mask.png"), gray_mask)
     
     # Step 2: Apply morphological operations to enhance the walls
     kernel = np.ones((5, 5), np.uint8)
@@ -143,7 +227,7 @@ def detect_corners(image_path, show_steps=False):
     closed = cv2.morphologyEx(eroded, cv2.MORPH_CLOSE, kernel, iterations=2)
     
     if show_steps:
-        cv2.imwrite("2_morphology.png", closed)
+        cv2.imwrite(os.path.join(steps_dir, "2_morphology.png"), closed)
     
     # Step 3: Find contours in the processed image
     contours, hierarchy = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -197,35 +281,14 @@ def detect_corners(image_path, show_steps=False):
             harris_corners.append((x, y))
         
         # Cluster corners that are close to each other
-        from sklearn.cluster import DBSCAN
-        if len(harris_corners) > 0:
-            try:
-                # Convert to numpy array for clustering
-                harris_corners_np = np.array(harris_corners)
-                
-                # Use DBSCAN to cluster nearby points
-                clustering = DBSCAN(eps=20, min_samples=1).fit(harris_corners_np)
-                labels = clustering.labels_
-                
-                # Get cluster centers
-                unique_labels = set(labels)
-                clustered_corners = []
-                
-                for label in unique_labels:
-                    cluster_points = harris_corners_np[labels == label]
-                    center_x = int(np.mean(cluster_points[:, 0]))
-                    center_y = int(np.mean(cluster_points[:, 1]))
-                    clustered_corners.append((center_x, center_y))
-                
-                # If we found more corners with Harris, use those
-                if len(clustered_corners) >= 8:
-                    corners = clustered_corners
-                    # Draw new corners on debug image
-                    for x, y in corners:
-                        cv2.circle(debug_image, (x, y), 5, (0, 255, 255), -1)
-            except ImportError:
-                print("Warning: sklearn not available for corner clustering.")
-                # If sklearn is not available, just use the corners we already have
+        clustered_corners = cluster_nearby_points(harris_corners, 20, gray.shape)
+        
+        # If we found more corners with Harris, use those
+        if len(clustered_corners) >= 8:
+            corners = clustered_corners
+            # Draw new corners on debug image
+            for x, y in corners:
+                cv2.circle(debug_image, (x, y), 5, (0, 255, 255), -1)
     
     # If we still don't have enough corners, try to infer them from the shape
     if len(corners) < 4:  # A house should have at least 4 corners (rectangular shape)
@@ -267,32 +330,32 @@ def detect_corners(image_path, show_steps=False):
                 cv2.circle(debug_image, (int(x), int(y)), 5, (255, 0, 255), -1)
     
     if show_steps:
-        cv2.imwrite("2.5_detected_corners.png", debug_image)
+        cv2.imwrite(os.path.join(steps_dir, "2.5_detected_corners.png"), debug_image)
     
     return corners, debug_image
 
-def preprocess_image_for_walls(image_path, show_steps=False):
+def preprocess_image_for_walls(image_path, show_steps=False, steps_dir=".", gray=None):
     """
     Preprocesses the image to identify walls by first detecting corners and then connecting them.
     
     Args:
-        image_path: Path to image.
+        image_path: Path to image, or an already-decoded BGR image.
         show_steps: If True, save intermediate images for debugging.
+        steps_dir: Directory the intermediate images are written to.
+        gray: Optional grayscale version of the image, to skip converting it again.
         
     Returns:
         wall_image: Binary image (white walls on black background).
         perimeter_contours: List of contours representing the perimeter walls.
         geometry_data: Dictionary containing corner coordinates and wall segments.
     """
-    image = cv2.imread(image_path)
-    if image is None:
-        raise FileNotFoundError(f"Could not open/find image: {image_path}")
+    image = load_image(image_path)
     
     # Get image dimensions
     height, width = image.shape[:2]
     
     # Step 1: Detect corners
-    corners, debug_image = detect_corners(image_path, show_steps)
+    corners, debug_image = detect_corners(image, show_steps, steps_dir, gray)
     
     # Step 2: Create walls by connecting corners
     # Sort corners to form a clockwise or counter-clockwise sequence
@@ -344,8 +407,8 @@ def preprocess_image_for_walls(image_path, show_steps=False):
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
     
     if show_steps:
-        cv2.imwrite("3_detected_walls.png", walls_debug)
-        cv2.imwrite("4_wall_mask.png", wall_image)
+        cv2.imwrite(os.path.join(steps_dir, "3_detected_walls.png"), walls_debug)
+        cv2.imwrite(os.path.join(steps_dir, "4_wall_mask.png"), wall_image)
     
     # Create geometry data structure
     geometry_data = {
@@ -363,14 +426,16 @@ def preprocess_image_for_walls(image_path, show_steps=False):
             "is_valid": True  # This flag can be updated by the LLM
         })
     
+    # Calculate all wall lengths in pixels in one vectorized pass
+    corner_points = np.asarray(sorted_corners, dtype=np.float64).reshape(-1, 2)
+    deltas = np.roll(corner_points, -1, axis=0) - corner_points
+    wall_lengths = np.hypot(deltas[:, 0], deltas[:, 1]).tolist()
+    
     # Add walls to geometry data
-    for i in range(len(sorted_corners)):
+    for i, length_pixels in enumerate(wall_lengths):
         pt1 = sorted_corners[i]
         pt2 = sorted_corners[(i + 1) % len(sorted_corners)]
         
-        # Calculate wall length in pixels
-        length_pixels = np.sqrt((pt2[0] - pt1[0])**2 + (pt2[1] - pt1[1])**2)
-        
         geometry_data["walls"].append({
             "id": i + 1,
             "start_corner_id": i,
@@ -388,20 +453,17 @@ def preprocess_image_for_walls(image_path, show_steps=False):
 
 def get_overall_dimension_pixels(wall_image, orientation="horizontal"):
     """Measures overall width/height of foundation in pixels."""
-    white_pixels = np.where(wall_image == 255)
-    if not white_pixels[0].size:
-        return 0
-
-    if orientation == "horizontal":
-        min_x = np.min(white_pixels[1])
-        max_x = np.max(white_pixels[1])
-        return max_x - min_x
-    elif orientation == "vertical":
-        min_y = np.min(white_pixels[0])
-        max_y = np.max(white_pixels[0])
-        return max_y - min_y
-    else:
+    if orientation not in ("horizontal", "vertical"):
         raise ValueError("Invalid orientation. Use 'horizontal' or 'vertical'.")
+    
+    # Let OpenCV find the bounding box of the wall pixels in a single pass
+    # instead of materializing index arrays for every white pixel
+    _, _, w, h = cv2.boundingRect((wall_image == 255).astype(np.uint8))
+    if w == 0:
+        return 0
+    
+    # The span is measured between the first and last wall pixel
+    return (w if orientation == "horizontal" else h) - 1
 
 def calculate_scale_factor(real_world_dimension, pixel_dimension):
     """Calculates scale factor (real-world units per pixel)."""
@@ -424,17 +486,14 @@ def get_wall_segment_lengths_pixels(perimeter_contours):
     # Process each contour
     for contour in perimeter_contours:
         # Get the points from the contour
-        points = [point[0] for point in contour]
+        points = np.asarray(contour, dtype=np.float64).reshape(-1, 2)
         
         # Calculate the length of each segment (line between consecutive points)
-        for i in range(len(points)):
-            pt1 = points[i]
-            pt2 = points[(i + 1) % len(points)]
-            length = np.sqrt((pt2[0] - pt1[0])**2 + (pt2[1] - pt1[1])**2)
-            
-            # Only include significant segments
-            if length > 50:  # Lower threshold to catch smaller wall segments
-                segment_lengths.append(length)
+        deltas = np.roll(points, -1, axis=0) - points
+        lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+        
+        # Only include significant segments
+        segment_lengths.extend(lengths[lengths > 50].tolist())  # Lower threshold to catch smaller wall segments
     
     # No need to enforce exactly 8 wall segments - houses can have different numbers of walls
     if len(segment_lengths) < 4:  # A house should have at least 4 wall segments
@@ -548,17 +607,92 @@ def visualize_results(image, wall_lengths, ocr_results, perimeter_contours=None,
     
     return result_image
 
+# JPEG encoding for images sent to the LLMs; much faster to encode and smaller
+# to upload than PNG, and the models re-decode the image anyway
+LLM_IMAGE_MIME_TYPE = "image/jpeg"
+LLM_JPEG_ENCODE_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 85]
+
 def encode_image_to_base64(image):
-    """Encodes an OpenCV image to base64."""
-    _, encoded_image = cv2.imencode('.png', image)
+    """Encodes an OpenCV image to base64 JPEG."""
+    _, encoded_image = cv2.imencode('.jpg', image, LLM_JPEG_ENCODE_PARAMS)
     base64_image = base64.b64encode(encoded_image.tobytes()).decode('utf-8')
     return base64_image
 
+# Fast PNG encoding for diagnostic images (level 1 instead of OpenCV's default 3)
+PNG_FAST_ENCODE_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+# Feedback images are downscaled and compressed harder before upload; the geometry
+# sent with them is scaled to match (see scale_geometry_data)
+FEEDBACK_IMAGE_MAX_DIM = 1024
+FEEDBACK_JPEG_ENCODE_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 75]
+# Number of ranked issues requested per feedback call, independent of --iterations
+FEEDBACK_MAX_ISSUES = 5
+
+def encode_feedback_image_to_base64(image):
+    """
+    Downscales a feedback visualization and encodes it to base64 JPEG.
+    
+    Args:
+        image: Feedback visualization (OpenCV image).
+        
+    Returns:
+        Tuple of (base64 string, scale), where scale maps original pixel
+        coordinates onto the encoded image (1.0 when it wasn't resized).
+    """
+    small_image = resize_image_for_vision_api(image, FEEDBACK_IMAGE_MAX_DIM)
+    scale = small_image.shape[1] / image.shape[1]
+    _, encoded_image = cv2.imencode('.jpg', small_image, FEEDBACK_JPEG_ENCODE_PARAMS)
+    return base64.b64encode(encoded_image.tobytes()).decode('utf-8'), scale
+
+def scale_geometry_data(geometry_data, scale):
+    """
+    Returns a copy of geometry_data with all pixel coordinates and lengths scaled,
+    e.g. to match an image that was resized before being sent to the LLM.
+    
+    Args:
+        geometry_data: Dictionary containing corner coordinates and wall segments.
+        scale: Factor to multiply the pixel values by.
+        
+    Returns:
+        Scaled copy of geometry_data (the input itself when scale is 1).
+    """
+    if scale == 1:
+        return geometry_data
+    corners = [{**corner, "x": int(round(corner['x'] * scale)), "y": int(round(corner['y'] * scale))}
+               for corner in geometry_data['corners']]
+    walls = [{**wall,
+              "start_x": int(round(wall['start_x'] * scale)), "start_y": int(round(wall['start_y'] * scale)),
+              "end_x": int(round(wall['end_x'] * scale)), "end_y": int(round(wall['end_y'] * scale)),
+              "length_pixels": wall['length_pixels'] * scale}
+             for wall in geometry_data['walls']]
+    return {**geometry_data, "corners": corners, "walls": walls}
+
+def build_corner_to_walls(walls):
+    """
+    Build a reverse index from corner IDs to the walls that start or end there.
+    
+    Args:
+        walls: List of wall dicts from geometry_data.
+        
+    Returns:
+        Dict mapping each corner ID to its connected walls, in wall order.
+    """
+    corner_to_walls = defaultdict(list)
+    for wall in walls:
+        corner_to_walls[wall['start_corner_id']].append(wall)
+        if wall['end_corner_id'] != wall['start_corner_id']:
+            corner_to_walls[wall['end_corner_id']].append(wall)
+    return dict(corner_to_walls)
+
 def update_corner_validity(geometry_data, llm_response):
     """Update the is_valid flag for corners based on LLM's response."""
     # Process the LLM's identification of invalid corners
     invalid_corners = llm_response.get('invalid_corners', [])
     
+    # Index the walls connected to each corner once, instead of scanning
+    # every wall for every corner in the passes below
+    corner_to_walls = build_corner_to_walls(geometry_data['walls'])
+    
     # First pass: Mark corners as invalid based on LLM response
     for corner_id in invalid_corners:
         for corner in geometry_data['corners']:
@@ -589,10 +723,7 @@ def update_corner_validity(geometry_data, llm_response):
     for corner in geometry_data['corners']:
         if not corner['is_valid']:
             # Find walls connected to this corner
-            connected_walls = []
-            for wall in geometry_data['walls']:
-                if wall['start_corner_id'] == corner['id'] or wall['end_corner_id'] == corner['id']:
-                    connected_walls.append(wall)
+            connected_walls = corner_to_walls.get(corner['id'], [])
             
             # Check if this corner is at the perimeter
             at_perimeter = False
@@ -659,10 +790,7 @@ def update_corner_validity(geometry_data, llm_response):
         for corner in geometry_data['corners']:
             if not corner['is_valid']:
                 # Find connected walls
-                connected_walls = []
-                for wall in geometry_data['walls']:
-                    if wall['start_corner_id'] == corner['id'] or wall['end_corner_id'] == corner['id']:
-                        connected_walls.append(wall)
+                connected_walls = corner_to_walls.get(corner['id'], [])
                 
                 # Calculate importance score
                 total_length = sum(wall['length_pixels'] for wall in connected_walls)
@@ -670,6 +798,11 @@ def update_corner_validity(geometry_data, llm_response):
                 
                 corner_importance.append((corner['id'], importance))
         
+        # Look up corners by ID when restoring them
+        corners_by_id = defaultdict(list)
+        for corner in geometry_data['corners']:
+            corners_by_id[corner['id']].append(corner)
+        
         # Sort by importance (highest first)
         corner_importance.sort(key=lambda x: x[1], reverse=True)
         
@@ -679,8 +812,8 @@ def update_corner_validity(geometry_data, llm_response):
                 break
                 
             # Find the corner and mark it as valid
-            for corner in geometry_data['corners']:
-                if corner['id'] == corner_id and not corner['is_valid']:
+            for corner in corners_by_id[corner_id]:
+                if not corner['is_valid']:
                     corner['is_valid'] = True
                     valid_corner_count += 1
                     print(f"Restored corner {corner_id} as valid based on importance score")
@@ -688,106 +821,279 @@ def update_corner_validity(geometry_data, llm_response):
     
     return geometry_data
 
-def filter_invalid_walls(geometry_data):
-    """Filter out walls that connect to invalid corners."""
+def filter_invalid_walls(geometry_data, verbose=True):
+    """
+    Filter out walls that connect to invalid corners.
+    
+    Args:
+        geometry_data: Dictionary containing corners (with is_valid flags) and walls.
+        verbose: Print a line for every wall filtered and corner restored.
+        
+    Returns:
+        geometry_data with only the valid walls.
+    """
     valid_walls = []
     invalid_walls = []
+    messages = []
+    
+    # Look up each corner's validity by ID instead of scanning all corners per wall
+    corner_validity = {corner['id']: corner['is_valid'] for corner in geometry_data['corners']}
     
     # First, identify walls connecting to invalid corners
     for wall in geometry_data['walls']:
-        start_valid = False
-        end_valid = False
-        
-        for corner in geometry_data['corners']:
-            if corner['id'] == wall['start_corner_id']:
-                start_valid = corner['is_valid']
-            if corner['id'] == wall['end_corner_id']:
-                end_valid = corner['is_valid']
+        start_valid = corner_validity.get(wall['start_corner_id'], False)
+        end_valid = corner_validity.get(wall['end_corner_id'], False)
         
         if start_valid and end_valid:
             valid_walls.append(wall)
         else:
             invalid_walls.append(wall)
-            print(f"Identified invalid wall {wall['id']} connecting corners {wall['start_corner_id']} and {wall['end_corner_id']}")
+            if verbose:
+                messages.append(f"Identified invalid wall {wall['id']} connecting corners {wall['start_corner_id']} and {wall['end_corner_id']}")
+    
+    # Emit each loop's messages with one print instead of one per wall
+    if messages:
+        print("\n".join(messages))
+        messages = []
     
     # Check if we're filtering out too many walls (more than 30%)
     if len(invalid_walls) > 0.3 * len(geometry_data['walls']):
         print("Warning: Too many walls being filtered out. Rechecking corner validity...")
         
+        corner_to_walls = build_corner_to_walls(geometry_data['walls'])
+        
         # Reconsider corners that might be valid structural corners
         for corner in geometry_data['corners']:
             if not corner['is_valid']:
-                # Count how many walls connect to this corner
-                connected_wall_count = 0
-                for wall in geometry_data['walls']:
-                    if wall['start_corner_id'] == corner['id'] or wall['end_corner_id'] == corner['id']:
-                        connected_wall_count += 1
+                connected_walls = corner_to_walls.get(corner['id'], [])
                 
                 # If this corner connects multiple walls, it might be a valid structural corner
-                if connected_wall_count >= 2:
+                if len(connected_walls) >= 2:
                     # Check if any of these walls are long (structural)
-                    has_long_wall = False
-                    for wall in geometry_data['walls']:
-                        if (wall['start_corner_id'] == corner['id'] or wall['end_corner_id'] == corner['id']) and wall['length_pixels'] > 100:
-                            has_long_wall = True
-                            break
+                    has_long_wall = any(wall['length_pixels'] > 100 for wall in connected_walls)
                     
                     if has_long_wall:
                         corner['is_valid'] = True
-                        print(f"Restored corner {corner['id']} as valid based on structural importance")
+                        if verbose:
+                            messages.append(f"Restored corner {corner['id']} as valid based on structural importance")
         
         # Recompute valid walls after updating corner validity
+        corner_validity = {corner['id']: corner['is_valid'] for corner in geometry_data['corners']}
         valid_walls = []
         for wall in geometry_data['walls']:
-            start_valid = False
-            end_valid = False
-            
-            for corner in geometry_data['corners']:
-                if corner['id'] == wall['start_corner_id']:
-                    start_valid = corner['is_valid']
-                if corner['id'] == wall['end_corner_id']:
-                    end_valid = corner['is_valid']
+            start_valid = corner_validity.get(wall['start_corner_id'], False)
+            end_valid = corner_validity.get(wall['end_corner_id'], False)
             
             if start_valid and end_valid:
                 valid_walls.append(wall)
-            else:
-                print(f"Filtered out wall {wall['id']} connecting corners {wall['start_corner_id']} and {wall['end_corner_id']}")
+            elif verbose:
+                messages.append(f"Filtered out wall {wall['id']} connecting corners {wall['start_corner_id']} and {wall['end_corner_id']}")
+        
+        if messages:
+            print("\n".join(messages))
     
     # Replace the walls in geometry_data with only the valid walls
     geometry_data['walls'] = valid_walls
     return geometry_data
 
-def save_geometry_data(geometry_data, output_path):
-    """Saves geometry data to a JSON file and prints it to the console."""
+def geometry_to_json(geometry_data, indent=True):
+    """
+    Serializes geometry data as JSON for prompts and output files.
+    Uses orjson when it is installed, which is much faster than the standard encoder.
+    
+    Args:
+        geometry_data: Dictionary containing corner coordinates and wall segments.
+        indent: Whether to indent the output by two spaces (compact when False).
+        
+    Returns:
+        JSON text.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(geometry_data, option=option).decode('utf-8')
+        except TypeError:
+            pass  # Fall back to the standard encoder for types orjson rejects
+    if indent:
+        return json.dumps(geometry_data, indent=2)
+    return json.dumps(geometry_data, separators=(',', ':'))
+
+def save_geometry_data(geometry_data, output_path, indent=True):
+    """Saves geometry data to a JSON file (indented unless indent=False) and prints it to the console."""
     try:
+        # Serialize once and reuse the text for both the file and the console
+        payload = geometry_to_json(geometry_data, indent)
+        
         # Save to file
-        with open(output_path, 'w') as f:
-            json.dump(geometry_data, f, indent=2)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
         
         # Print to console
         print(f"\nGeometry data (also saved to {output_path}):")
-        print(json.dumps(geometry_data, indent=2))
+        print(payload)
         
         return True
     except Exception as e:
         print(f"Error saving geometry data: {e}")
         return False
 
+# Patterns used by parse_llm_response to pull JSON out of an LLM reply
+JSON_CODE_BLOCK_PATTERN = re.compile(r"```json\s*(.*?)```", re.DOTALL)
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+# Characters that matter when scanning for a balanced JSON object
+JSON_TOKEN_PATTERN = re.compile(r'[{}"\\]')
+
 # --- LLM Interaction Functions ---
+# Models used by the call_*_llm functions. Pinned to dated snapshots (not "-latest"
+# aliases) because the model name is part of the response cache key.
+LLM_MODELS = {
+    "openai": "gpt-4o-2024-08-06",
+    "gemini": "gemini-1.5-pro-002",
+    "claude": "claude-3-7-sonnet-20250219",
+}
+
+# Per-request timeouts in seconds, so a stuck call is cut off and retried instead
+# of stalling the pipeline. --llm_timeout overrides all of them.
+LLM_TIMEOUTS = {"openai": 60, "gemini": 60, "claude": 90}
+
+# Retries (with exponential backoff) on timeouts, connection errors and transient server errors.
+# The OpenAI and Anthropic SDKs already retry twice by default; one more attempt covers
+# the calls that the per-request timeouts above now cut off.
+LLM_MAX_RETRIES = 3
+
+# Clients are cached per API key so repeated calls (e.g. the feedback loop) reuse
+# the same connection pool instead of reconnecting every time
+@lru_cache(maxsize=None)
+def get_openai_client(api_key):
+    """Returns a cached OpenAI client for the given API key."""
+    return openai.OpenAI(api_key=api_key, max_retries=LLM_MAX_RETRIES)
+
+@lru_cache(maxsize=None)
+def get_gemini_model(api_key):
+    """Returns a cached Gemini model configured with the given API key."""
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(LLM_MODELS["gemini"])
+
+@lru_cache(maxsize=None)
+def get_claude_client(api_key):
+    """Returns a cached Anthropic client for the given API key."""
+    return Anthropic(api_key=api_key, max_retries=LLM_MAX_RETRIES)
+
+# On-disk cache of LLM responses, so reruns on the same drawing skip the API call.
+# Disabled with --no_cache; hits and misses are reported at the end of main().
+LLM_CACHE_DIR = Path(os.environ.get("TAKEOFF_LLM_CACHE_DIR", Path.home() / ".takeoff_cache"))
+LLM_CACHE_ENABLED = True
+LLM_CACHE_STATS = {"hits": 0, "misses": 0}
+
+def llm_cache_key(function_name, model, prompt, image):
+    """
+    Builds the cache key for an LLM call from the caller, the model, the prompt and the image content.
+    
+    Args:
+        function_name: Name of the call_*_llm function (the LLM provider).
+        model: Model name sent to the API.
+        prompt: Prompt text.
+        image: Base64 string, OpenCV image, or Gemini inline-data dict.
+        
+    Returns:
+        Hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([function_name, model, len(prompt)]).encode('utf-8'))
+    digest.update(prompt.encode('utf-8'))
+    if isinstance(image, str):
+        digest.update(image.encode('ascii'))
+    elif isinstance(image, dict):
+        digest.update(image.get("data", b""))
+    elif isinstance(image, np.ndarray):
+        digest.update(str(image.shape).encode('ascii'))
+        digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+# Whether the last LLM call on this thread was answered from the cache (read by timed_llm_call)
+LLM_CALL_STATE = threading.local()
+
+def cached_llm_call(model):
+    """
+    Decorates a call_*_llm(prompt, image, api_key) function with the on-disk response cache.
+    Error responses are never cached.
+    
+    Args:
+        model: Model name the decorated function sends to the API.
+    """
+    def decorator(call_llm):
+        @wraps(call_llm)
+        def wrapper(prompt, image, api_key):
+            LLM_CALL_STATE.cached = False
+            if not LLM_CACHE_ENABLED:
+                return call_llm(prompt, image, api_key)
+        
+            cache_path = LLM_CACHE_DIR / f"{llm_cache_key(call_llm.__name__, model, prompt, image)}.json"
+            try:
+                with open(cache_path, 'r', encoding='utf-8') as f:
+                    response = json.load(f)["response"]
+                LLM_CACHE_STATS["hits"] += 1
+                LLM_CALL_STATE.cached = True
+                return response
+            except (OSError, ValueError, KeyError):
+                pass
+        
+            LLM_CACHE_STATS["misses"] += 1
+            response = call_llm(prompt, image, api_key)
+            if isinstance(response, str) and not response.startswith("Error"):
+                try:
+                    LLM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                    # Write to a temporary file first so a crash never leaves a partial entry
+                    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        json.dump({"response": response}, f)
+                    os.replace(tmp_path, cache_path)
+                except OSError as e:
+                    print(f"Warning: Could not write LLM cache entry: {e}")
+            return response
+        return wrapper
+    return decorator
+
+# Latency of every LLM call made during the run, written to timings_<n>.json at the end of main()
+LLM_TIMINGS = []
+
+@contextmanager
+def timed_llm_call(stage, provider):
+    """
+    Records the wall-clock latency of the enclosed LLM call in LLM_TIMINGS. Calls answered
+    from the on-disk cache are flagged with "cached": true, so they can be left out of
+    API latency figures.
+    """
+    LLM_CALL_STATE.cached = False
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        LLM_TIMINGS.append({
+            "stage": stage,
+            "provider": provider,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "cached": LLM_CALL_STATE.cached
+        })
+
+@cached_llm_call("mistral")
 def call_mistral_llm(prompt, image_base64, api_key):
     """Calls the Mistral API with the given prompt and image."""
     print("Mistral API is not supported in this version. Please use OpenAI or Gemini instead.")
     return "Error: Mistral API is not supported in this version."
 
+@cached_llm_call(LLM_MODELS["openai"])
 def call_openai_llm(prompt, image_base64, api_key):
     """Calls the OpenAI GPT-4o API with the given prompt and image."""
     if openai is None:
         return "Error: OpenAI library not installed."
-    client = openai.OpenAI(api_key=api_key)
+    client = get_openai_client(api_key)
 
     try:
         response = client.chat.completions.create(
-            model="gpt-4o",
+            model=LLM_MODELS["openai"],
             messages=[
                 {
                     "role": "user",
@@ -795,24 +1101,25 @@ def call_openai_llm(prompt, image_base64, api_key):
                         {"type": "text", "text": prompt},
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{image_base64}"},
+                            "image_url": {"url": f"data:{LLM_IMAGE_MIME_TYPE};base64,{image_base64}"},
                         },
                     ],
                 }
             ],
-            max_tokens=1000
+            max_tokens=1000,
+            timeout=LLM_TIMEOUTS["openai"]
         )
         return response.choices[0].message.content
     except Exception as e:
         print(f"Error calling OpenAI API: {e}")
         return f"Error: {e}"
 
+@cached_llm_call(LLM_MODELS["gemini"])
 def call_gemini_llm(prompt, image, api_key):
     """Calls the Google Gemini API with the given prompt and image."""
     if genai is None:
          return "Error: Google Generative AI library not installed."
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-pro-002')
+    model = get_gemini_model(api_key)
     try:
         response = model.generate_content(
             [prompt, image],
@@ -821,23 +1128,29 @@ def call_gemini_llm(prompt, image, api_key):
                 top_p=0.95,
                 top_k=0,
                 max_output_tokens=8192,
-            )
+            ),
+            request_options={
+                "timeout": LLM_TIMEOUTS["gemini"],
+                "retry": google_retry.Retry(initial=0.5, maximum=4.0, multiplier=2.0,
+                                            timeout=LLM_TIMEOUTS["gemini"] * (LLM_MAX_RETRIES + 1)),
+            }
         )
         return response.text
     except Exception as e:
         print(f"Error calling Gemini API: {e}")
         return f"Error: {e}"
 
+@cached_llm_call(LLM_MODELS["claude"])
 def call_claude_llm(prompt, image_base64, api_key):
     """Calls the Anthropic Claude 3.7 Sonnet API with the given prompt and image."""
     if Anthropic is None:
         return "Error: Anthropic library not installed."
     
-    client = Anthropic(api_key=api_key)
+    client = get_claude_client(api_key)
     
     try:
         response = client.messages.create(
-            model="claude-3-7-sonnet-latest",
+            model=LLM_MODELS["claude"],
             max_tokens=4096,
             temperature=0.0,
             messages=[
@@ -852,34 +1165,77 @@ def call_claude_llm(prompt, image_base64, api_key):
                             "type": "image",
                             "source": {
                                 "type": "base64",
-                                "media_type": "image/png",
+                                "media_type": LLM_IMAGE_MIME_TYPE,
                                 "data": image_base64
                             }
                         }
                     ]
                 }
-            ]
+            ],
+            timeout=LLM_TIMEOUTS["claude"]
         )
         return response.content[0].text
     except Exception as e:
         print(f"Error calling Claude API: {e}")
         return f"Error: {e}"
 
+def extract_first_json_object(text):
+    """
+    Finds the first balanced top-level {...} object in the text with a single
+    forward scan, ignoring braces inside JSON strings.
+    
+    Args:
+        text: Text that may contain a JSON object, e.g. an LLM reply with prose around it.
+        
+    Returns:
+        The substring holding the first complete object, or None if no braces balance.
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    skip_until = -1  # Position after an escaped character inside a string
+    for match in JSON_TOKEN_PATTERN.finditer(text, start):
+        pos = match.start()
+        if pos < skip_until:
+            continue
+        char = match.group()
+        if in_string:
+            if char == '\\':
+                skip_until = pos + 2
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:pos + 1]
+    return None
+
 def parse_llm_response(response_text):
     """
     Parses the LLM's response, attempting to extract a JSON object.
     """
     try:
         # Attempt to find JSON within code blocks (```json ... ```)
-        match = re.search(r"```json\n(.*?)```", response_text, re.DOTALL)
+        match = JSON_CODE_BLOCK_PATTERN.search(response_text)
         if match:
             json_str = match.group(1)
             return json.loads(json_str)
 
-        # Attempt to find JSON directly (without code blocks)
-        match = re.search(r"\{.*\}", response_text, re.DOTALL)
-        if match:
-            json_str = match.group(0)
+        # Attempt to find JSON directly (without code blocks): take the first
+        # balanced object, falling back to the widest {...} span if none balances
+        json_str = extract_first_json_object(response_text)
+        if json_str is None:
+            match = JSON_OBJECT_PATTERN.search(response_text)
+            if match:
+                json_str = match.group(0)
+        if json_str is not None:
             return json.loads(json_str)
         return {} # No JSON
 
@@ -910,7 +1266,7 @@ def create_prompt(ocr_results, overall_width_inches, geometry_data=None, image_b
     
     Here is the detailed geometry data:
     ```json
-    {json.dumps(geometry_data, indent=2)}
+    {geometry_to_json(geometry_data)}
     ```
     """
     
@@ -963,6 +1319,19 @@ def create_prompt(ocr_results, overall_width_inches, geometry_data=None, image_b
     """
      return prompt
 
+# Appended to the wall length prompt when the same LLM also corrects the corners,
+# so both answers come back from a single request
+COMBINED_CORNER_CORRECTION_INSTRUCTIONS = """
+    In the same JSON object, also correct the corner positions so that walls meet at 90° angles
+    wherever appropriate, preserving the overall shape and dimensions of the foundation.
+    Add a "corrected_corners" list with one entry per corner, for example:
+      "corrected_corners": [
+        {"id": 1, "original_x": 300, "original_y": 210, "corrected_x": 300, "corrected_y": 200,
+         "reason": "Adjusted to form 90° angle with walls connecting to corners 0 and 2"}
+      ]
+    For corners that don't need adjustment, include them with the same coordinates as the original.
+    """
+
 def create_corner_correction_prompt(geometry_data):
     """
     Creates a prompt for the LLM to correct corner positions to form 90° angles.
@@ -978,7 +1347,7 @@ def create_corner_correction_prompt(geometry_data):
 I have detected the following geometry data from a foundation plan:
 
 ```json
-{json.dumps(geometry_data, indent=2)}
+{geometry_to_json(geometry_data)}
 ```
 
 Your task is to analyze this geometry data and correct the corner positions to ensure that walls meet at 90° angles wherever appropriate. Foundation plans typically have rectilinear designs with perpendicular walls.
@@ -992,27 +1361,27 @@ For each corner, determine if it needs adjustment to form proper 90° angles wit
 
 Format your response as a JSON object with the following structure:
 ```json
-{
+{{
   "corrected_corners": [
-    {
+    {{
       "id": 0,
       "original_x": 100,
       "original_y": 200,
       "corrected_x": 100,
       "corrected_y": 200,
       "reason": "Already forms approximately 90° angles with adjacent walls"
-    },
-    {
+    }},
+    {{
       "id": 1,
       "original_x": 300,
       "original_y": 210,
       "corrected_x": 300,
       "corrected_y": 200,
       "reason": "Adjusted to form 90° angle with walls connecting to corners 0 and 2"
-    },
+    }},
     ...
   ]
-}
+}}
 ```
 
 For corners that don't need adjustment, include them in the response with the same coordinates as the original.
@@ -1038,27 +1407,56 @@ def correct_corners_with_llm(geometry_data, image_base64, api_key, llm_type):
     prompt = create_corner_correction_prompt(geometry_data)
     
     # Call the appropriate LLM
-    if llm_type == "openai":
-        llm_response = call_openai_llm(prompt, image_base64, api_key)
-    elif llm_type == "gemini":
-        # For Gemini, we need to decode the base64 image back to an OpenCV image
-        _, img_data = cv2.imencode('.png', cv2.imdecode(np.frombuffer(base64.b64decode(image_base64), np.uint8), cv2.IMREAD_COLOR))
-        llm_response = call_gemini_llm(prompt, img_data, api_key)
-    elif llm_type == "claude":
-        llm_response = call_claude_llm(prompt, image_base64, api_key)
-    else:
+    if llm_type not in ("openai", "gemini", "claude"):
         print("Error: Unsupported LLM type for corner correction")
         return geometry_data
     
-    # Parse the response
+    with timed_llm_call("corner_correction", llm_type):
+        if llm_type == "openai":
+            llm_response = call_openai_llm(prompt, image_base64, api_key)
+        elif llm_type == "gemini":
+            # For Gemini, pass the encoded bytes we already have as an inline blob
+            # (no need to decode and re-encode the image)
+            img_data = {"mime_type": LLM_IMAGE_MIME_TYPE, "data": base64.b64decode(image_base64)}
+            llm_response = call_gemini_llm(prompt, img_data, api_key)
+        elif llm_type == "claude":
+            llm_response = call_claude_llm(prompt, image_base64, api_key)
+    
+    # Parse the response and apply the corrections
     parsed_response = parse_llm_response(llm_response)
+    return apply_corner_corrections(geometry_data, parsed_response)
+
+def apply_corner_corrections(geometry_data, parsed_response):
+    """
+    Applies the corrected_corners from a parsed LLM response to a copy of the geometry.
     
+    Args:
+        geometry_data: Dictionary containing corner coordinates and wall segments.
+        parsed_response: Parsed LLM response with a "corrected_corners" list.
+        
+    Returns:
+        corrected_geometry: Updated geometry data with corrected corner positions.
+    """
     if not parsed_response or 'corrected_corners' not in parsed_response:
         print("No corner corrections received from LLM")
         return geometry_data
     
-    # Create a copy of the geometry data to modify
-    corrected_geometry = copy.deepcopy(geometry_data)
+    # Create a copy of the geometry data to modify. Corners and walls only hold
+    # scalar values, so copying each dict is enough (and much cheaper than deepcopy)
+    corrected_geometry = dict(geometry_data)
+    corrected_geometry['corners'] = [dict(corner) for corner in geometry_data['corners']]
+    corrected_geometry['walls'] = [dict(wall) for wall in geometry_data['walls']]
+    
+    # Index corners by ID and walls by the corners they start/end at, so each
+    # correction is applied without rescanning every corner and wall
+    corners_by_id = {}
+    for corner in corrected_geometry['corners']:
+        corners_by_id.setdefault(corner['id'], corner)
+    walls_by_start = defaultdict(list)
+    walls_by_end = defaultdict(list)
+    for wall in corrected_geometry['walls']:
+        walls_by_start[wall['start_corner_id']].append(wall)
+        walls_by_end[wall['end_corner_id']].append(wall)
     
     # Apply the corrections
     for correction in parsed_response.get('corrected_corners', []):
@@ -1068,46 +1466,47 @@ def correct_corners_with_llm(geometry_data, image_base64, api_key, llm_type):
         reason = correction.get('reason', '')
         
         # Find the corner in the geometry data
-        for corner in corrected_geometry['corners']:
-            if corner['id'] == corner_id:
-                # Check if the position was actually changed
-                if corner['x'] != corrected_x or corner['y'] != corrected_y:
-                    print(f"Correcting corner {corner_id}: ({corner['x']}, {corner['y']}) -> ({corrected_x}, {corrected_y})")
-                    print(f"  Reason: {reason}")
-                    
-                    # Update the corner position
-                    corner['x'] = corrected_x
-                    corner['y'] = corrected_y
-                    
-                    # Also update any walls that use this corner
-                    for wall in corrected_geometry['walls']:
-                        if wall['start_corner_id'] == corner_id:
-                            wall['start_x'] = corrected_x
-                            wall['start_y'] = corrected_y
-                        if wall['end_corner_id'] == corner_id:
-                            wall['end_x'] = corrected_x
-                            wall['end_y'] = corrected_y
-                break
-    
-    # Recalculate wall lengths
-    for wall in corrected_geometry['walls']:
-        start_x = wall['start_x']
-        start_y = wall['start_y']
-        end_x = wall['end_x']
-        end_y = wall['end_y']
+        corner = corners_by_id.get(corner_id)
+        if corner is None:
+            continue
         
-        # Calculate wall length in pixels
-        wall['length_pixels'] = np.sqrt((end_x - start_x)**2 + (end_y - start_y)**2)
+        # Check if the position was actually changed
+        if corner['x'] != corrected_x or corner['y'] != corrected_y:
+            print(f"Correcting corner {corner_id}: ({corner['x']}, {corner['y']}) -> ({corrected_x}, {corrected_y})")
+            print(f"  Reason: {reason}")
+            
+            # Update the corner position
+            corner['x'] = corrected_x
+            corner['y'] = corrected_y
+            
+            # Also update any walls that use this corner
+            for wall in walls_by_start.get(corner_id, []):
+                wall['start_x'] = corrected_x
+                wall['start_y'] = corrected_y
+            for wall in walls_by_end.get(corner_id, []):
+                wall['end_x'] = corrected_x
+                wall['end_y'] = corrected_y
+    
+    # Recalculate all wall lengths in one vectorized pass
+    walls = corrected_geometry['walls']
+    if walls:
+        endpoints = np.array([(wall['start_x'], wall['start_y'], wall['end_x'], wall['end_y']) for wall in walls],
+                             dtype=np.float64)
+        lengths = np.hypot(endpoints[:, 2] - endpoints[:, 0], endpoints[:, 3] - endpoints[:, 1])
+        for wall, length in zip(walls, lengths.tolist()):
+            wall['length_pixels'] = length
     
     return corrected_geometry
 
-def create_llm_feedback_prompt(image_base64, geometry_data=None):
+def create_llm_feedback_prompt(image_base64, geometry_data=None, max_issues=None):
     """
     Creates a prompt for the LLM to provide feedback on the wall detection.
     
     Args:
         image_base64: Base64-encoded image.
         geometry_data: Optional dictionary containing corner coordinates and wall segments.
+        max_issues: Optional limit on the number of issues; when given, the LLM is
+            asked to rank them from most to least important.
         
     Returns:
         prompt: Prompt for the LLM.
@@ -1123,8 +1522,15 @@ Walls: {len(geometry_data['walls'])} segments
 
 Here is the detailed geometry data:
 ```json
-{json.dumps(geometry_data, indent=2)}
+{geometry_to_json(geometry_data)}
 ```
+"""
+    
+    # Ask for a ranked list so several issues can be applied from one response
+    ranking_str = ""
+    if max_issues:
+        ranking_str = f"""
+List at most {max_issues} issues, ranked from most to least important to fix.
 """
     
     prompt = f"""You are an expert at analyzing architectural foundation plans.
@@ -1141,25 +1547,64 @@ For each issue, please provide:
 - A description of the location (e.g., "bottom left corner", "top right", etc.)
 - What the problem is (deviation, missing segment, false positive)
 - A suggestion for how to fix it
-
+{ranking_str}
 Format your response as a JSON object with the following structure:
 ```json
-{
+{{
   "issues": [
-    {
+    {{
       "location": "bottom center",
       "problem": "deviation",
       "description": "The green line deviates from the wall and connects to text annotations",
       "suggestion": "The line should follow the straight wall and not connect to the text"
-    },
+    }},
     ...
   ],
   "overall_assessment": "The wall detection is mostly accurate but has issues in the bottom area"
-}
+}}
 ```
 """
     return prompt
 
+def contours_in_location(location, centroids, width, height):
+    """
+    Marks which contour centroids fall in a feedback location such as "bottom left".
+    
+    Args:
+        location: Lower-cased location string from the LLM feedback.
+        centroids: (N, 2) array of contour centroids (x, y).
+        width: Image width.
+        height: Image height.
+        
+    Returns:
+        Boolean array with True for centroids inside the location.
+    """
+    cx = centroids[:, 0]
+    cy = centroids[:, 1]
+    
+    # Vertical band: bottom/top/middle third of the image
+    in_rows = np.zeros(len(centroids), dtype=bool)
+    if 'bottom' in location:
+        in_rows |= cy > height * 0.7
+    if 'top' in location:
+        in_rows |= cy < height * 0.3
+    if 'middle' in location:
+        in_rows |= (cy >= height * 0.3) & (cy <= height * 0.7)
+    
+    # Horizontal band: left/center/right, or anywhere if none is given
+    if 'left' not in location and 'center' not in location and 'right' not in location:
+        return in_rows
+    
+    in_cols = np.zeros(len(centroids), dtype=bool)
+    if 'left' in location:
+        in_cols |= cx < width * 0.3
+    if 'center' in location:
+        in_cols |= (cx >= width * 0.3) & (cx <= width * 0.7)
+    if 'right' in location:
+        in_cols |= cx > width * 0.7
+    
+    return in_rows & in_cols
+
 def apply_llm_feedback(perimeter_contours, feedback, image_shape):
     """
     Applies feedback from the LLM to improve the wall detection.
@@ -1174,153 +1619,69 @@ def apply_llm_feedback(perimeter_contours, feedback, image_shape):
     """
     height, width = image_shape[:2]
     improved_contours = []
-    contours_to_remove = []
     
-    # First, identify contours to remove (false positives)
+    # Calculate each contour's centroid once; every issue below reuses it.
+    # The bounding box center is enough to tell which region a contour is in,
+    # and is cheaper than computing image moments
+    centroids = []
+    for contour in perimeter_contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        centroids.append((x + w//2, y + h//2))
+    centroids = np.array(centroids, dtype=np.int64).reshape(-1, 2)
+    
+    # Parse each issue once and mark which contours lie in its location
+    issues = []
     for issue in feedback.get('issues', []):
         location = issue.get('location', '').lower()
         problem = issue.get('problem', '').lower()
-        
+        issues.append((location, problem, contours_in_location(location, centroids, width, height)))
+    
+    # First, identify contours to remove (false positives) as a per-contour flag,
+    # so checking a contour is a constant-time lookup
+    contours_to_remove = np.zeros(len(perimeter_contours), dtype=bool)
+    for location, problem, in_location in issues:
         if problem == 'false positive':
             # Mark contours in this area for removal
-            for i, contour in enumerate(perimeter_contours):
-                # Calculate contour centroid
-                M = cv2.moments(contour)
-                if M["m00"] != 0:
-                    cx = int(M["m10"] / M["m00"])
-                    cy = int(M["m01"] / M["m00"])
-                else:
-                    # Fallback to bounding box center
-                    x, y, w, h = cv2.boundingRect(contour)
-                    cx, cy = x + w//2, y + h//2
-                
-                # Check if centroid is in the specified location
-                in_location = False
-                if 'bottom' in location and cy > height * 0.7:
-                    if ('left' in location and cx < width * 0.3) or \
-                       ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                       ('right' in location and cx > width * 0.7) or \
-                       ('left' not in location and 'center' not in location and 'right' not in location):
-                        in_location = True
-                elif 'top' in location and cy < height * 0.3:
-                    if ('left' in location and cx < width * 0.3) or \
-                       ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                       ('right' in location and cx > width * 0.7) or \
-                       ('left' not in location and 'center' not in location and 'right' not in location):
-                        in_location = True
-                elif 'middle' in location and cy >= height * 0.3 and cy <= height * 0.7:
-                    if ('left' in location and cx < width * 0.3) or \
-                       ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                       ('right' in location and cx > width * 0.7) or \
-                       ('left' not in location and 'center' not in location and 'right' not in location):
-                        in_location = True
-                
-                if in_location:
-                    contours_to_remove.append(i)
+            contours_to_remove |= in_location
     
     # Process each contour
     for i, contour in enumerate(perimeter_contours):
         # Skip contours marked for removal
-        if i in contours_to_remove:
+        if contours_to_remove[i]:
             continue
         
         # Create a copy of the contour to modify
         modified_contour = contour.copy()
         
         # Apply fixes based on feedback
-        for issue in feedback.get('issues', []):
-            location = issue.get('location', '').lower()
-            problem = issue.get('problem', '').lower()
-            
-            # Calculate contour centroid
-            M = cv2.moments(contour)
-            if M["m00"] != 0:
-                cx = int(M["m10"] / M["m00"])
-                cy = int(M["m01"] / M["m00"])
-            else:
-                # Fallback to bounding box center
-                x, y, w, h = cv2.boundingRect(contour)
-                cx, cy = x + w//2, y + h//2
-            
-            # Check if this contour is in the location mentioned in the feedback
-            in_location = False
-            if 'bottom' in location and cy > height * 0.7:
-                if ('left' in location and cx < width * 0.3) or \
-                   ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                   ('right' in location and cx > width * 0.7) or \
-                   ('left' not in location and 'center' not in location and 'right' not in location):
-                    in_location = True
-            elif 'top' in location and cy < height * 0.3:
-                if ('left' in location and cx < width * 0.3) or \
-                   ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                   ('right' in location and cx > width * 0.7) or \
-                   ('left' not in location and 'center' not in location and 'right' not in location):
-                    in_location = True
-            elif 'middle' in location and cy >= height * 0.3 and cy <= height * 0.7:
-                if ('left' in location and cx < width * 0.3) or \
-                   ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                   ('right' in location and cx > width * 0.7) or \
-                   ('left' not in location and 'center' not in location and 'right' not in location):
-                    in_location = True
-            
-            if in_location and problem == 'deviation':
+        for location, problem, in_location in issues:
+            if in_location[i] and problem == 'deviation':
                 # Fix deviation by straightening the line in this area
+                points = modified_contour.reshape(-1, 2)
+                in_region = None
                 if 'bottom' in location:
                     # Find points in the bottom part
-                    bottom_points = []
-                    bottom_indices = []
-                    for j in range(len(modified_contour)):
-                        if modified_contour[j][0][1] > height * 0.7:
-                            bottom_points.append(modified_contour[j])
-                            bottom_indices.append(j)
-                    
-                    if bottom_points:
-                        # Calculate average y-coordinate for bottom points
-                        avg_y = sum(pt[0][1] for pt in bottom_points) / len(bottom_points)
-                        
-                        # Find leftmost and rightmost x-coordinates
-                        x_coords = [pt[0][0] for pt in bottom_points]
-                        left_x = min(x_coords)
-                        right_x = max(x_coords)
-                        
-                        # Create a new contour with straight bottom line
-                        new_contour = []
-                        for j in range(len(modified_contour)):
-                            if j not in bottom_indices:
-                                new_contour.append(modified_contour[j])
-                        
-                        # Add just two points for the bottom line
-                        new_contour.append(np.array([[[left_x, int(avg_y)]]]))
-                        new_contour.append(np.array([[[right_x, int(avg_y)]]]))
-                        
-                        if len(new_contour) >= 3:
-                            modified_contour = np.array(new_contour)
-                
+                    in_region = points[:, 1] > height * 0.7
                 elif 'top' in location:
                     # Similar logic for top part
-                    top_points = []
-                    top_indices = []
-                    for j in range(len(modified_contour)):
-                        if modified_contour[j][0][1] < height * 0.3:
-                            top_points.append(modified_contour[j])
-                            top_indices.append(j)
+                    in_region = points[:, 1] < height * 0.3
+                
+                if in_region is not None and in_region.any():
+                    region_points = points[in_region]
                     
-                    if top_points:
-                        avg_y = sum(pt[0][1] for pt in top_points) / len(top_points)
-                        x_coords = [pt[0][0] for pt in top_points]
-                        left_x = min(x_coords)
-                        right_x = max(x_coords)
-                        
-                        new_contour = []
-                        for j in range(len(modified_contour)):
-                            if j not in top_indices:
-                                new_contour.append(modified_contour[j])
-                        
-                        new_contour.append(np.array([[[left_x, int(avg_y)]]]))
-                        new_contour.append(np.array([[[right_x, int(avg_y)]]]))
-                        
-                        if len(new_contour) >= 3:
-                            modified_contour = np.array(new_contour)
+                    # Calculate average y-coordinate for the region points
+                    avg_y = int(region_points[:, 1].mean())
+                    
+                    # Find leftmost and rightmost x-coordinates
+                    left_x = region_points[:, 0].min()
+                    right_x = region_points[:, 0].max()
+                    
+                    # Create a new contour with the region replaced by just two points on a straight line
+                    new_contour = np.vstack([points[~in_region],
+                                             [[left_x, avg_y], [right_x, avg_y]]]).astype(points.dtype)
+                    
+                    if len(new_contour) >= 3:
+                        modified_contour = new_contour.reshape(-1, 1, 2)
         
         # Add the modified contour to the improved contours list
         if len(modified_contour) >= 3:  # Ensure it's a valid contour
@@ -1336,6 +1697,64 @@ def apply_llm_feedback(perimeter_contours, feedback, image_shape):
     
     return improved_contours
 
+def analyze_wall_lengths_with_llm(llm_type, ocr_future, overall_width_inches, geometry_data, image, image_base64, api_key,
+                                  include_corner_corrections=False):
+    """
+    Asks the chosen LLM for its wall length analysis. Meant to run in the
+    background, so it waits for the OCR results itself.
+    
+    Args:
+        llm_type: Which LLM to use (mistral, openai, gemini, claude).
+        ocr_future: Future that resolves to the OCR text detection results.
+        overall_width_inches: Overall width of the foundation in inches.
+        geometry_data: Dictionary containing corner coordinates and wall segments.
+        image: Original OpenCV image (used by Gemini).
+        image_base64: Base64-encoded original image (used by the other LLMs).
+        api_key: API key for the chosen LLM.
+        include_corner_corrections: Also ask for corrected_corners in the same request.
+        
+    Returns:
+        llm_response: Raw response text from the LLM.
+    """
+    ocr_results = ocr_future.result()
+    prompt = create_prompt(ocr_results, overall_width_inches, geometry_data)
+    stage = "wall_length_analysis"
+    if include_corner_corrections:
+        prompt += COMBINED_CORNER_CORRECTION_INSTRUCTIONS
+        stage = "wall_length_and_corner_correction"
+    
+    with timed_llm_call(stage, llm_type):
+        if llm_type == "mistral":
+            return call_mistral_llm(prompt, image_base64, api_key)
+        elif llm_type == "openai":
+            return call_openai_llm(prompt, image_base64, api_key)
+        elif llm_type == "gemini":
+            return call_gemini_llm(prompt, image, api_key)
+        elif llm_type == "claude":
+            return call_claude_llm(prompt, image_base64, api_key)
+
+def has_display():
+    """Returns True when a plot window can actually be shown (not a headless session)."""
+    if platform.system() in ("Windows", "Darwin"):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+# Matches numbered outputs like result_007.png and captures the number
+RESULT_FILE_PATTERN = re.compile(r"^result_(\d+)(?:[_.].*)?\.png$")
+
+# Expected wall lengths (from the prompt), used when too few segments are detected
+WallSpec = namedtuple("WallSpec", "wall_number length position")
+EXPECTED_WALLS = (
+    WallSpec(1, "55'-0\"", "top"),
+    WallSpec(2, "34'-0\"", "right"),
+    WallSpec(3, "34'-3\"", "bottom-right"),
+    WallSpec(4, "6'-0\"", "bottom-cutout-right"),
+    WallSpec(5, "8'-0\"", "bottom-cutout-bottom"),
+    WallSpec(6, "6'-0\"", "bottom-cutout-left"),
+    WallSpec(7, "12'-9\"", "bottom-left"),
+    WallSpec(8, "34'-3\"", "left"),
+)
+
 def main():
     parser = argparse.ArgumentParser(description="Extract wall lengths from foundation plans.")
     parser.add_argument("image_path", help="Path to the foundation plan image.")
@@ -1355,7 +1774,23 @@ def main():
                         help="Use LLM to correct corner positions to form 90° angles (none, openai, gemini, claude). Default: none.")
     parser.add_argument("--iterations", type=int, default=1,
                         help="Number of iterations for the feedback loop (default: 1).")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Always call the LLM APIs instead of reusing cached responses.")
+    parser.add_argument("--llm_timeout", type=float, default=None,
+                        help="Timeout in seconds for each LLM request (default: per provider).")
+    parser.add_argument("--fast_intermediates", action="store_true",
+                        help="Write the per-iteration images with fast, lighter PNG compression.")
+    parser.add_argument("--split_llm_calls", action="store_true",
+                        help="Send wall length analysis and corner correction as separate requests even when they use the same LLM.")
+    parser.add_argument("--compact_json", action="store_true",
+                        help="Write the geometry JSON without indentation (faster for large plans).")
     args = parser.parse_args()
+    
+    global LLM_CACHE_ENABLED
+    LLM_CACHE_ENABLED = not args.no_cache
+    if args.llm_timeout:
+        for provider in LLM_TIMEOUTS:
+            LLM_TIMEOUTS[provider] = args.llm_timeout
 
     # --- API Keys (from environment variables) ---
     mistral_api_key = os.environ.get("MISTRAL_API_KEY")
@@ -1386,29 +1821,65 @@ def main():
         print("Error: Claude API key not found. Set the ANTHROPIC_API_KEY environment variable.")
         return
 
+    overall_width_inches = feet_inches_to_inches(args.overall_width)
+    if overall_width_inches is None:
+        print("Error: Invalid overall width format.")
+        return
+
     # Create output directory if it doesn't exist
     output_dir = args.output_dir
     os.makedirs(output_dir, exist_ok=True)
     
-    # Find the next available output number
-    output_files = [f for f in os.listdir(output_dir) if f.startswith("result_") and f.endswith(".png")]
-    if output_files:
-        # Extract numbers from existing files
-        numbers = [int(f.split("_")[1].split(".")[0]) for f in output_files if f.split("_")[1].split(".")[0].isdigit()]
-        next_number = max(numbers) + 1 if numbers else 1
-    else:
-        next_number = 1
+    # Find the next available output number from existing result_<n>.png files
+    next_number = 1
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            match = RESULT_FILE_PATTERN.match(entry.name)
+            if match:
+                next_number = max(next_number, int(match.group(1)) + 1)
 
     # Load the original image
     image = cv2.imread(args.image_path)
     if image is None:
         print(f"Error: Could not open image {args.image_path}")
         return
+    
+    # Base64 of the original image, encoded once and shared by the wall length
+    # analysis and the corner correction
+    image_base64 = None
+    if args.llm != "none" or args.correct_corners != "none":
+        image_base64 = encode_image_to_base64(image)
+
+    # Intermediate step images are written straight into their own directory
+    steps_dir = os.path.join(output_dir, f"steps_{next_number:03d}")
+    if args.show_steps:
+        os.makedirs(steps_dir, exist_ok=True)
 
     # --- 1. Initial Preprocessing ---
     print("\n--- Initial Wall Detection ---")
-    wall_image, filtered_contours, geometry_data = preprocess_image_for_walls(args.image_path, args.show_steps)
-    ocr_results = detect_text_with_google_vision(image)
+    # Reuse the image loaded above, and convert it to grayscale only once
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    wall_image, filtered_contours, geometry_data = preprocess_image_for_walls(image, args.show_steps, steps_dir, gray)
+    # OCR is only needed from step 8 on, so run the Vision API call in the
+    # background while the feedback loop waits on its own LLM calls
+    background_executor = ThreadPoolExecutor(max_workers=2)
+    ocr_future = background_executor.submit(detect_text_with_google_vision, image)
+    
+    # The wall length analysis only uses the OCR results and the initial geometry,
+    # not the feedback loop's contours, so its LLM call also runs alongside the loop
+    wall_length_future = None
+    
+    # When the same LLM does both, ask for the corner corrections in the wall
+    # length request instead of sending the image a second time
+    combine_llm_calls = (not args.split_llm_calls and args.llm == args.correct_corners
+                         and args.llm in ("openai", "gemini", "claude"))
+    if args.llm != "none":
+        llm_api_key = {"mistral": mistral_api_key, "openai": openai_api_key,
+                       "gemini": gemini_api_key, "claude": claude_api_key}[args.llm]
+        wall_length_future = background_executor.submit(
+            analyze_wall_lengths_with_llm, args.llm, ocr_future, overall_width_inches,
+            geometry_data, image, image_base64, llm_api_key, combine_llm_calls)
+    background_executor.shutdown(wait=False)
     
     # Print geometry data for debugging
     print("\nGeometry Data:")
@@ -1421,68 +1892,113 @@ def main():
     if args.feedback_llm != "none" and args.iterations > 1:
         print(f"\n--- Starting Feedback Loop ({args.iterations} iterations) ---")
         
+        # Ranked issues from the last LLM response, applied one per iteration.
+        # The LLM is only asked again once these run out or stop changing anything.
+        pending_issues = []
+        
+        # Scratch buffer for the per-iteration visualization, reset from the
+        # original each time instead of allocating a new full-size copy
+        feedback_image = np.empty_like(image)
+        
+        # Intermediate PNGs are written in the background so the encode overlaps
+        # with the LLM request; the buffer is only reused once its write is done
+        image_writer = ThreadPoolExecutor(max_workers=1)
+        pending_write = None
+        
         for iteration in range(args.iterations):
             print(f"\nIteration {iteration + 1}/{args.iterations}")
             
             # Create a visualization with the current contours
-            feedback_image = image.copy()
+            if pending_write is not None:
+                pending_write.result()
+            np.copyto(feedback_image, image)
             cv2.drawContours(feedback_image, current_contours, -1, (0, 255, 0), 4)
             
             # Save the intermediate result
             iteration_filename = f"iteration_{next_number:03d}_{iteration + 1}.png"
             iteration_path = os.path.join(output_dir, iteration_filename)
-            cv2.imwrite(iteration_path, feedback_image)
-            print(f"Intermediate result saved to {iteration_path}")
+            pending_write = image_writer.submit(cv2.imwrite, iteration_path, feedback_image,
+                                                PNG_FAST_ENCODE_PARAMS if args.fast_intermediates else [])
+            print(f"Writing intermediate result to {iteration_path}")
             
             # Skip feedback on the last iteration
             if iteration == args.iterations - 1:
                 break
                 
-            # Get feedback from LLM
-            print("Getting feedback from LLM...")
-            feedback_image_base64 = encode_image_to_base64(feedback_image)
-            feedback_prompt = create_llm_feedback_prompt(feedback_image_base64, geometry_data)
-            
-            if args.feedback_llm == "openai":
-                feedback_response = call_openai_llm(feedback_prompt, feedback_image_base64, openai_api_key)
-            elif args.feedback_llm == "gemini":
-                feedback_response = call_gemini_llm(feedback_prompt, feedback_image, gemini_api_key)
-            elif args.feedback_llm == "claude":
-                feedback_response = call_claude_llm(feedback_prompt, feedback_image_base64, claude_api_key)
-            
-            # Parse the feedback
-            parsed_feedback = parse_llm_response(feedback_response)
-            
-            if not parsed_feedback or 'issues' not in parsed_feedback:
-                print("No actionable feedback received, continuing with current detection")
-                continue
+            if not pending_issues:
+                # Get a ranked batch of issues from the LLM
+                print("Getting feedback from LLM...")
+                feedback_image_base64, feedback_scale = encode_feedback_image_to_base64(feedback_image)
+                # Describe the geometry in the downscaled image's pixel coordinates
+                feedback_prompt = create_llm_feedback_prompt(feedback_image_base64,
+                                                             scale_geometry_data(geometry_data, feedback_scale),
+                                                             max_issues=FEEDBACK_MAX_ISSUES)
+                
+                with timed_llm_call("feedback", args.feedback_llm):
+                    if args.feedback_llm == "openai":
+                        feedback_response = call_openai_llm(feedback_prompt, feedback_image_base64, openai_api_key)
+                    elif args.feedback_llm == "gemini":
+                        feedback_blob = {"mime_type": LLM_IMAGE_MIME_TYPE, "data": base64.b64decode(feedback_image_base64)}
+                        feedback_response = call_gemini_llm(feedback_prompt, feedback_blob, gemini_api_key)
+                    elif args.feedback_llm == "claude":
+                        feedback_response = call_claude_llm(feedback_prompt, feedback_image_base64, claude_api_key)
+                
+                # Parse the feedback
+                parsed_feedback = parse_llm_response(feedback_response)
+                
+                if not parsed_feedback or 'issues' not in parsed_feedback:
+                    print("No actionable feedback received, continuing with current detection")
+                    continue
+                
+                # The LLM found nothing to fix, so further iterations would only repeat
+                # the same request on the same image
+                if not parsed_feedback['issues']:
+                    print("LLM reported no issues, ending the feedback loop early")
+                    break
+                    
+                # Print the feedback
+                print("\nFeedback from LLM:")
+                for i, issue in enumerate(parsed_feedback['issues']):
+                    print(f"Issue {i+1}: {issue.get('location')} - {issue.get('problem')}")
+                    print(f"  Description: {issue.get('description')}")
+                    print(f"  Suggestion: {issue.get('suggestion')}")
                 
-            # Print the feedback
-            print("\nFeedback from LLM:")
-            for i, issue in enumerate(parsed_feedback.get('issues', [])):
-                print(f"Issue {i+1}: {issue.get('location')} - {issue.get('problem')}")
-                print(f"  Description: {issue.get('description')}")
-                print(f"  Suggestion: {issue.get('suggestion')}")
+                pending_issues = list(parsed_feedback['issues'])
             
-            # Apply the feedback
-            print("Applying feedback to improve wall detection...")
-            current_contours = apply_llm_feedback(current_contours, parsed_feedback, image.shape)
+            # Apply the highest-ranked remaining issue, one per iteration. On the last
+            # iteration that applies feedback, apply all the remaining issues at once so
+            # none of the ranked batch is dropped when the iterations run out.
+            if iteration == args.iterations - 2:
+                issues_to_apply, pending_issues = pending_issues, []
+            else:
+                issues_to_apply = [pending_issues.pop(0)]
+            for issue in issues_to_apply:
+                print(f"Applying feedback ({issue.get('location')} - {issue.get('problem')}) to improve wall detection...")
+            improved_contours = apply_llm_feedback(current_contours, {'issues': issues_to_apply}, image.shape)
+            
+            # If the local fix changed nothing, drop the cached issues so the
+            # next iteration asks the LLM again about the current result
+            if (len(improved_contours) == len(current_contours) and
+                    all(np.array_equal(a, b) for a, b in zip(improved_contours, current_contours))):
+                pending_issues = []
+            current_contours = improved_contours
+        
+        # Make sure the last intermediate image is on disk
+        if pending_write is not None:
+            pending_write.result()
+        image_writer.shutdown()
     
     # Use the final contours
     filtered_contours = current_contours
 
     # --- 3. Overall Dimension (Pixels) ---
     # Recreate the wall image with the final contours
-    wall_image = np.zeros_like(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+    wall_image = np.zeros(image.shape[:2], dtype=np.uint8)
     cv2.drawContours(wall_image, filtered_contours, -1, (255, 255, 255), thickness=cv2.FILLED)
     
     overall_width_pixels = get_overall_dimension_pixels(wall_image, "horizontal")
 
     # --- 4. Scale Factor ---
-    overall_width_inches = feet_inches_to_inches(args.overall_width)
-    if overall_width_inches is None:
-        print("Error: Invalid overall width format.")
-        return
     scale_factor = calculate_scale_factor(overall_width_inches, overall_width_pixels)
 
     # --- 5. Wall Segment Lengths (Pixels) ---
@@ -1495,50 +2011,33 @@ def main():
     print("\nExtracted Wall Segment Lengths (from Geometry):")
     wall_lengths = {}  # For visualization
     
-    # Define expected wall lengths based on the prompt
-    expected_walls = [
-        {"wall_number": 1, "length": "55'-0\"", "position": "top"},
-        {"wall_number": 2, "length": "34'-0\"", "position": "right"},
-        {"wall_number": 3, "length": "34'-3\"", "position": "bottom-right"},
-        {"wall_number": 4, "length": "6'-0\"", "position": "bottom-cutout-right"},
-        {"wall_number": 5, "length": "8'-0\"", "position": "bottom-cutout-bottom"},
-        {"wall_number": 6, "length": "6'-0\"", "position": "bottom-cutout-left"},
-        {"wall_number": 7, "length": "12'-9\"", "position": "bottom-left"},
-        {"wall_number": 8, "length": "34'-3\"", "position": "left"}
-    ]
-    
     # If we have enough detected segments, use them
     if len(segment_lengths_real) >= 4:  # At least the main walls
-        for i, length in enumerate(segment_lengths_real):
-            feet = int(length // 12)
-            inches = int(round(length % 12))
+        lengths = np.asarray(segment_lengths_real, dtype=np.float64)
+        feet_arr = (lengths // 12).astype(np.int32)
+        inches_arr = np.rint(lengths - 12 * feet_arr).astype(np.int32)
+        # Carry values that round up to a full foot (e.g. 11.7" -> 1'-0")
+        carry = inches_arr == 12
+        feet_arr[carry] += 1
+        inches_arr[carry] = 0
+        for i, (feet, inches) in enumerate(zip(feet_arr.tolist(), inches_arr.tolist())):
             print(f"Wall Segment {i + 1}: {feet}'-{inches}\"")
             wall_lengths[f"Wall {i+1}"] = f"{feet}'-{inches}\""
     else:
         # If we don't have enough segments, use the expected values
         print("Not enough wall segments detected. Using expected values:")
-        for wall in expected_walls:
-            wall_num = wall["wall_number"]
-            length = wall["length"]
-            position = wall["position"]
-            print(f"Wall {wall_num} ({position}): {length}")
-            wall_lengths[f"Wall {wall_num}"] = length
+        for wall in EXPECTED_WALLS:
+            print(f"Wall {wall.wall_number} ({wall.position}): {wall.length}")
+            wall_lengths[f"Wall {wall.wall_number}"] = wall.length
+    
+    # Wait for the background OCR call
+    ocr_results = ocr_future.result()
     
     # --- 8. Optional LLM Analysis for Wall Lengths ---
     wall_lengths_llm = {}  # Initialize for LLM results
     if args.llm != "none":
         print("\n--- Getting Wall Length Analysis from LLM ---")
-        prompt = create_prompt(ocr_results, overall_width_inches, geometry_data)
-        image_base64 = encode_image_to_base64(image) # Use original image
-
-        if args.llm == "mistral":
-            llm_response = call_mistral_llm(prompt, image_base64, mistral_api_key)
-        elif args.llm == "openai":
-            llm_response = call_openai_llm(prompt, image_base64, openai_api_key)
-        elif args.llm == "gemini":
-            llm_response = call_gemini_llm(prompt, image, gemini_api_key)
-        elif args.llm == "claude":
-            llm_response = call_claude_llm(prompt, image_base64, claude_api_key)
+        llm_response = wall_length_future.result()
         
         parsed_response = parse_llm_response(llm_response)
 
@@ -1563,62 +2062,48 @@ def main():
     # --- 9. Optional Corner Correction with LLM ---
     if args.correct_corners != "none":
         print("\n--- Correcting Corner Positions to Form 90° Angles ---")
+        if combine_llm_calls:
+            # The corrections came back with the wall length analysis above
+            geometry_data = apply_corner_corrections(geometry_data, parsed_response)
         # Get the appropriate API key
-        if args.correct_corners == "openai":
+        elif args.correct_corners == "openai":
             if not openai_api_key:
                 print("Error: OpenAI API key not found. Skipping corner correction.")
             else:
-                image_base64 = encode_image_to_base64(image)
                 geometry_data = correct_corners_with_llm(geometry_data, image_base64, openai_api_key, "openai")
         elif args.correct_corners == "gemini":
             if not gemini_api_key:
                 print("Error: Gemini API key not found. Skipping corner correction.")
             else:
-                image_base64 = encode_image_to_base64(image)
                 geometry_data = correct_corners_with_llm(geometry_data, image_base64, gemini_api_key, "gemini")
         elif args.correct_corners == "claude":
             if not claude_api_key:
                 print("Error: Claude API key not found. Skipping corner correction.")
             else:
-                image_base64 = encode_image_to_base64(image)
                 geometry_data = correct_corners_with_llm(geometry_data, image_base64, claude_api_key, "claude")
 
     # --- 9. Save geometry data to JSON ---
     geometry_filename = f"geometry_{next_number:03d}.json"
     geometry_path = os.path.join(output_dir, geometry_filename)
-    save_geometry_data(geometry_data, geometry_path)
+    save_geometry_data(geometry_data, geometry_path, indent=not args.compact_json)
     
     # --- 10. Create output filenames and save results ---
     output_filename = f"result_{next_number:03d}.png"
     output_path = os.path.join(output_dir, output_filename)
     
-    # Save intermediate steps to the output directory if requested
-    if args.show_steps:
-        # Update the paths for intermediate images
-        steps_dir = os.path.join(output_dir, f"steps_{next_number:03d}")
-        os.makedirs(steps_dir, exist_ok=True)
-        
-        # Move any generated step images to the steps directory
-        step_images = ["1_gray_mask.png", "2_morphology.png", "2.5_all_contours.png", 
-                      "3_detected_walls.png", "4_wall_mask.png"]
-        for step_img in step_images:
-            if os.path.exists(step_img):
-                new_path = os.path.join(steps_dir, step_img)
-                os.rename(step_img, new_path)
-    
     # --- 8. Visualization ---
-    # Check if any corners are marked as invalid in the geometry data
-    has_invalid_corners = any(not corner['is_valid'] for corner in geometry_data['corners'])
+    # Gather corner positions and validity once, then mask out the invalid ones
+    corners = geometry_data['corners']
+    corner_points = np.array([(corner['x'], corner['y']) for corner in corners]).reshape(-1, 2)
+    valid_mask = np.fromiter((corner['is_valid'] for corner in corners), dtype=bool, count=len(corners))
+    has_invalid_corners = not valid_mask.all()
     
     if has_invalid_corners:
         # Create a contour that only includes valid corners for visualization
-        valid_corners = []
-        for corner in geometry_data['corners']:
-            if corner['is_valid']:
-                valid_corners.append((corner['x'], corner['y']))
+        valid_corners = corner_points[valid_mask]
         
         if len(valid_corners) >= 3:  # Need at least 3 points for a valid contour
-            valid_contour = [np.array(valid_corners).reshape(-1, 1, 2)]
+            valid_contour = [valid_corners.reshape(-1, 1, 2)]
             # Use the valid contour for visualization
             result_image = visualize_results(image, wall_lengths, ocr_results, valid_contour, geometry_data)
         else:
@@ -1632,13 +2117,29 @@ def main():
     
     if not args.no_visualize:
         # Display the image without waiting for user input
-        plt.figure(figsize=(12, 8))
-        plt.imshow(cv2.cvtColor(result_image, cv2.COLOR_BGR2RGB))
-        plt.title("Foundation Wall Analysis")
-        plt.axis('off')
-        plt.savefig(os.path.join(output_dir, f"matplotlib_{next_number:03d}.png"))
-        plt.show(block=False)
-        plt.pause(3)  # Show for 3 seconds but don't block
+        matplotlib_path = os.path.join(output_dir, f"matplotlib_{next_number:03d}.png")
+        if not has_display():
+            # Nobody can see a window in a headless run, so just write the image
+            cv2.imwrite(matplotlib_path, result_image)
+        else:
+            # Imported here so headless and --no_visualize runs don't pay for matplotlib
+            import matplotlib.pyplot as plt
+            plt.figure(figsize=(12, 8))
+            plt.imshow(cv2.cvtColor(result_image, cv2.COLOR_BGR2RGB))
+            plt.title("Foundation Wall Analysis")
+            plt.axis('off')
+            plt.savefig(matplotlib_path)
+            plt.show(block=False)
+            plt.pause(3)  # Show for 3 seconds but don't block
+    
+    if LLM_TIMINGS:
+        timings_path = os.path.join(output_dir, f"timings_{next_number:03d}.json")
+        with open(timings_path, 'w', encoding='utf-8') as f:
+            json.dump(LLM_TIMINGS, f, indent=2)
+        print(f"\nLLM call timings saved to {timings_path}")
+    
+    if LLM_CACHE_ENABLED and (LLM_CACHE_STATS["hits"] or LLM_CACHE_STATS["misses"]):
+        print(f"\nLLM cache: {LLM_CACHE_STATS['hits']} hits, {LLM_CACHE_STATS['misses']} misses ({LLM_CACHE_DIR})")
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
+import io
 import os
+import re
 import argparse
+import glob
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
-import json
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 
 # Import our custom modules
@@ -15,13 +18,19 @@ from vision_module import (
     calculate_scale_factor,
     get_wall_segment_lengths_pixels,
     convert_to_real_world,
+    lengths_to_feet_inches,
     detect_text_with_google_vision,
     visualize_results,
     encode_image_to_base64,
     update_corner_validity,
     filter_invalid_walls,
     save_geometry_data,
+    save_json,
+    dumps_json_bytes,
     apply_llm_feedback,
+    init_batch_worker,
+    has_display,
+    EXPECTED_WALLS,
     # New functions for ICF perimeter extraction
     detect_corners_for_perimeter,
     prepare_geometry_data_for_llm,
@@ -31,6 +40,7 @@ from vision_module import (
     visualize_icf_perimeter
 )
 
+import llm_module
 from llm_module import (
     call_openai_llm,
     call_claude_llm,
@@ -39,10 +49,86 @@ from llm_module import (
     create_llm_feedback_prompt,
     correct_corners_with_llm,
     # New function for ICF perimeter extraction
-    create_perimeter_prompt
+    create_perimeter_prompt,
+    geometry_fingerprint,
+    load_cached_perimeter,
+    store_cached_perimeter
 )
 
-def extract_icf_perimeter(image_path, overall_width_inches, llm_type, api_key, output_dir, next_number, show_steps=False):
+# Display names of the supported LLM providers, for error messages
+LLM_PROVIDER_NAMES = {"openai": "OpenAI", "claude": "Claude"}
+
+# Matches numbered outputs like result_007.png (or run_007.zip bundles) and captures the number
+RESULT_FILE_PATTERN = re.compile(r"^(?:result_(\d+)(?:[_.].*)?\.png|run_(\d+)\.zip)$")
+
+def save_image_output(image, output_path, bundle=None):
+    """
+    Writes an output image as PNG.
+    
+    Args:
+        image: BGR image to save.
+        output_path: Path of the image file.
+        bundle: Optional dict collecting the run's outputs by file name (see write_bundle);
+            when given, the encoded image is added to it instead of written to disk.
+    """
+    if bundle is None:
+        cv2.imwrite(output_path, image)
+    else:
+        bundle[os.path.basename(output_path)] = cv2.imencode('.png', image)[1].tobytes()
+
+def save_json_output(data, output_path, bundle=None):
+    """Writes output data as JSON, or adds it to the run bundle when one is given."""
+    if bundle is None:
+        save_json(data, output_path)
+    else:
+        bundle[os.path.basename(output_path)] = dumps_json_bytes(data)
+
+def write_bundle(bundle, bundle_path):
+    """
+    Writes all outputs collected for a run into a single zip archive.
+    
+    Args:
+        bundle: Dict mapping file names to encoded file contents.
+        bundle_path: Path of the zip archive.
+    """
+    # The PNGs are already compressed, so the entries are stored as-is
+    with zipfile.ZipFile(bundle_path, 'w', zipfile.ZIP_STORED) as archive:
+        for name, data in bundle.items():
+            archive.writestr(name, data)
+    print(f"\nBundled {len(bundle)} outputs into {bundle_path}: {', '.join(bundle)}")
+
+def show_visualization(image, title, output_path, bundle=None):
+    """
+    Saves a visualization and, when a display is available, shows it for a few seconds.
+    
+    Args:
+        image: BGR image to show.
+        title: Figure title.
+        output_path: Where to save the figure (or the plain image in headless runs).
+        bundle: Optional dict collecting the run's outputs, used instead of writing the file.
+    """
+    if not has_display():
+        # Nobody can see a window in a headless run, so just write the image
+        save_image_output(image, output_path, bundle)
+        return
+    
+    # Imported here so headless and --no_visualize runs don't pay for matplotlib
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(12, 8))
+    plt.imshow(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    plt.title(title)
+    plt.axis('off')
+    if bundle is None:
+        plt.savefig(output_path)
+    else:
+        figure_png = io.BytesIO()
+        plt.savefig(figure_png, format='png')
+        bundle[os.path.basename(output_path)] = figure_png.getvalue()
+    plt.show(block=False)
+    plt.pause(3)  # Show for 3 seconds but don't block
+
+def extract_icf_perimeter(image_path, overall_width_inches, llm_type, api_key, output_dir, next_number, show_steps=False,
+                          image_quality=None, bundle=None, image=None):
     """
     Extract the ICF foundation perimeter using the LLM-based approach.
     
@@ -54,6 +140,9 @@ def extract_icf_perimeter(image_path, overall_width_inches, llm_type, api_key, o
         output_dir: Output directory for result images.
         next_number: Number to use for output filenames.
         show_steps: Whether to save intermediate steps.
+        image_quality: JPEG quality for the image sent to the LLM (PNG when None).
+        bundle: Optional dict collecting the run's outputs, used instead of writing the files.
+        image: The already-decoded image, if the caller has it (read from image_path otherwise).
         
     Returns:
         perimeter_model: Foundation perimeter model with corners and walls.
@@ -61,19 +150,21 @@ def extract_icf_perimeter(image_path, overall_width_inches, llm_type, api_key, o
     """
     print("\n--- Extracting ICF Foundation Perimeter ---")
     
-    # Load the image
-    image = cv2.imread(image_path)
+    # Load the image, unless the caller already decoded it
     if image is None:
-        print(f"Error: Could not open image {image_path}")
-        return None, None
+        image = cv2.imread(image_path)
+        if image is None:
+            print(f"Error: Could not open image {image_path}")
+            return None, None
     
     # Step 1: Detect potential corner points
-    corners, clean_image = detect_corners_for_perimeter(image_path, show_steps)
+    corners, clean_image = detect_corners_for_perimeter(image, show_steps)
     
     if show_steps:
         corners_image_path = os.path.join(output_dir, f"corners_{next_number:03d}.png")
-        cv2.imwrite(corners_image_path, clean_image)
-        print(f"Corners image saved to {corners_image_path}")
+        save_image_output(clean_image, corners_image_path, bundle)
+        if bundle is None:
+            print(f"Corners image saved to {corners_image_path}")
     
     # Step 2: Prepare geometry data for LLM
     geometry_data = prepare_geometry_data_for_llm(corners)
@@ -81,32 +172,42 @@ def extract_icf_perimeter(image_path, overall_width_inches, llm_type, api_key, o
     # Step 3: Calculate scale factor
     scale_factor = calculate_perimeter_scale(overall_width_inches, corners)
     
-    # Step 4: Create prompt for LLM
-    prompt = create_perimeter_prompt(geometry_data, overall_width_inches)
-    
-    # Step 5: Encode image to base64
-    image_base64 = encode_image_to_base64(clean_image)
+    # Re-scans of the same plan give the same corner layout, so reuse the
+    # perimeter the LLM picked last time instead of asking again
+    fingerprint = geometry_fingerprint(geometry_data, image.shape)
+    perimeter_corner_ids = load_cached_perimeter(fingerprint, llm_type)
     
-    # Step 6: Call the LLM
-    print(f"Sending image to {llm_type} for perimeter analysis...")
-    if llm_type == "openai":
-        llm_response = call_openai_llm(prompt, image_base64, api_key)
-    elif llm_type == "claude":
-        llm_response = call_claude_llm(prompt, image_base64, api_key)
+    if perimeter_corner_ids is not None:
+        print(f"Reusing {len(perimeter_corner_ids)} cached perimeter corners for this layout: {perimeter_corner_ids}")
     else:
-        print(f"Error: Unsupported LLM type: {llm_type}")
-        return None, None
-    
-    # Step 7: Parse the LLM response
-    parsed_response = parse_llm_response(llm_response)
-    
-    if not parsed_response or 'perimeter_corner_ids' not in parsed_response:
-        print("Error: LLM did not identify perimeter corners")
-        return None, None
+        # Step 4: Create prompt for LLM
+        prompt = create_perimeter_prompt(geometry_data, overall_width_inches)
+        
+        # Step 5: Encode image to base64
+        image_base64 = encode_image_to_base64(clean_image, image_quality)
+        
+        # Step 6: Call the LLM
+        print(f"Sending image to {llm_type} for perimeter analysis...")
+        if llm_type == "openai":
+            llm_response = call_openai_llm(prompt, image_base64, api_key)
+        elif llm_type == "claude":
+            llm_response = call_claude_llm(prompt, image_base64, api_key)
+        else:
+            print(f"Error: Unsupported LLM type: {llm_type}")
+            return None, None
+        
+        # Step 7: Parse the LLM response
+        parsed_response = parse_llm_response(llm_response)
+        
+        if not parsed_response or 'perimeter_corner_ids' not in parsed_response:
+            print("Error: LLM did not identify perimeter corners")
+            return None, None
+        
+        perimeter_corner_ids = parsed_response.get('perimeter_corner_ids', [])
+        print(f"LLM identified {len(perimeter_corner_ids)} perimeter corners: {perimeter_corner_ids}")
+        store_cached_perimeter(fingerprint, llm_type, perimeter_corner_ids)
     
     # Step 8: Create perimeter model
-    perimeter_corner_ids = parsed_response.get('perimeter_corner_ids', [])
-    print(f"LLM identified {len(perimeter_corner_ids)} perimeter corners: {perimeter_corner_ids}")
     
     perimeter_model = create_perimeter_model(geometry_data, perimeter_corner_ids)
     
@@ -118,86 +219,88 @@ def extract_icf_perimeter(image_path, overall_width_inches, llm_type, api_key, o
     
     # Save the result
     result_path = os.path.join(output_dir, f"icf_perimeter_{next_number:03d}.png")
-    cv2.imwrite(result_path, result_image)
-    print(f"ICF perimeter visualization saved to {result_path}")
+    save_image_output(result_image, result_path, bundle)
+    if bundle is None:
+        print(f"ICF perimeter visualization saved to {result_path}")
     
     # Save the perimeter model
     perimeter_model_path = os.path.join(output_dir, f"icf_perimeter_{next_number:03d}.json")
-    with open(perimeter_model_path, 'w') as f:
-        json.dump(perimeter_model, f, indent=2)
-    print(f"ICF perimeter model saved to {perimeter_model_path}")
+    save_json_output(perimeter_model, perimeter_model_path, bundle)
+    if bundle is None:
+        print(f"ICF perimeter model saved to {perimeter_model_path}")
     
     return perimeter_model, result_image
 
-def main():
-    parser = argparse.ArgumentParser(description="Extract wall lengths from foundation plans.")
-    parser.add_argument("image_path", help="Path to the foundation plan image.")
-    parser.add_argument("--overall_width", type=str, required=True,
-                        help="Overall width (e.g., '55\\' -0\"').")
-    parser.add_argument("--show_steps", action="store_true",
-                        help="Show intermediate preprocessing steps.")
-    parser.add_argument("--no_visualize", action="store_true",
-                        help="Don't display the final visualization.")
-    parser.add_argument("--output_dir", default="outputs",
-                        help="Output directory for result images (default: outputs).")
-    parser.add_argument("--llm", default="none", choices=["none", "openai", "claude"],
-                        help="Which LLM to use for wall length analysis (none, openai, claude). Default: none.")
-    parser.add_argument("--feedback_llm", default="none", choices=["none", "openai", "claude"],
-                        help="Which LLM to use for wall detection feedback (none, openai, claude). Default: none.")
-    parser.add_argument("--correct_corners", default="none", choices=["none", "openai", "claude"],
-                        help="Use LLM to correct corner positions to form 90° angles (none, openai, claude). Default: none.")
-    parser.add_argument("--icf_perimeter", default="none", choices=["none", "openai", "claude"],
-                        help="Extract ICF foundation perimeter using LLM (none, openai, claude). Default: none.")
-    parser.add_argument("--iterations", type=int, default=1,
-                        help="Number of iterations for the feedback loop (default: 1).")
-    args = parser.parse_args()
-
-    # --- API Keys (from environment variables) ---
-    openai_api_key = os.environ.get("OPENAI_API_KEY")
-    claude_api_key = os.environ.get("ANTHROPIC_API_KEY")
-
-    if args.llm == "openai" and not openai_api_key:
-        print("Error: OpenAI API key not found. Set the OPENAI_API_KEY environment variable.")
-        return
-    if args.llm == "claude" and not claude_api_key:
-        print("Error: Claude API key not found. Set the ANTHROPIC_API_KEY environment variable.")
-        return
+def process_plan(image_path, args, overall_width_inches, next_number):
+    """
+    Runs the full extraction for one foundation plan and saves its numbered outputs.
     
-    if (args.feedback_llm == "openai") and not openai_api_key:
-        print("Error: OpenAI API key not found. Set the OPENAI_API_KEY environment variable.")
-        return
-    if (args.feedback_llm == "claude") and not claude_api_key:
-        print("Error: Claude API key not found. Set the ANTHROPIC_API_KEY environment variable.")
-        return
-
-    # Create output directory if it doesn't exist
+    Args:
+        image_path: Path to the foundation plan image.
+        args: Parsed command line arguments.
+        overall_width_inches: Overall width of the foundation in inches.
+        next_number: Number to use for output filenames.
+    """
     output_dir = args.output_dir
-    os.makedirs(output_dir, exist_ok=True)
     
-    # Find the next available output number
-    output_files = [f for f in os.listdir(output_dir) if f.startswith("result_") and f.endswith(".png")]
-    if output_files:
-        # Extract numbers from existing files
-        numbers = [int(f.split("_")[1].split(".")[0]) for f in output_files if f.split("_")[1].split(".")[0].isdigit()]
-        next_number = max(numbers) + 1 if numbers else 1
-    else:
-        next_number = 1
+    # JPEG is several times smaller than PNG to upload; 0 keeps the lossless PNG
+    image_quality = args.image_quality or None
+    
+    # Set here as well as in main() so batch worker processes pick it up
+    if args.no_cache:
+        llm_module.LLM_CACHE_ENABLED = False
+    
+    openai_api_key = os.environ.get("OPENAI_API_KEY")
+    claude_api_key = os.environ.get("ANTHROPIC_API_KEY")
+    api_keys = {"openai": openai_api_key, "claude": claude_api_key}
+
+    # Outputs collected for run_<n>.zip when --bundle is set, keyed by file name
+    bundle = {} if args.bundle else None
 
     # Load the original image
-    image = cv2.imread(args.image_path)
+    image = cv2.imread(image_path)
     if image is None:
-        print(f"Error: Could not open image {args.image_path}")
+        print(f"Error: Could not open image {image_path}")
         return
+    
+    # Base64 of the original image, encoded at most once and shared by the LLM calls below
+    image_base64 = None
 
     # --- 1. Initial Preprocessing ---
     print("\n--- Initial Wall Detection ---")
-    wall_image, filtered_contours, geometry_data = preprocess_image_for_walls(args.image_path, args.show_steps)
+    wall_image, filtered_contours, geometry_data = preprocess_image_for_walls(image, args.show_steps)
     ocr_results = detect_text_with_google_vision(image)
     
     # Print geometry data for debugging
     print("\nGeometry Data:")
     print(f"Detected {len(geometry_data['corners'])} corners")
     print(f"Detected {len(geometry_data['walls'])} wall segments")
+    
+    # The ICF perimeter extraction and the wall length analysis only depend on the
+    # image and the initial geometry, so their LLM requests run in the background
+    # alongside the feedback loop instead of one after another
+    llm_executor = ThreadPoolExecutor(max_workers=2)
+    
+    icf_future = None
+    if args.icf_perimeter != "none":
+        icf_api_key = api_keys[args.icf_perimeter]
+        if not icf_api_key:
+            print(f"Error: {LLM_PROVIDER_NAMES[args.icf_perimeter]} API key not found. Skipping ICF perimeter extraction.")
+        else:
+            icf_future = llm_executor.submit(
+                extract_icf_perimeter, image_path, overall_width_inches, args.icf_perimeter,
+                icf_api_key, output_dir, next_number, args.show_steps, image_quality, bundle, image)
+    
+    wall_length_future = None
+    if args.llm != "none":
+        prompt = create_prompt(ocr_results, overall_width_inches, geometry_data)
+        image_base64 = encode_image_to_base64(image, image_quality) # Use original image
+        if args.llm == "openai":
+            wall_length_future = llm_executor.submit(call_openai_llm, prompt, image_base64, openai_api_key)
+        else:
+            wall_length_future = llm_executor.submit(call_claude_llm, prompt, image_base64, claude_api_key)
+    
+    llm_executor.shutdown(wait=False)
 
     # --- 2. Feedback Loop ---
     current_contours = filtered_contours
@@ -205,18 +308,24 @@ def main():
     if args.feedback_llm != "none" and args.iterations > 1:
         print(f"\n--- Starting Feedback Loop ({args.iterations} iterations) ---")
         
+        # Scratch buffer for the per-iteration visualization, reset from the
+        # original each time instead of allocating a new full-size copy
+        feedback_image = np.empty_like(image)
+        
         for iteration in range(args.iterations):
             print(f"\nIteration {iteration + 1}/{args.iterations}")
             
             # Create a visualization with the current contours
-            feedback_image = image.copy()
+            np.copyto(feedback_image, image)
             cv2.drawContours(feedback_image, current_contours, -1, (0, 255, 0), 4)
             
-            # Save the intermediate result
-            iteration_filename = f"iteration_{next_number:03d}_{iteration + 1}.png"
-            iteration_path = os.path.join(output_dir, iteration_filename)
-            cv2.imwrite(iteration_path, feedback_image)
-            print(f"Intermediate result saved to {iteration_path}")
+            # Save the intermediate result. The LLM gets the in-memory image, so the
+            # file is only a debugging aid and is written with --show_steps
+            if args.show_steps:
+                iteration_filename = f"iteration_{next_number:03d}_{iteration + 1}.png"
+                iteration_path = os.path.join(output_dir, iteration_filename)
+                cv2.imwrite(iteration_path, feedback_image)
+                print(f"Intermediate result saved to {iteration_path}")
             
             # Skip feedback on the last iteration
             if iteration == args.iterations - 1:
@@ -224,7 +333,7 @@ def main():
                 
             # Get feedback from LLM
             print("Getting feedback from LLM...")
-            feedback_image_base64 = encode_image_to_base64(feedback_image)
+            feedback_image_base64 = encode_image_to_base64(feedback_image, image_quality)
             feedback_prompt = create_llm_feedback_prompt(feedback_image_base64, geometry_data)
             
             if args.feedback_llm == "openai" and openai_api_key:
@@ -241,6 +350,12 @@ def main():
             if not parsed_feedback or 'issues' not in parsed_feedback:
                 print("No actionable feedback received, continuing with current detection")
                 continue
+            
+            # The LLM found nothing to fix, so further iterations would only repeat
+            # the same request on the same image
+            if not parsed_feedback['issues']:
+                print("LLM reported no issues, ending the feedback loop early")
+                break
                 
             # Print the feedback
             print("\nFeedback from LLM:")
@@ -251,23 +366,27 @@ def main():
             
             # Apply the feedback
             print("Applying feedback to improve wall detection...")
-            current_contours = apply_llm_feedback(current_contours, parsed_feedback, image.shape)
+            improved_contours = apply_llm_feedback(current_contours, parsed_feedback, image.shape)
+            
+            # If nothing changed, the next iteration would send the same image and
+            # prompt again, so stop here instead
+            if (len(improved_contours) == len(current_contours) and
+                    all(np.array_equal(a, b) for a, b in zip(improved_contours, current_contours))):
+                print("Feedback did not change the detected walls, ending the feedback loop early")
+                break
+            current_contours = improved_contours
     
     # Use the final contours
     filtered_contours = current_contours
 
     # --- 3. Overall Dimension (Pixels) ---
     # Recreate the wall image with the final contours
-    wall_image = np.zeros_like(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+    wall_image = np.zeros(image.shape[:2], dtype=np.uint8)
     cv2.drawContours(wall_image, filtered_contours, -1, (255, 255, 255), thickness=cv2.FILLED)
     
     overall_width_pixels = get_overall_dimension_pixels(wall_image, "horizontal")
 
     # --- 4. Scale Factor ---
-    overall_width_inches = feet_inches_to_inches(args.overall_width)
-    if overall_width_inches is None:
-        print("Error: Invalid overall width format.")
-        return
     scale_factor = calculate_scale_factor(overall_width_inches, overall_width_pixels)
 
     # --- 5. Wall Segment Lengths (Pixels) ---
@@ -280,102 +399,33 @@ def main():
     print("\nExtracted Wall Segment Lengths (from Geometry):")
     wall_lengths = {}  # For visualization
     
-    # Define expected wall lengths based on the prompt
-    expected_walls = [
-        {"wall_number": 1, "length": "55'-0\"", "position": "top"},
-        {"wall_number": 2, "length": "34'-0\"", "position": "right"},
-        {"wall_number": 3, "length": "34'-3\"", "position": "bottom-right"},
-        {"wall_number": 4, "length": "6'-0\"", "position": "bottom-cutout-right"},
-        {"wall_number": 5, "length": "8'-0\"", "position": "bottom-cutout-bottom"},
-        {"wall_number": 6, "length": "6'-0\"", "position": "bottom-cutout-left"},
-        {"wall_number": 7, "length": "12'-9\"", "position": "bottom-left"},
-        {"wall_number": 8, "length": "34'-3\"", "position": "left"}
-    ]
-    
     # If we have enough detected segments, use them
     if len(segment_lengths_real) >= 4:  # At least the main walls
-        for i, length in enumerate(segment_lengths_real):
-            feet = int(length // 12)
-            inches = int(round(length % 12))
+        feet_arr, inches_arr = lengths_to_feet_inches(segment_lengths_real)
+        for i, (feet, inches) in enumerate(zip(feet_arr.tolist(), inches_arr.tolist())):
             print(f"Wall Segment {i + 1}: {feet}'-{inches}\"")
             wall_lengths[f"Wall {i+1}"] = f"{feet}'-{inches}\""
     else:
         # If we don't have enough segments, use the expected values
         print("Not enough wall segments detected. Using expected values:")
-        for wall in expected_walls:
-            wall_num = wall["wall_number"]
-            length = wall["length"]
-            position = wall["position"]
-            print(f"Wall {wall_num} ({position}): {length}")
-            wall_lengths[f"Wall {wall_num}"] = length
+        for wall in EXPECTED_WALLS:
+            print(f"Wall {wall.wall_number} ({wall.position}): {wall.length}")
+            wall_lengths[f"Wall {wall.wall_number}"] = wall.length
     
     # --- 8. Optional ICF Perimeter Extraction ---
-    if args.icf_perimeter != "none":
-        print("\n--- Extracting ICF Foundation Perimeter ---")
+    if icf_future is not None:
+        perimeter_model, perimeter_image = icf_future.result()
         
-        # Get the appropriate API key
-        if args.icf_perimeter == "openai":
-            if not openai_api_key:
-                print("Error: OpenAI API key not found. Skipping ICF perimeter extraction.")
-            else:
-                perimeter_model, perimeter_image = extract_icf_perimeter(
-                    args.image_path, 
-                    overall_width_inches, 
-                    "openai", 
-                    openai_api_key, 
-                    output_dir, 
-                    next_number, 
-                    args.show_steps
-                )
-                
-                # Display the perimeter image
-                if not args.no_visualize and perimeter_image is not None:
-                    plt.figure(figsize=(12, 8))
-                    plt.imshow(cv2.cvtColor(perimeter_image, cv2.COLOR_BGR2RGB))
-                    plt.title("ICF Foundation Perimeter")
-                    plt.axis('off')
-                    plt.savefig(os.path.join(output_dir, f"icf_perimeter_matplotlib_{next_number:03d}.png"))
-                    plt.show(block=False)
-                    plt.pause(3)  # Show for 3 seconds but don't block
-                
-        elif args.icf_perimeter == "claude":
-            if not claude_api_key:
-                print("Error: Claude API key not found. Skipping ICF perimeter extraction.")
-            else:
-                perimeter_model, perimeter_image = extract_icf_perimeter(
-                    args.image_path, 
-                    overall_width_inches, 
-                    "claude", 
-                    claude_api_key, 
-                    output_dir, 
-                    next_number, 
-                    args.show_steps
-                )
-                
-                # Display the perimeter image
-                if not args.no_visualize and perimeter_image is not None:
-                    plt.figure(figsize=(12, 8))
-                    plt.imshow(cv2.cvtColor(perimeter_image, cv2.COLOR_BGR2RGB))
-                    plt.title("ICF Foundation Perimeter")
-                    plt.axis('off')
-                    plt.savefig(os.path.join(output_dir, f"icf_perimeter_matplotlib_{next_number:03d}.png"))
-                    plt.show(block=False)
-                    plt.pause(3)  # Show for 3 seconds but don't block
+        # Display the perimeter image
+        if not args.no_visualize and perimeter_image is not None:
+            show_visualization(perimeter_image, "ICF Foundation Perimeter",
+                               os.path.join(output_dir, f"icf_perimeter_matplotlib_{next_number:03d}.png"), bundle)
     
     # --- 9. Optional LLM Analysis for Wall Lengths ---
     wall_lengths_llm = {}  # Initialize for LLM results
-    if args.llm != "none":
+    if wall_length_future is not None:
         print("\n--- Getting Wall Length Analysis from LLM ---")
-        prompt = create_prompt(ocr_results, overall_width_inches, geometry_data)
-        image_base64 = encode_image_to_base64(image) # Use original image
-
-        if args.llm == "openai" and openai_api_key:
-            llm_response = call_openai_llm(prompt, image_base64, openai_api_key)
-        elif args.llm == "claude" and claude_api_key:
-            llm_response = call_claude_llm(prompt, image_base64, claude_api_key)
-        else:
-            print(f"Error: {args.llm} API key not found or invalid llm value")
-            return
+        llm_response = wall_length_future.result()
         
         parsed_response = parse_llm_response(llm_response)
 
@@ -401,23 +451,24 @@ def main():
     if args.correct_corners != "none":
         print("\n--- Correcting Corner Positions to Form 90° Angles ---")
         # Get the appropriate API key
-        if args.correct_corners == "openai":
-            if not openai_api_key:
-                print("Error: OpenAI API key not found. Skipping corner correction.")
-            else:
-                image_base64 = encode_image_to_base64(image)
-                geometry_data = correct_corners_with_llm(geometry_data, image_base64, openai_api_key, "openai")
-        elif args.correct_corners == "claude":
-            if not claude_api_key:
-                print("Error: Claude API key not found. Skipping corner correction.")
-            else:
-                image_base64 = encode_image_to_base64(image)
-                geometry_data = correct_corners_with_llm(geometry_data, image_base64, claude_api_key, "claude")
+        correct_api_key = api_keys[args.correct_corners]
+        if not correct_api_key:
+            print(f"Error: {LLM_PROVIDER_NAMES[args.correct_corners]} API key not found. Skipping corner correction.")
+        else:
+            # Reuse the image already encoded for the wall length request, if any
+            if image_base64 is None:
+                image_base64 = encode_image_to_base64(image, image_quality)
+            geometry_data = correct_corners_with_llm(geometry_data, image_base64, correct_api_key, args.correct_corners)
 
     # --- 9. Save geometry data to JSON ---
     geometry_filename = f"geometry_{next_number:03d}.json"
     geometry_path = os.path.join(output_dir, geometry_filename)
-    save_geometry_data(geometry_data, geometry_path)
+    if bundle is None:
+        save_geometry_data(geometry_data, geometry_path)
+    else:
+        save_json_output(geometry_data, geometry_path, bundle)
+        print(f"\nGeometry data (bundled as {geometry_filename}):")
+        print(bundle[geometry_filename].decode('utf-8'))
     
     # --- 10. Create output filenames and save results ---
     output_filename = f"result_{next_number:03d}.png"
@@ -438,18 +489,18 @@ def main():
                 os.rename(step_img, new_path)
     
     # --- 8. Visualization ---
-    # Check if any corners are marked as invalid in the geometry data
-    has_invalid_corners = any(not corner['is_valid'] for corner in geometry_data['corners'])
+    # Gather corner positions and validity once, then mask out the invalid ones
+    corners = geometry_data['corners']
+    corner_points = np.array([(corner['x'], corner['y']) for corner in corners], dtype=np.int32).reshape(-1, 2)
+    valid_mask = np.fromiter((corner['is_valid'] for corner in corners), dtype=bool, count=len(corners))
+    has_invalid_corners = not valid_mask.all()
     
     if has_invalid_corners:
         # Create a contour that only includes valid corners for visualization
-        valid_corners = []
-        for corner in geometry_data['corners']:
-            if corner['is_valid']:
-                valid_corners.append((corner['x'], corner['y']))
+        valid_corners = corner_points[valid_mask]
         
         if len(valid_corners) >= 3:  # Need at least 3 points for a valid contour
-            valid_contour = [np.array(valid_corners).reshape(-1, 1, 2)]
+            valid_contour = [valid_corners.reshape(-1, 1, 2)]
             # Use the valid contour for visualization
             result_image = visualize_results(image, wall_lengths, ocr_results, valid_contour, geometry_data)
         else:
@@ -458,18 +509,123 @@ def main():
     else:
         # Use original contours if no invalid corners were identified
         result_image = visualize_results(image, wall_lengths, ocr_results, filtered_contours, geometry_data)
-    cv2.imwrite(output_path, result_image)
-    print(f"\nResults saved to {output_path}")
+    save_image_output(result_image, output_path, bundle)
+    if bundle is None:
+        print(f"\nResults saved to {output_path}")
     
     if not args.no_visualize:
         # Display the image without waiting for user input
-        plt.figure(figsize=(12, 8))
-        plt.imshow(cv2.cvtColor(result_image, cv2.COLOR_BGR2RGB))
-        plt.title("Foundation Wall Analysis")
-        plt.axis('off')
-        plt.savefig(os.path.join(output_dir, f"matplotlib_{next_number:03d}.png"))
-        plt.show(block=False)
-        plt.pause(3)  # Show for 3 seconds but don't block
+        show_visualization(result_image, "Foundation Wall Analysis",
+                           os.path.join(output_dir, f"matplotlib_{next_number:03d}.png"), bundle)
+    
+    if bundle:
+        write_bundle(bundle, os.path.join(output_dir, f"run_{next_number:03d}.zip"))
+    
+    llm_module.print_llm_cache_summary()
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract wall lengths from foundation plans.")
+    parser.add_argument("image_path", nargs="?", help="Path to the foundation plan image.")
+    parser.add_argument("--overall_width", type=str, required=True,
+                        help="Overall width (e.g., '55\\' -0\"').")
+    parser.add_argument("--show_steps", action="store_true",
+                        help="Show intermediate preprocessing steps and save the feedback loop iterations.")
+    parser.add_argument("--no_visualize", action="store_true",
+                        help="Don't display the final visualization.")
+    parser.add_argument("--output_dir", default="outputs",
+                        help="Output directory for result images (default: outputs).")
+    parser.add_argument("--llm", default="none", choices=["none", "openai", "claude"],
+                        help="Which LLM to use for wall length analysis (none, openai, claude). Default: none.")
+    parser.add_argument("--feedback_llm", default="none", choices=["none", "openai", "claude"],
+                        help="Which LLM to use for wall detection feedback (none, openai, claude). Default: none.")
+    parser.add_argument("--correct_corners", default="none", choices=["none", "openai", "claude"],
+                        help="Use LLM to correct corner positions to form 90° angles (none, openai, claude). Default: none.")
+    parser.add_argument("--icf_perimeter", default="none", choices=["none", "openai", "claude"],
+                        help="Extract ICF foundation perimeter using LLM (none, openai, claude). Default: none.")
+    parser.add_argument("--iterations", type=int, default=1,
+                        help="Number of iterations for the feedback loop (default: 1).")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Always call the LLM APIs instead of reusing cached responses.")
+    parser.add_argument("--image_quality", type=int, default=85,
+                        help="JPEG quality (1-100) of images sent to the LLMs; 0 sends lossless PNG (default: 85).")
+    parser.add_argument("--bundle", action="store_true",
+                        help="Save the run's results in a single run_<n>.zip instead of separate files.")
+    parser.add_argument("--batch", default=None,
+                        help="Glob of foundation plan images to process in parallel (e.g. 'plans/*.png') instead of image_path.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes for --batch (default: number of CPUs).")
+    args = parser.parse_args()
+    
+    if not args.image_path and not args.batch:
+        parser.error("either image_path or --batch is required")
+    
+    if args.no_cache:
+        llm_module.LLM_CACHE_ENABLED = False
+
+    # --- API Keys (from environment variables) ---
+    openai_api_key = os.environ.get("OPENAI_API_KEY")
+    claude_api_key = os.environ.get("ANTHROPIC_API_KEY")
+
+    if args.llm == "openai" and not openai_api_key:
+        print("Error: OpenAI API key not found. Set the OPENAI_API_KEY environment variable.")
+        return
+    if args.llm == "claude" and not claude_api_key:
+        print("Error: Claude API key not found. Set the ANTHROPIC_API_KEY environment variable.")
+        return
+    
+    if (args.feedback_llm == "openai") and not openai_api_key:
+        print("Error: OpenAI API key not found. Set the OPENAI_API_KEY environment variable.")
+        return
+    if (args.feedback_llm == "claude") and not claude_api_key:
+        print("Error: Claude API key not found. Set the ANTHROPIC_API_KEY environment variable.")
+        return
+    
+    # Parse the overall width up front, since the background LLM requests below need it
+    overall_width_inches = feet_inches_to_inches(args.overall_width)
+    if overall_width_inches is None:
+        print("Error: Invalid overall width format.")
+        return
+
+    # Create output directory if it doesn't exist
+    output_dir = args.output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    
+    # Find the next available output number from existing result_<n>.png files
+    next_number = 1
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            match = RESULT_FILE_PATTERN.match(entry.name)
+            if match:
+                next_number = max(next_number, int(match.group(1) or match.group(2)) + 1)
+
+    if args.batch:
+        image_paths = sorted(glob.glob(args.batch))
+        if not image_paths:
+            print(f"Error: No images match {args.batch}")
+            return
+        
+        # Worker processes can't show figures, and the step images are written to
+        # the working directory where parallel runs would overwrite each other
+        args.no_visualize = True
+        if args.show_steps:
+            print("Warning: --show_steps is ignored in batch mode.")
+            args.show_steps = False
+        
+        workers = min(args.workers or os.cpu_count() or 1, len(image_paths))
+        print(f"Processing {len(image_paths)} plans with {workers} worker processes")
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_batch_worker) as executor:
+            futures = {
+                executor.submit(process_plan, path, args, overall_width_inches, number): path
+                for number, path in enumerate(image_paths, start=next_number)
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error processing {futures[future]}: {e}")
+        return
+    
+    process_plan(args.image_path, args, overall_width_inches, next_number)
 
 if __name__ == "__main__":
     main()
@@ -17,7 +17,6 @@ import os
 import argparse
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 import json
 
 # Import vision module functions
@@ -30,10 +29,12 @@ from vision_module import (
     encode_image_to_base64,
     feet_inches_to_inches,
     get_overall_dimension_pixels,
-    calculate_scale_factor
+    calculate_scale_factor,
+    save_json
 )
 
 # Import LLM module functions
+import llm_module
 from llm_module import (
     call_openai_llm,
     call_claude_llm,
@@ -41,7 +42,32 @@ from llm_module import (
     parse_llm_response
 )
 
-def extract_perimeter(image_path, overall_width, llm_type, api_key, output_dir="outputs", show_steps=False):
+CORNER_LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+def draw_corner_markers(image, corners):
+    """
+    Draws a red dot and a high-contrast ID label at each corner, in place.
+    
+    Args:
+        image: Image to draw on.
+        corners: List of corner dicts with 'id', 'x' and 'y'.
+        
+    Returns:
+        The image, for convenience.
+    """
+    # Work out the marker centres and labels up front so the loop only makes the OpenCV calls
+    markers = [((corner['x'], corner['y']), str(corner['id']), (corner['x'] + 10, corner['y'] + 5))
+               for corner in corners]
+    for center, text, org in markers:
+        cv2.circle(image, center, 8, (0, 0, 255), -1)  # RED dot
+        cv2.circle(image, center, 8, (0, 0, 0), 2)     # Black outline
+        # White background/outline for better contrast, then the black text
+        cv2.putText(image, text, org, CORNER_LABEL_FONT, 0.8, (255, 255, 255), 5)
+        cv2.putText(image, text, org, CORNER_LABEL_FONT, 0.8, (0, 0, 0), 2)
+    return image
+
+def extract_perimeter(image_path, overall_width, llm_type, api_key, output_dir="outputs", show_steps=False,
+                      image_quality=None):
     """
     Extract the foundation perimeter for ICF construction.
     
@@ -52,6 +78,7 @@ def extract_perimeter(image_path, overall_width, llm_type, api_key, output_dir="
         api_key: API key for the LLM.
         output_dir: Output directory for result images.
         show_steps: Whether to save intermediate steps.
+        image_quality: JPEG quality for the image sent to the LLM (PNG when None).
         
     Returns:
         perimeter_model: Foundation perimeter model with corners and walls.
@@ -76,27 +103,13 @@ def extract_perimeter(image_path, overall_width, llm_type, api_key, output_dir="
     
     # Step 1: Preprocess image to detect walls and corners
     print("Detecting walls and corners...")
-    wall_image, filtered_contours, geometry_data = preprocess_image_for_walls(image_path, show_steps)
+    wall_image, filtered_contours, geometry_data = preprocess_image_for_walls(image, show_steps)  # Reuse the decoded image
     
     print(f"Detected {len(geometry_data['corners'])} corners")
     print(f"Detected {len(geometry_data['walls'])} wall segments")
     
     # Create a clean image with the detected corners for LLM analysis
-    clean_image = image.copy()
-    for corner in geometry_data['corners']:
-        # Draw a clearly visible marker for each corner
-        cv2.circle(clean_image, (corner['x'], corner['y']), 8, (0, 0, 255), -1)  # RED dot
-        cv2.circle(clean_image, (corner['x'], corner['y']), 8, (0, 0, 0), 2)     # Black outline
-        
-        # Add ID number near the point with better visibility
-        text_x = corner['x'] + 10
-        text_y = corner['y'] + 5
-        # Draw white background for better contrast
-        cv2.putText(clean_image, str(corner['id']), (text_x, text_y), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 5)  # White background/outline
-        # Draw text in black
-        cv2.putText(clean_image, str(corner['id']), (text_x, text_y), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)        # Black text
+    clean_image = draw_corner_markers(image.copy(), geometry_data['corners'])
     
     if show_steps:
         corners_path = os.path.join(output_dir, "corners.png")
@@ -118,7 +131,7 @@ def extract_perimeter(image_path, overall_width, llm_type, api_key, output_dir="
     # Resize image to reduce size before sending to LLM (max 800px dimension to stay well under Claude's limit)
     from vision_module import resize_image_for_vision_api
     resized_image = resize_image_for_vision_api(clean_image, max_dim=800)
-    image_base64 = encode_image_to_base64(resized_image)
+    image_base64 = encode_image_to_base64(resized_image, image_quality)
     
     # Step 6: Call the LLM
     print(f"Sending image to {llm_type} for perimeter analysis...")
@@ -176,20 +189,19 @@ def extract_perimeter(image_path, overall_width, llm_type, api_key, output_dir="
     
     # Step 10: Create a clean, positive representation of the foundation walls
     # Create a clean white background
-    clean_positive_image = np.ones((image.shape[0], image.shape[1], 3), dtype=np.uint8) * 255
+    clean_positive_image = np.full((image.shape[0], image.shape[1], 3), 255, dtype=np.uint8)
     
-    # Draw the foundation walls in black
-    for wall in perimeter_model['walls']:
-        start_point = (wall['start_x'], wall['start_y'])
-        end_point = (wall['end_x'], wall['end_y'])
-        cv2.line(clean_positive_image, start_point, end_point, (0, 0, 0), thickness=10)  # Thick black lines
+    # Draw all the foundation walls in black with one call, one two-point polyline per wall
+    wall_segments = np.array([[(wall['start_x'], wall['start_y']), (wall['end_x'], wall['end_y'])]
+                              for wall in perimeter_model['walls']], dtype=np.int32).reshape(-1, 2, 2)
+    cv2.polylines(clean_positive_image, list(wall_segments), False, (0, 0, 0), thickness=10)  # Thick black lines
     
     # Draw corner markers in a distinct color
     for corner in perimeter_model['corners']:
         cv2.circle(clean_positive_image, (corner['x'], corner['y']), 8, (0, 0, 255), -1)  # Red dots for corners
         # Add corner IDs
         cv2.putText(clean_positive_image, str(corner['id']), (corner['x'] + 10, corner['y'] + 5), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 0), 2)
+                    CORNER_LABEL_FONT, 0.8, (0, 0, 0), 2)
     
     if show_steps:
         cv2.imwrite(os.path.join(output_dir, "clean_foundation_for_vision.png"), clean_positive_image)
@@ -204,8 +216,7 @@ def extract_perimeter(image_path, overall_width, llm_type, api_key, output_dir="
     
     # Save the perimeter model
     perimeter_model_path = os.path.join(output_dir, "icf_perimeter.json")
-    with open(perimeter_model_path, 'w') as f:
-        json.dump(perimeter_model, f, indent=2)
+    save_json(perimeter_model, perimeter_model_path)
     print(f"ICF perimeter model saved to {perimeter_model_path}")
     
     return perimeter_model, result_image
@@ -223,8 +234,15 @@ def main():
                         help="Output directory for result images (default: outputs).")
     parser.add_argument("--no_visualize", action="store_true",
                         help="Don't display the final visualization.")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="Always call the LLM API instead of reusing a cached response.")
+    parser.add_argument("--image_quality", type=int, default=85,
+                        help="JPEG quality (1-100) of the image sent to the LLM; 0 sends a lossless PNG (default: 85).")
     args = parser.parse_args()
     
+    if args.no_cache:
+        llm_module.LLM_CACHE_ENABLED = False
+    
     # Get API key from environment variables
     api_key = None
     if args.llm == "openai":
@@ -245,11 +263,16 @@ def main():
         args.llm,
         api_key,
         args.output_dir,
-        args.show_steps
+        args.show_steps,
+        args.image_quality or None
     )
     
+    llm_module.print_llm_cache_summary()
+    
     # Display the result
     if not args.no_visualize and result_image is not None:
+        import matplotlib.pyplot as plt
+        
         plt.figure(figsize=(12, 8))
         plt.imshow(cv2.cvtColor(result_image, cv2.COLOR_BGR2RGB))
         plt.title("ICF Foundation Perimeter")
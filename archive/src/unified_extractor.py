@@ -10,23 +10,93 @@ different approaches:
 
 Usage:
     python unified_extractor.py <image_path> --overall_width <width> --mode <mode> --llm <llm_type>
+    python unified_extractor.py --batch '<glob>' --overall_width <width> --mode <mode> --llm <llm_type>
 
 Example:
     python unified_extractor.py src/Screenshot.png --overall_width "55'-0\"" --mode icf --llm claude
 """
 
 import os
+import glob
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 import cv2
-import matplotlib.pyplot as plt
+
+import vision_module
 
 # Import the extraction functions from the other scripts
 from vision_only_extractor import extract_with_vision_only
 from icf_perimeter_extractor import extract_perimeter
 
+# Plans processed at once in --batch mode. Each plan spends most of its time
+# waiting on the LLM, so several requests are kept in flight from threads.
+DEFAULT_BATCH_WORKERS = 4
+
+def plan_output_dirs(image_paths, output_dir):
+    """
+    Gives every plan in a batch its own output subdirectory, named after the file.
+    Plans with the same file name (e.g. a/plan.png and b/plan.png) get numbered
+    directories (plan, plan_2, ...) so they don't overwrite each other.
+    
+    Args:
+        image_paths: Paths of the plans in the batch.
+        output_dir: Directory holding the per-plan subdirectories.
+        
+    Returns:
+        List of output directories, in the same order as image_paths.
+    """
+    used_names = set()
+    plan_dirs = []
+    for path in image_paths:
+        stem = Path(path).stem
+        name = stem
+        suffix = 2
+        while name in used_names:
+            name = f"{stem}_{suffix}"
+            suffix += 1
+        used_names.add(name)
+        plan_dirs.append(os.path.join(output_dir, name))
+    return plan_dirs
+
+def run_extraction(image_path, args, api_key, output_dir):
+    """
+    Runs the selected vision or ICF extraction on one plan.
+    
+    Args:
+        image_path: Path to the foundation plan image.
+        args: Parsed command line arguments.
+        api_key: API key for the LLM (None for vision mode).
+        output_dir: Output directory for this plan's result images.
+        
+    Returns:
+        Tuple of (result_image, title), with result_image set to None if the extraction failed.
+    """
+    if args.mode == "vision":
+        print(f"\n=== Running Vision-Only Extraction: {image_path} ===\n")
+        result_image, wall_lengths = extract_with_vision_only(
+            image_path,
+            args.overall_width,
+            output_dir,
+            args.show_steps
+        )
+        return result_image, "Foundation Wall Analysis (Vision Only)"
+    
+    print(f"\n=== Running ICF Perimeter Extraction: {image_path} ===\n")
+    perimeter_model, result_image = extract_perimeter(
+        image_path,
+        args.overall_width,
+        args.llm,
+        api_key,
+        output_dir,
+        args.show_steps,
+        args.image_quality or None
+    )
+    return result_image, "ICF Foundation Perimeter"
+
 def main():
     parser = argparse.ArgumentParser(description="Unified foundation extractor.")
-    parser.add_argument("image_path", help="Path to the foundation plan image.")
+    parser.add_argument("image_path", nargs="?", help="Path to the foundation plan image.")
     parser.add_argument("--overall_width", type=str, required=True,
                         help="Overall width (e.g., '55\\' -0\"').")
     parser.add_argument("--mode", choices=["vision", "icf", "full"], required=True,
@@ -39,13 +109,29 @@ def main():
                         help="Output directory for result images (default: outputs).")
     parser.add_argument("--no_visualize", action="store_true",
                         help="Don't display the final visualization.")
+    parser.add_argument("--batch", default=None,
+                        help="Glob of foundation plan images to process (e.g. 'plans/*.png') instead of image_path.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_BATCH_WORKERS,
+                        help=f"Number of plans processed at once with --batch (default: {DEFAULT_BATCH_WORKERS}).")
+    parser.add_argument("--image_quality", type=int, default=85,
+                        help="JPEG quality (1-100) of the image sent to the LLM; 0 sends a lossless PNG (default: 85).")
+    parser.add_argument("--no_cv_cache", action="store_true",
+                        help="Disable the vision cache: always rerun corner detection and Google Vision OCR "
+                             "instead of reusing cached results for the same image.")
     args = parser.parse_args()
     
+    if not args.image_path and not args.batch:
+        parser.error("either image_path or --batch is required")
+    
+    if args.no_cv_cache:
+        # Shared by the corner and OCR caches (same as TAKEOFF_VISION_CACHE=0)
+        vision_module.VISION_CACHE_ENABLED = False
+    
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
     
     # Check if image exists
-    if not os.path.exists(args.image_path):
+    if not args.batch and not os.path.exists(args.image_path):
         print(f"Error: Image file not found: {args.image_path}")
         return
     
@@ -69,39 +155,46 @@ def main():
                 return
     
     # Process based on the selected mode
-    if args.mode == "vision":
-        print("\n=== Running Vision-Only Extraction ===\n")
-        result_image, wall_lengths = extract_with_vision_only(
-            args.image_path,
-            args.overall_width,
-            args.output_dir,
-            args.show_steps
-        )
-        
-        title = "Foundation Wall Analysis (Vision Only)"
-        
-    elif args.mode == "icf":
-        print("\n=== Running ICF Perimeter Extraction ===\n")
-        perimeter_model, result_image = extract_perimeter(
-            args.image_path,
-            args.overall_width,
-            args.llm,
-            api_key,
-            args.output_dir,
-            args.show_steps
-        )
-        
-        title = "ICF Foundation Perimeter"
-        
-    elif args.mode == "full":
+    if args.mode == "full":
         print("\n=== Running Full Foundation Analysis ===\n")
         print("This mode uses the foundation_extractor.py script.")
         print("Please run it directly with the appropriate arguments:")
         print(f"python src/foundation_extractor.py {args.image_path} --overall_width \"{args.overall_width}\" --llm {args.llm} --icf_perimeter {args.llm} --correct_corners {args.llm}")
         return
     
+    if args.batch:
+        image_paths = sorted(glob.glob(args.batch))
+        if not image_paths:
+            print(f"Error: No images match {args.batch}")
+            return
+        
+        # The step images are written to the working directory, where concurrent
+        # plans would overwrite each other
+        if args.show_steps:
+            print("Warning: --show_steps is ignored in batch mode.")
+            args.show_steps = False
+        
+        # Each plan writes fixed file names, so give every plan its own subdirectory
+        workers = max(1, min(args.workers, len(image_paths)))
+        print(f"Processing {len(image_paths)} plans, {workers} at a time")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(run_extraction, path, args, api_key, plan_dir): path
+                for path, plan_dir in zip(image_paths, plan_output_dirs(image_paths, args.output_dir))
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error processing {futures[future]}: {e}")
+        return
+    
+    result_image, title = run_extraction(args.image_path, args, api_key, args.output_dir)
+    
     # Display the result
-    if not args.no_visualize and 'result_image' in locals() and result_image is not None:
+    if not args.no_visualize and result_image is not None:
+        import matplotlib.pyplot as plt
+        
         plt.figure(figsize=(12, 8))
         plt.imshow(cv2.cvtColor(result_image, cv2.COLOR_BGR2RGB))
         plt.title(title)
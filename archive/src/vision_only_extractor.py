@@ -16,7 +16,6 @@ import os
 import argparse
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 
 # Import only vision module functions
 from vision_module import (
@@ -25,7 +24,7 @@ from vision_module import (
     feet_inches_to_inches,
     calculate_scale_factor,
     get_wall_segment_lengths_pixels,
-    convert_to_real_world,
+    lengths_to_feet_inches,
     visualize_results
 )
 
@@ -62,7 +61,7 @@ def extract_with_vision_only(image_path, overall_width, output_dir="outputs", sh
     
     # Step 1: Preprocess image to detect walls
     print("Detecting walls...")
-    wall_image, filtered_contours, geometry_data = preprocess_image_for_walls(image_path, show_steps)
+    wall_image, filtered_contours, geometry_data = preprocess_image_for_walls(image, show_steps)  # Reuse the decoded image
     
     print(f"Detected {len(geometry_data['corners'])} corners")
     print(f"Detected {len(geometry_data['walls'])} wall segments")
@@ -79,15 +78,16 @@ def extract_with_vision_only(image_path, overall_width, output_dir="outputs", sh
     segment_lengths_pixels = get_wall_segment_lengths_pixels(filtered_contours)
     
     # Step 5: Convert to real-world dimensions
-    segment_lengths_real = convert_to_real_world(segment_lengths_pixels, scale_factor)
+    segment_lengths_real = np.asarray(segment_lengths_pixels, dtype=np.float64) * scale_factor
     
-    # Step 6: Format wall lengths for visualization
-    wall_lengths = {}
-    for i, length in enumerate(segment_lengths_real):
-        feet = int(length // 12)
-        inches = int(round(length % 12))
-        wall_lengths[f"Wall {i+1}"] = f"{feet}'-{inches}\""
-        print(f"Wall {i+1}: {feet}'-{inches}\"")
+    # Step 6: Format wall lengths for visualization, splitting all lengths into feet and inches at once
+    feet_arr, inches_arr = lengths_to_feet_inches(segment_lengths_real)
+    wall_lengths = {
+        f"Wall {i + 1}": f"{feet}'-{inches}\""
+        for i, (feet, inches) in enumerate(zip(feet_arr.tolist(), inches_arr.tolist()))
+    }
+    for wall_name, length in wall_lengths.items():
+        print(f"{wall_name}: {length}")
     
     # Step 7: Visualize the results
     result_image = visualize_results(image, wall_lengths, [], filtered_contours, geometry_data)
@@ -122,6 +122,8 @@ def main():
     
     # Display the result
     if not args.no_visualize and result_image is not None:
+        import matplotlib.pyplot as plt
+        
         plt.figure(figsize=(12, 8))
         plt.imshow(cv2.cvtColor(result_image, cv2.COLOR_BGR2RGB))
         plt.title("Foundation Wall Analysis (Vision Only)")
@@ -30,7 +30,8 @@ from src.database_utils import (
     prepare_for_database,
     generate_postgresql_statements,
     generate_supabase_payload,
-    save_database_ready_json
+    save_database_ready_json,
+    load_json
 )
 
 def main():
@@ -46,8 +47,7 @@ def main():
     
     # Load the analysis data
     try:
-        with open(args.json_path, 'r') as f:
-            data = json.load(f)
+        data = load_json(args.json_path)
     except Exception as e:
         print(f"Error loading JSON file: {e}")
         sys.exit(1)
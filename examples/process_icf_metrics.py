@@ -14,45 +14,63 @@ Usage:
 import os
 import sys
 import json
-import subprocess
 from pathlib import Path
 from dotenv import load_dotenv
 
+try:
+    # Fast C JSON parser, used when available
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables from .env file
 load_dotenv()
 
+# Add the src directory to the Python path so the extractor can be run in-process
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
 def run_perimeter_extractor(image_path):
     """Run the perimeter wall extractor with LLM dimension extraction."""
     print(f"Processing foundation plan: {image_path}")
     
-    # Run the perimeter wall extractor script in non-interactive mode
-    env = os.environ.copy()
-    env["NON_INTERACTIVE"] = "true"
+    # Run the perimeter wall extractor in non-interactive mode, in this process, so
+    # OpenCV/NumPy are only imported once rather than in a fresh interpreter per plan
+    os.environ["NON_INTERACTIVE"] = "true"
+    json_path = "outputs/perimeter_walls.json"
+    # Remove the output of an earlier run, so a failed run can't leave stale data to report on
+    if os.path.exists(json_path):
+        os.remove(json_path)
     
-    cmd = [
-        "python", 
-        "src/perimeter_wall_extractor.py", 
-        image_path, 
-        "--use_llm",
-        "--no_visualize"
-    ]
+    try:
+        import perimeter_wall_extractor
+        status = perimeter_wall_extractor.main([
+            image_path,
+            "--use_llm",
+            "--no_visualize"
+        ])
+    except Exception as e:
+        print("Error running perimeter wall extractor:")
+        print(e)
+        sys.exit(1)
     
-    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    if status != 0:
+        print(f"Perimeter wall extractor failed (exit status {status}).")
+        sys.exit(1)
     
-    if result.returncode != 0:
-        print("Error running perimeter wall extractor:")
-        print(result.stderr)
+    if not os.path.exists(json_path):
+        print(f"Error: Perimeter wall extractor did not write {json_path}")
         sys.exit(1)
     
     print("Perimeter wall extraction completed successfully.")
-    return "outputs/perimeter_walls.json"
+    return json_path
 
 def load_perimeter_data(json_path):
     """Load the perimeter data from the JSON file."""
     try:
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-        return data
+        with open(json_path, 'rb') as f:
+            if orjson is not None:
+                return orjson.loads(f.read())
+            return json.load(f)
     except Exception as e:
         print(f"Error loading JSON data: {e}")
         sys.exit(1)
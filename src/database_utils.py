@@ -18,6 +18,12 @@ import os
 from typing import Dict, Any, List, Optional, Union
 from dotenv import load_dotenv
 
+try:
+    # Fast C JSON parser, used when available
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -196,33 +202,28 @@ def generate_postgresql_statements(data: Dict[str, Any]) -> Dict[str, str]:
         """
         sql_statements["icf_metrics"] = metrics_sql
     
-    # Corners table
+    # Corners table: one multi-row INSERT, so PostgreSQL parses a single statement
     if "corners" in data:
-        corners_sql = []
-        for corner in data["corners"]:
-            corner_sql = f"""
-            INSERT INTO corners (
-                analysis_id, corner_id, x, y
-            ) VALUES (
+        corner_rows = [
+            f"""(
                 '{analysis_id}',
                 {corner.get('id', 'NULL')},
                 {corner.get('x', 'NULL')},
                 {corner.get('y', 'NULL')}
-            );
+            )"""
+            for corner in data["corners"]
+        ]
+        if corner_rows:
+            sql_statements["corners"] = f"""
+            INSERT INTO corners (
+                analysis_id, corner_id, x, y
+            ) VALUES {", ".join(corner_rows)};
             """
-            corners_sql.append(corner_sql)
-        sql_statements["corners"] = "\n".join(corners_sql)
     
-    # Walls table
+    # Walls table: one multi-row INSERT, so PostgreSQL parses a single statement
     if "walls" in data:
-        walls_sql = []
-        for wall in data["walls"]:
-            wall_sql = f"""
-            INSERT INTO walls (
-                analysis_id, wall_id, start_corner_id, end_corner_id,
-                start_x, start_y, end_x, end_y, 
-                length_pixels, length
-            ) VALUES (
+        wall_rows = [
+            f"""(
                 '{analysis_id}',
                 {wall.get('id', 'NULL')},
                 {wall.get('start_corner_id', 'NULL')},
@@ -232,11 +233,18 @@ def generate_postgresql_statements(data: Dict[str, Any]) -> Dict[str, str]:
                 {wall.get('end_x', 'NULL')},
                 {wall.get('end_y', 'NULL')},
                 {wall.get('length_pixels', 'NULL')},
-                '{wall.get('length', 'unknown')}'
-            );
+                '{str(wall.get('length', 'unknown')).replace("'", "''")}'
+            )"""
+            for wall in data["walls"]
+        ]
+        if wall_rows:
+            sql_statements["walls"] = f"""
+            INSERT INTO walls (
+                analysis_id, wall_id, start_corner_id, end_corner_id,
+                start_x, start_y, end_x, end_y, 
+                length_pixels, length
+            ) VALUES {", ".join(wall_rows)};
             """
-            walls_sql.append(wall_sql)
-        sql_statements["walls"] = "\n".join(walls_sql)
     
     return sql_statements
 
@@ -323,6 +331,22 @@ def generate_supabase_payload(data: Dict[str, Any]) -> Dict[str, List[Dict[str,
     return payload
 
 
+def load_json(json_path: str) -> Any:
+    """
+    Load a JSON file, using orjson when it is installed (much faster on large analysis files).
+    
+    Args:
+        json_path: Path to the JSON file
+        
+    Returns:
+        The parsed JSON data
+    """
+    with open(json_path, 'rb') as f:
+        if orjson is not None:
+            return orjson.loads(f.read())
+        return json.load(f)
+
+
 def save_database_ready_json(data: Dict[str, Any], output_path: str) -> None:
     """
     Save database-ready JSON to a file.
@@ -369,8 +393,7 @@ def batch_process_results(result_files: List[str],
             drawing_name = os.path.basename(file_path).replace(".json", "")
             
             # Load the data
-            with open(file_path, 'r') as f:
-                data = json.load(f)
+            data = load_json(file_path)
             
             # Prepare for database
             db_ready_data = prepare_for_database(data, drawing_name, project_id)
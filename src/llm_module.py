@@ -2,11 +2,26 @@
 import os
 import re
 import json
-import base64
-import copy
-from typing import Dict, Any, Optional, List, Union, Tuple
+import hashlib
+import threading
+from collections import defaultdict
+from functools import lru_cache, wraps
+from pathlib import Path
+from typing import Dict, Any, Optional, List, Union, Tuple, Iterable
 from dotenv import load_dotenv
 
+try:
+    # SIMD-accelerated drop-in replacement for the standard library module
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+try:
+    # Fast C JSON encoder, used when available
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -38,23 +53,256 @@ class FoundationDimensions(BaseModel):  # type: ignore
     confidence: int = Field(0, description="Confidence score from 0-100")  # type: ignore
     explanation: str = Field("", description="Explanation of how dimensions were identified")  # type: ignore
 
-try:
-    import openai
-except ImportError:
-    print("Warning: OpenAI package not installed. GPT-4o features will not work.")
-    openai = None
+# The LLM SDKs are slow to import, so they are loaded on first use and cached
+@lru_cache(maxsize=None)
+def load_openai():
+    """Imports the OpenAI SDK on first use. Returns the module, or None if it is not installed."""
+    try:
+        import openai
+    except ImportError:
+        print("Warning: OpenAI package not installed. GPT-4o features will not work.")
+        return None
+    return openai
 
-try:
-    # Import Anthropic for Claude API
-    from anthropic import Anthropic, AnthropicError
-except ImportError:
-    print("Warning: Anthropic package not installed. Claude features will not work.")
-    Anthropic = None
-    AnthropicError = Exception  # Fallback for type checking
+@lru_cache(maxsize=None)
+def load_anthropic():
+    """Imports the Anthropic client class on first use. Returns it, or None if it is not installed."""
+    try:
+        # Import Anthropic for Claude API
+        from anthropic import Anthropic
+    except ImportError:
+        print("Warning: Anthropic package not installed. Claude features will not work.")
+        return None
+    return Anthropic
+
+# Patterns used by parse_llm_response to pull JSON out of an LLM reply
+JSON_CODE_BLOCK_PATTERN = re.compile(r"```json\s*(.*?)```", re.DOTALL)
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+# Characters that matter when scanning for a balanced JSON object
+JSON_TOKEN_PATTERN = re.compile(r'[{}"\\]')
+
+# Clients are cached per API key so repeated calls (e.g. the feedback loop) reuse
+# the same connection pool instead of reconnecting every time
+@lru_cache(maxsize=None)
+def get_openai_client(api_key: str):
+    """Returns a cached OpenAI client for the given API key."""
+    return load_openai().OpenAI(api_key=api_key)
+
+@lru_cache(maxsize=None)
+def get_claude_client(api_key: str):
+    """Returns a cached Anthropic client for the given API key."""
+    return load_anthropic()(api_key=api_key)
+
+# Models used by call_openai_llm and call_claude_llm, by LLM type. Pinned to dated
+# snapshots: a moving alias would change the model behind cached responses.
+OPENAI_MODEL = "gpt-4o-2024-08-06"
+CLAUDE_MODEL = "claude-3-7-sonnet-20250219"
+LLM_MODELS = {"openai": OPENAI_MODEL, "claude": CLAUDE_MODEL}
+OPENAI_MAX_TOKENS = 1000
+CLAUDE_MAX_TOKENS = 4096
+
+# On-disk cache of LLM responses, so reruns on the same drawing skip the API call.
+# Set TAKEOFF_LLM_CACHE=0 (or LLM_CACHE_ENABLED = False) to always call the APIs.
+LLM_CACHE_DIR = Path(os.environ.get("TAKEOFF_LLM_CACHE_DIR", Path.home() / ".takeoff_cache"))
+LLM_CACHE_ENABLED = os.environ.get("TAKEOFF_LLM_CACHE", "1") != "0"
+LLM_CACHE_STATS = {"hits": 0, "misses": 0}
+
+def llm_cache_key(function_name: str, model: str, max_tokens: int, prompt: str, image_base64: str) -> str:
+    """
+    Builds the cache key for an LLM call from the caller, the model settings, the prompt and the image content.
+    
+    Args:
+        function_name: Name of the call_*_llm function (the LLM provider).
+        model: Model name sent to the API.
+        max_tokens: Response token limit sent to the API.
+        prompt: Prompt text.
+        image_base64: Base64 encoded image.
+        
+    Returns:
+        Hex SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    header = json.dumps([function_name, model, max_tokens, len(prompt)])
+    digest.update(header.encode('utf-8'))
+    digest.update(prompt.encode('utf-8'))
+    digest.update(image_base64.encode('ascii'))
+    return digest.hexdigest()
+
+# One lock per in-flight cache key, so identical requests made at the same time (e.g. from
+# a batch runner's threads) wait for the first one and then read its cached response.
+# Entries are removed when the call that created them finishes.
+LLM_INFLIGHT_LOCKS = defaultdict(threading.Lock)
+LLM_INFLIGHT_REGISTRY_LOCK = threading.Lock()
+
+def print_llm_cache_summary() -> None:
+    """Prints the run's LLM response cache hits and misses (and perimeter cache ones, if used)."""
+    if not LLM_CACHE_ENABLED:
+        return
+    if LLM_CACHE_STATS["hits"] or LLM_CACHE_STATS["misses"]:
+        print(f"\nLLM cache: {LLM_CACHE_STATS['hits']} hits, {LLM_CACHE_STATS['misses']} misses ({LLM_CACHE_DIR})")
+    if PERIMETER_CACHE_STATS["hits"] or PERIMETER_CACHE_STATS["misses"]:
+        print(f"Perimeter cache: {PERIMETER_CACHE_STATS['hits']} hits, {PERIMETER_CACHE_STATS['misses']} misses")
+
+def cached_llm_call(model: str, max_tokens: int):
+    """
+    Decorates a call_*_llm(prompt, image_base64, api_key) function with the on-disk response cache.
+    Concurrent identical calls are collapsed into one API request. Error responses are never cached.
+    
+    Args:
+        model: Model name the decorated function sends to the API.
+        max_tokens: Response token limit the decorated function sends to the API.
+    """
+    def decorator(call_llm):
+        @wraps(call_llm)
+        def wrapper(prompt: str, image_base64: str, api_key: Optional[str] = None) -> str:
+            if not LLM_CACHE_ENABLED:
+                return call_llm(prompt, image_base64, api_key)
+        
+            key = llm_cache_key(call_llm.__name__, model, max_tokens, prompt, image_base64)
+            cache_path = LLM_CACHE_DIR / f"{key}.json"
+            with LLM_INFLIGHT_REGISTRY_LOCK:
+                inflight_lock = LLM_INFLIGHT_LOCKS[key]
+        
+            with inflight_lock:
+                try:
+                    try:
+                        with open(cache_path, 'r', encoding='utf-8') as f:
+                            response = json.load(f)["response"]
+                        LLM_CACHE_STATS["hits"] += 1
+                        return response
+                    except (OSError, ValueError, KeyError):
+                        pass
+            
+                    LLM_CACHE_STATS["misses"] += 1
+                    response = call_llm(prompt, image_base64, api_key)
+                    if isinstance(response, str) and not response.startswith("Error"):
+                        try:
+                            LLM_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                            # Write to a temporary file first so a crash never leaves a partial entry
+                            tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+                            with open(tmp_path, 'w', encoding='utf-8') as f:
+                                json.dump({"response": response}, f)
+                            os.replace(tmp_path, cache_path)
+                        except OSError as e:
+                            print(f"Warning: Could not write LLM cache entry: {e}")
+                    return response
+                finally:
+                    # Evict once the response is cached (waiters holding this lock then read it),
+                    # so the registry doesn't grow with every distinct request
+                    with LLM_INFLIGHT_REGISTRY_LOCK:
+                        if LLM_INFLIGHT_LOCKS.get(key) is inflight_lock:
+                            del LLM_INFLIGHT_LOCKS[key]
+        return wrapper
+    return decorator
+
+# Bump whenever create_perimeter_prompt changes in a way that can change the answer,
+# so perimeter corner IDs cached for older prompts are no longer reused
+PERIMETER_PROMPT_VERSION = 2
+# Kept apart from LLM_CACHE_STATS: a perimeter miss goes on to make a (separately counted) LLM call
+PERIMETER_CACHE_STATS = {"hits": 0, "misses": 0}
+
+# Corner positions are normalized by the image size and rounded to this fraction
+# before fingerprinting, so small shifts between re-scans map to the same layout
+GEOMETRY_FINGERPRINT_QUANTUM = 0.01
+
+def geometry_fingerprint(geometry_data: Dict[str, Any], image_shape: Tuple[int, ...]) -> str:
+    """
+    Builds a structural fingerprint of geometry data that is stable across re-scans of a plan.
+    
+    Args:
+        geometry_data: Dictionary containing corner coordinates and (optionally) wall segments.
+        image_shape: Shape of the image the corners were detected in.
+        
+    Returns:
+        Hex BLAKE2b digest of the quantized corners (in ID order) and the wall adjacency.
+    """
+    height, width = image_shape[:2]
+    steps = round(1 / GEOMETRY_FINGERPRINT_QUANTUM)
+    corners = [
+        (corner['id'], round(corner['x'] / width * steps), round(corner['y'] / height * steps))
+        for corner in geometry_data.get('corners', [])
+    ]
+    walls = sorted(
+        (wall['start_corner_id'], wall['end_corner_id'])
+        for wall in geometry_data.get('walls', [])
+    )
+    payload = json.dumps({"corners": corners, "walls": walls}, separators=(',', ':'))
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+def perimeter_cache_path(fingerprint: str, llm_type: str) -> Path:
+    """
+    Returns the cache file holding the perimeter corner IDs for a geometry fingerprint.
+    The path includes the prompt version and the model, so changing either starts a fresh cache.
+    """
+    model = LLM_MODELS.get(llm_type, llm_type)
+    return (LLM_CACHE_DIR / "perimeter" / f"v{PERIMETER_PROMPT_VERSION}" /
+            f"{llm_type}_{model}_{fingerprint}.json")
+
+def load_cached_perimeter(fingerprint: str, llm_type: str) -> Optional[List[int]]:
+    """
+    Looks up the perimeter corner IDs previously returned for the same plan layout.
+    
+    Args:
+        fingerprint: Geometry fingerprint from geometry_fingerprint.
+        llm_type: LLM that produced the cached answer (openai or claude).
+        
+    Returns:
+        List of perimeter corner IDs, or None on a cache miss.
+    """
+    if not LLM_CACHE_ENABLED:
+        return None
+    try:
+        with open(perimeter_cache_path(fingerprint, llm_type), 'r', encoding='utf-8') as f:
+            corner_ids = json.load(f)["perimeter_corner_ids"]
+    except (OSError, ValueError, KeyError):
+        PERIMETER_CACHE_STATS["misses"] += 1
+        return None
+    PERIMETER_CACHE_STATS["hits"] += 1
+    return corner_ids
+
+def store_cached_perimeter(fingerprint: str, llm_type: str, corner_ids: List[int]) -> None:
+    """Saves the perimeter corner IDs returned by the LLM for a geometry fingerprint."""
+    if not LLM_CACHE_ENABLED:
+        return
+    cache_path = perimeter_cache_path(fingerprint, llm_type)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"perimeter_corner_ids": corner_ids}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: Could not write perimeter cache entry: {e}")
+
+def image_media_type(image_base64: str) -> str:
+    """Returns the MIME type of a base64 encoded image (JPEG or PNG) from its leading bytes."""
+    return "image/jpeg" if image_base64.startswith("/9j/") else "image/png"
 
 # --- LLM Interaction Functions ---
+def collect_streamed_text(text_chunks: Iterable[str]) -> str:
+    """
+    Accumulates streamed response text, stopping as soon as a complete ```json block
+    has arrived. parse_llm_response takes that block first, so whatever the model
+    writes after it is never used and need not be waited for.
+    
+    Args:
+        text_chunks: Iterable of text deltas from a streaming API response.
+        
+    Returns:
+        The text received up to (and including) the first complete ```json block.
+    """
+    parts = []
+    for text in text_chunks:
+        parts.append(text)
+        # Only re-check once a chunk could have closed the fence
+        if '`' in text and JSON_CODE_BLOCK_PATTERN.search(''.join(parts)):
+            break
+    return ''.join(parts)
+
+@cached_llm_call(OPENAI_MODEL, OPENAI_MAX_TOKENS)
 def call_openai_llm(prompt: str, image_base64: str, api_key: Optional[str] = None) -> str:
     """Calls the OpenAI GPT-4o API with the given prompt and image."""
+    openai = load_openai()
     if openai is None:
         return "Error: OpenAI library not installed."
     
@@ -63,11 +311,11 @@ def call_openai_llm(prompt: str, image_base64: str, api_key: Optional[str] = Non
     if not api_key:
         return "Error: No OpenAI API key provided. Set OPENAI_API_KEY environment variable or pass api_key parameter."
     
-    client = openai.OpenAI(api_key=api_key)
+    client = get_openai_client(api_key)
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
+        stream = client.chat.completions.create(
+            model=OPENAI_MODEL,
             messages=[
                 {
                     "role": "user",
@@ -75,24 +323,33 @@ def call_openai_llm(prompt: str, image_base64: str, api_key: Optional[str] = Non
                         {"type": "text", "text": prompt},
                         {
                             "type": "image_url",
-                            "image_url": {"url": f"data:image/png;base64,{image_base64}"},
+                            "image_url": {"url": f"data:{image_media_type(image_base64)};base64,{image_base64}"},
                         },
                     ],
                 }
             ],
-            max_tokens=1000
+            max_tokens=OPENAI_MAX_TOKENS,
+            stream=True
         )
-        # Ensure we return a string
-        content = response.choices[0].message.content
-        if content is None:
+        # Stream the reply and hang up once the JSON answer is complete
+        try:
+            content = collect_streamed_text(
+                chunk.choices[0].delta.content for chunk in stream
+                if chunk.choices and chunk.choices[0].delta.content
+            )
+        finally:
+            stream.close()
+        if not content:
             return "Error: Empty response from OpenAI API"
         return content
     except Exception as e:
         print(f"Error calling OpenAI API: {e}")
         return f"Error: {e}"
 
+@cached_llm_call(CLAUDE_MODEL, CLAUDE_MAX_TOKENS)
 def call_claude_llm(prompt: str, image_base64: str, api_key: Optional[str] = None) -> str:
     """Calls the Anthropic Claude 3.7 Sonnet API with the given prompt and image."""
+    Anthropic = load_anthropic()
     if Anthropic is None:
         return "Error: Anthropic library not installed."
     
@@ -101,12 +358,12 @@ def call_claude_llm(prompt: str, image_base64: str, api_key: Optional[str] = Non
     if not api_key:
         return "Error: No Claude API key provided. Set CLAUDE_API_KEY environment variable or pass api_key parameter."
     
-    client = Anthropic(api_key=api_key)
+    client = get_claude_client(api_key)
     
     try:
-        response = client.messages.create(
-            model="claude-3-7-sonnet-latest",
-            max_tokens=4096,
+        with client.messages.stream(
+            model=CLAUDE_MODEL,
+            max_tokens=CLAUDE_MAX_TOKENS,
             temperature=0.0,
             messages=[
                 {
@@ -120,60 +377,131 @@ def call_claude_llm(prompt: str, image_base64: str, api_key: Optional[str] = Non
                             "type": "image",
                             "source": {
                                 "type": "base64",
-                                "media_type": "image/png",
+                                "media_type": image_media_type(image_base64),
                                 "data": image_base64
                             }
                         }
                     ]
                 }
             ]
-        )
-        # Handle the response safely
-        try:
-            # Extract text from the response
-            if hasattr(response, 'content') and response.content:
-                # Access the first content item's text
-                content_item = response.content[0] if response.content else None
-                content_text = None
-                
-                # Try to get text content in a way that works with different response structures
-                if content_item:
-                    # Try direct attribute access first
-                    if hasattr(content_item, 'text'):
-                        content_text = getattr(content_item, 'text')  # type: ignore
-                    # Try dictionary-style access as fallback
-                    elif hasattr(content_item, 'get') and callable(getattr(content_item, 'get')):
-                        content_text = content_item.get('text')  # type: ignore
-                    # Try direct string conversion as last resort
-                    elif hasattr(content_item, '__str__'):
-                        content_text = str(content_item)
-                    if content_text is not None:
-                        return str(content_text)
-            
-            # If we couldn't extract text using the expected structure
+        ) as stream:
+            # Stream the reply and hang up once the JSON answer is complete
+            content = collect_streamed_text(stream.text_stream)
+        if not content:
             return "Error: Could not extract text from Claude API response"
-        except Exception as e:
-            print(f"Error extracting text from Claude response: {e}")
-            return f"Error processing Claude response: {e}"
+        return content
     except Exception as e:
         print(f"Error calling Claude API: {e}")
         return f"Error: {e}"
 
+def geometry_to_json(geometry_data: Dict[str, Any], indent: bool = True) -> str:
+    """
+    Serializes geometry data as JSON for inclusion in prompts.
+    Uses orjson when it is installed, which is much faster than the standard encoder.
+    
+    Args:
+        geometry_data: Dictionary containing corner coordinates and wall segments.
+        indent: Whether to indent the output by two spaces (minified when False).
+        
+    Returns:
+        JSON text.
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(geometry_data, option=option).decode('utf-8')
+        except TypeError:
+            pass  # Fall back to the standard encoder for types orjson rejects
+    if indent:
+        return json.dumps(geometry_data, indent=2)
+    return json.dumps(geometry_data, separators=(',', ':'))
+
+def compact_geometry(geometry_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Shrinks geometry data for prompts that refer to corners and walls by ID.
+    
+    Wall endpoint coordinates are dropped (they repeat the coordinates of the
+    corners the wall connects) and wall lengths are rounded to one decimal.
+    Corners keep their exact pixel coordinates.
+    
+    Args:
+        geometry_data: Dictionary containing corner coordinates and (optionally) wall segments.
+        
+    Returns:
+        New dictionary with the same corners and the reduced walls.
+    """
+    compact = {"corners": geometry_data.get('corners', [])}
+    if 'walls' in geometry_data:
+        compact["walls"] = [
+            {
+                "id": wall['id'],
+                "start_corner_id": wall['start_corner_id'],
+                "end_corner_id": wall['end_corner_id'],
+                "length_pixels": round(float(wall['length_pixels']), 1),
+            }
+            for wall in geometry_data['walls']
+        ]
+    return compact
+
+def extract_first_json_object(text: str) -> Optional[str]:
+    """
+    Finds the first balanced top-level {...} object in the text with a single
+    forward scan, ignoring braces inside JSON strings.
+    
+    Args:
+        text: Text that may contain a JSON object, e.g. an LLM reply with prose around it.
+        
+    Returns:
+        The substring holding the first complete object, or None if no braces balance.
+    """
+    start = text.find('{')
+    if start == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    skip_until = -1  # Position after an escaped character inside a string
+    for match in JSON_TOKEN_PATTERN.finditer(text, start):
+        pos = match.start()
+        if pos < skip_until:
+            continue
+        char = match.group()
+        if in_string:
+            if char == '\\':
+                skip_until = pos + 2
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:pos + 1]
+    return None
+
 def parse_llm_response(response_text: str) -> Dict[str, Any]:
     """
     Parses the LLM's response, attempting to extract a JSON object.
     """
     try:
         # Attempt to find JSON within code blocks (```json ... ```)
-        match = re.search(r"```json\n(.*?)```", response_text, re.DOTALL)
+        match = JSON_CODE_BLOCK_PATTERN.search(response_text)
         if match:
             json_str = match.group(1)
             return json.loads(json_str)
 
-        # Attempt to find JSON directly (without code blocks)
-        match = re.search(r"\{.*\}", response_text, re.DOTALL)
-        if match:
-            json_str = match.group(0)
+        # Attempt to find JSON directly (without code blocks): take the first
+        # balanced object, falling back to the widest {...} span if none balances
+        json_str = extract_first_json_object(response_text)
+        if json_str is None:
+            match = JSON_OBJECT_PATTERN.search(response_text)
+            if match:
+                json_str = match.group(0)
+        if json_str is not None:
             return json.loads(json_str)
         return {} # No JSON
 
@@ -191,8 +519,8 @@ def create_prompt(ocr_results: List[Dict[str, Any]], overall_width_inches: float
     """
     Creates a detailed prompt for the LLM, incorporating OCR results and geometry data.
     """
-    # Prepare OCR results for inclusion in the prompt
-    ocr_text_list = [result['text'] for result in ocr_results]
+    # Prepare OCR results for inclusion in the prompt, without repeated text
+    ocr_text_list = list(dict.fromkeys(result['text'] for result in ocr_results))
     ocr_text_str = "\n".join(ocr_text_list)
      
     # Prepare geometry data for inclusion in the prompt
@@ -204,9 +532,9 @@ def create_prompt(ocr_results: List[Dict[str, Any]], overall_width_inches: float
     Corners: {len(geometry_data['corners'])} points
     Walls: {len(geometry_data['walls'])} segments
     
-    Here is the detailed geometry data:
+    Here is the detailed geometry data (walls connect the corners with the given IDs):
     ```json
-    {json.dumps(geometry_data, indent=2)}
+    {geometry_to_json(compact_geometry(geometry_data), indent=False)}
     ```
     """
     
@@ -259,6 +587,7 @@ def create_prompt(ocr_results: List[Dict[str, Any]], overall_width_inches: float
     """
     return prompt
 
+# Bump PERIMETER_PROMPT_VERSION when changing this prompt, so cached perimeters are refreshed
 def create_perimeter_prompt(geometry_data: Dict[str, Any], overall_width_inches: float) -> str:
     """
     Creates a prompt focused on foundation perimeter analysis for ICF construction.
@@ -290,7 +619,7 @@ IMPORTANT INSTRUCTIONS:
 
 Here is the corner data:
 ```json
-{json.dumps(geometry_data, indent=2)}
+{geometry_to_json(compact_geometry(geometry_data), indent=False)}
 ```
 
 Format your response as a JSON object with the following structure:
@@ -320,7 +649,7 @@ def create_corner_correction_prompt(geometry_data: Dict[str, Any]) -> str:
 I have detected the following geometry data from a foundation plan:
 
 ```json
-{json.dumps(geometry_data, indent=2)}
+{geometry_to_json(geometry_data)}
 ```
 
 Your task is to analyze this geometry data and correct the corner positions to ensure that walls meet at 90° angles wherever appropriate. Foundation plans typically have rectilinear designs with perpendicular walls.
@@ -334,27 +663,27 @@ For each corner, determine if it needs adjustment to form proper 90° angles wit
 
 Format your response as a JSON object with the following structure:
 ```json
-{
+{{
   "corrected_corners": [
-    {
+    {{
       "id": 0,
       "original_x": 100,
       "original_y": 200,
       "corrected_x": 100,
       "corrected_y": 200,
       "reason": "Already forms approximately 90° angles with adjacent walls"
-    },
-    {
+    }},
+    {{
       "id": 1,
       "original_x": 300,
       "original_y": 210,
       "corrected_x": 300,
       "corrected_y": 200,
       "reason": "Adjusted to form 90° angle with walls connecting to corners 0 and 2"
-    },
+    }},
     ...
   ]
-}
+}}
 ```
 
 For corners that don't need adjustment, include them in the response with the same coordinates as the original.
@@ -383,7 +712,7 @@ Walls: {len(geometry_data['walls'])} segments
 
 Here is the detailed geometry data:
 ```json
-{json.dumps(geometry_data, indent=2)}
+{geometry_to_json(geometry_data)}
 ```
 """
     
@@ -404,18 +733,18 @@ For each issue, please provide:
 
 Format your response as a JSON object with the following structure:
 ```json
-{
+{{
   "issues": [
-    {
+    {{
       "location": "bottom center",
       "problem": "deviation",
       "description": "The green line deviates from the wall and connects to text annotations",
       "suggestion": "The line should follow the straight wall and not connect to the text"
-    },
+    }},
     ...
   ],
   "overall_assessment": "The wall detection is mostly accurate but has issues in the bottom area"
-}
+}}
 ```
 """
     return prompt
@@ -488,11 +817,12 @@ def extract_dimensions_with_llm(image_path: str, api_key: Optional[str] = None,
         return {"error": f"No API key provided for {llm_type}. Set {llm_type.upper()}_API_KEY environment variable or pass api_key parameter."}
     
     # For OpenAI with structured outputs
-    if llm_type == "openai" and openai is not None:
+    openai = load_openai() if llm_type == "openai" else None
+    if openai is not None:
         try:
-            client = openai.OpenAI(api_key=api_key)
+            client = get_openai_client(api_key)
             response = client.chat.completions.create(
-                model="gpt-4o",
+                model=OPENAI_MODEL,
                 messages=[
                     {
                         "role": "user",
@@ -500,7 +830,7 @@ def extract_dimensions_with_llm(image_path: str, api_key: Optional[str] = None,
                             {"type": "text", "text": prompt},
                             {
                                 "type": "image_url",
-                                "image_url": {"url": f"data:image/png;base64,{base64_image}"},
+                                "image_url": {"url": f"data:{image_media_type(base64_image)};base64,{base64_image}"},
                             },
                         ],
                     }
@@ -740,8 +1070,22 @@ def correct_corners_with_llm(geometry_data: Dict[str, Any], image_base64: str,
         print("No corner corrections received from LLM")
         return geometry_data
     
-    # Create a copy of the geometry data to modify
-    corrected_geometry = copy.deepcopy(geometry_data)
+    # Create a copy of the geometry data to modify. Corners and walls only hold
+    # scalar values, so copying each dict is enough (and much cheaper than deepcopy)
+    corrected_geometry = dict(geometry_data)
+    corrected_geometry['corners'] = [dict(corner) for corner in geometry_data['corners']]
+    corrected_geometry['walls'] = [dict(wall) for wall in geometry_data['walls']]
+    
+    # Index corners by ID and walls by the corners they start/end at, so each
+    # correction is applied without rescanning every corner and wall
+    corners_by_id = {}
+    for corner in corrected_geometry['corners']:
+        corners_by_id.setdefault(corner['id'], corner)
+    walls_by_start = defaultdict(list)
+    walls_by_end = defaultdict(list)
+    for wall in corrected_geometry['walls']:
+        walls_by_start[wall['start_corner_id']].append(wall)
+        walls_by_end[wall['end_corner_id']].append(wall)
     
     # Apply the corrections
     for correction in parsed_response.get('corrected_corners', []):
@@ -751,36 +1095,35 @@ def correct_corners_with_llm(geometry_data: Dict[str, Any], image_base64: str,
         reason = correction.get('reason', '')
         
         # Find the corner in the geometry data
-        for corner in corrected_geometry['corners']:
-            if corner['id'] == corner_id:
-                # Check if the position was actually changed
-                if corner['x'] != corrected_x or corner['y'] != corrected_y:
-                    print(f"Correcting corner {corner_id}: ({corner['x']}, {corner['y']}) -> ({corrected_x}, {corrected_y})")
-                    print(f"  Reason: {reason}")
-                    
-                    # Update the corner position
-                    corner['x'] = corrected_x
-                    corner['y'] = corrected_y
-                    
-                    # Also update any walls that use this corner
-                    for wall in corrected_geometry['walls']:
-                        if wall['start_corner_id'] == corner_id:
-                            wall['start_x'] = corrected_x
-                            wall['start_y'] = corrected_y
-                        if wall['end_corner_id'] == corner_id:
-                            wall['end_x'] = corrected_x
-                            wall['end_y'] = corrected_y
-                break
-    
-    # Recalculate wall lengths
-    import numpy as np
-    for wall in corrected_geometry['walls']:
-        start_x = wall['start_x']
-        start_y = wall['start_y']
-        end_x = wall['end_x']
-        end_y = wall['end_y']
+        corner = corners_by_id.get(corner_id)
+        if corner is None:
+            continue
         
-        # Calculate wall length in pixels
-        wall['length_pixels'] = np.sqrt((end_x - start_x)**2 + (end_y - start_y)**2)
+        # Check if the position was actually changed
+        if corner['x'] != corrected_x or corner['y'] != corrected_y:
+            print(f"Correcting corner {corner_id}: ({corner['x']}, {corner['y']}) -> ({corrected_x}, {corrected_y})")
+            print(f"  Reason: {reason}")
+            
+            # Update the corner position
+            corner['x'] = corrected_x
+            corner['y'] = corrected_y
+            
+            # Also update any walls that use this corner
+            for wall in walls_by_start.get(corner_id, []):
+                wall['start_x'] = corrected_x
+                wall['start_y'] = corrected_y
+            for wall in walls_by_end.get(corner_id, []):
+                wall['end_x'] = corrected_x
+                wall['end_y'] = corrected_y
+    
+    # Recalculate all wall lengths in one vectorized pass
+    import numpy as np
+    walls = corrected_geometry['walls']
+    if walls:
+        endpoints = np.array([(wall['start_x'], wall['start_y'], wall['end_x'], wall['end_y']) for wall in walls],
+                             dtype=np.float64)
+        lengths = np.hypot(endpoints[:, 2] - endpoints[:, 0], endpoints[:, 3] - endpoints[:, 1])
+        for wall, length in zip(walls, lengths.tolist()):
+            wall['length_pixels'] = length
     
     return corrected_geometry
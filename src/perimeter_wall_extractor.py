@@ -16,10 +16,10 @@ Example:
 """
 
 import os
+import sys
 import argparse
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 import json
 from pathlib import Path
 from typing import Tuple, Dict, List, Any, Optional, Union
@@ -45,9 +45,15 @@ from vision_module import (
     feet_inches_to_inches,
     calculate_scale_factor,
     calculate_wall_lengths,
-    visualize_icf_perimeter
+    visualize_icf_perimeter,
+    save_json
 )
 
+# Rectangular structuring elements used by extract_perimeter_walls
+OFFSET_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (7, 7))  # Size depends on desired offset
+EROSION_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))  # Smaller kernel to preserve more details
+DILATION_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))  # Slightly larger kernel for dilation
+
 def extract_perimeter_walls(image_path: str, show_steps: bool = False) -> Tuple[np.ndarray, Dict[str, Any], np.ndarray]:
     """
     Extracts only the thick perimeter walls from a foundation plan.
@@ -107,11 +113,8 @@ def extract_perimeter_walls(image_path: str, show_steps: bool = False) -> Tuple[
     if show_steps:
         cv2.imwrite("perimeter_steps/2.2_high_threshold_mask.png", high_threshold_mask)
     
-    # Create kernel for offset (3 pixels)
-    offset_kernel = np.ones((7, 7), np.uint8)  # Size depends on desired offset
-    
-    # Create offset mask by dilating
-    offset_mask = cv2.dilate(high_threshold_mask, offset_kernel, iterations=1)
+    # Create offset mask by dilating (3 pixels)
+    offset_mask = cv2.dilate(high_threshold_mask, OFFSET_KERNEL, iterations=1)
     if show_steps:
         cv2.imwrite("perimeter_steps/2.3_offset_mask.png", offset_mask)
     
@@ -122,15 +125,12 @@ def extract_perimeter_walls(image_path: str, show_steps: bool = False) -> Tuple[
     
     # Apply morphological operations to identify thick walls
     # Use a smaller kernel for erosion to preserve more wall details
-    erosion_kernel = np.ones((3, 3), np.uint8)  # Smaller kernel to preserve more details
-    dilation_kernel = np.ones((5, 5), np.uint8)  # Slightly larger kernel for dilation
-    
     # Erosion will remove thin lines but keep thick walls
     # Using a smaller kernel and fewer iterations to preserve more wall details
-    eroded = cv2.erode(high_threshold_mask, erosion_kernel, iterations=1)
+    eroded = cv2.erode(high_threshold_mask, EROSION_KERNEL, iterations=1)
     
     # Dilation to restore the original thickness
-    thick_walls = cv2.dilate(eroded, dilation_kernel, iterations=1)
+    thick_walls = cv2.dilate(eroded, DILATION_KERNEL, iterations=1)
     
     if show_steps:
         cv2.imwrite("perimeter_steps/3_thick_walls.png", thick_walls)
@@ -213,14 +213,16 @@ def extract_perimeter_walls(image_path: str, show_steps: bool = False) -> Tuple[
             "y": int(y)
         })
     
+    # Calculate all wall lengths in pixels in one vectorized pass
+    corner_points = np.asarray(corners, dtype=np.float64).reshape(-1, 2)
+    deltas = np.roll(corner_points, -1, axis=0) - corner_points
+    wall_lengths = np.hypot(deltas[:, 0], deltas[:, 1]).tolist()
+    
     # Add walls to geometry data
-    for i in range(len(corners)):
+    for i, length_pixels in enumerate(wall_lengths):
         pt1 = corners[i].ravel()
         pt2 = corners[(i + 1) % len(corners)].ravel()
         
-        # Calculate wall length in pixels
-        length_pixels = np.sqrt((pt2[0] - pt1[0])**2 + (pt2[1] - pt1[1])**2)
-        
         geometry_data["walls"].append({
             "id": i + 1,
             "start_corner_id": i,
@@ -419,7 +421,7 @@ def process_foundation_plan(image_path: str, overall_width: str, output_dir: str
     
     # Create a clean, positive representation of the foundation walls
     # Create a clean white background
-    clean_positive_image = np.ones((image.shape[0], image.shape[1], 3), dtype=np.uint8) * 255
+    clean_positive_image = np.full((image.shape[0], image.shape[1], 3), 255, dtype=np.uint8)
     
     # Draw the foundation walls in black
     for wall in perimeter_model['walls']:
@@ -457,13 +459,22 @@ def process_foundation_plan(image_path: str, overall_width: str, output_dir: str
     
     # Save the perimeter model
     perimeter_model_path = os.path.join(output_dir, "perimeter_walls.json")
-    with open(perimeter_model_path, 'w') as f:
-        json.dump(perimeter_model, f, indent=2)
+    save_json(perimeter_model, perimeter_model_path)
     print(f"Perimeter wall model saved to {perimeter_model_path}")
     
     return perimeter_model, result_image
 
-def main():
+def main(argv: Optional[List[str]] = None):
+    """
+    Runs the perimeter wall extractor command line.
+    
+    Args:
+        argv: Command line arguments (defaults to sys.argv[1:]), so other scripts can run the
+              extractor in-process instead of starting a new Python interpreter.
+    
+    Returns:
+        Exit status: 0 on success, 1 if the plan could not be processed.
+    """
     parser = argparse.ArgumentParser(description="Extract perimeter walls from a foundation plan.")
     parser.add_argument("image_path", help="Path to the foundation plan image.")
     parser.add_argument("--overall_width", type=str,
@@ -484,7 +495,7 @@ def main():
                         help="Project identifier for database export.")
     parser.add_argument("--drawing_name", type=str,
                         help="Drawing name for database export (defaults to image filename).")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     # Check if we need to use LLM for dimension extraction
     wall_thickness = None
@@ -519,7 +530,7 @@ def main():
                         else:
                             print("\nError: No fallback overall width available in non-interactive mode.")
                             print("Set DEFAULT_OVERALL_WIDTH in your .env file.")
-                            return
+                            return 1
                     else:
                         # In interactive mode, prompt the user
                         print("\nThe overall width is required to process the foundation plan.")
@@ -528,7 +539,7 @@ def main():
                             args.overall_width = user_width
                         else:
                             print("No overall width provided. Exiting.")
-                            return
+                            return 1
                 
                 # If wall thickness wasn't identified, check for fallback
                 if not wall_thickness and non_interactive:
@@ -555,7 +566,7 @@ def main():
     # Ensure we have an overall width
     if not args.overall_width:
         print("Error: Overall width is required. Provide it with --overall_width or use --use_llm.")
-        return
+        return 1
     
     # Process the foundation plan
     try:
@@ -565,6 +576,8 @@ def main():
             args.output_dir,
             args.show_steps
         )
+        if not perimeter_model:
+            return 1
         
         # Add wall thickness to the perimeter model if available
         if wall_thickness:
@@ -572,8 +585,7 @@ def main():
             
             # Update the JSON file with the new model
             perimeter_model_path = os.path.join(args.output_dir, "perimeter_walls.json")
-            with open(perimeter_model_path, 'w') as f:
-                json.dump(perimeter_model, f, indent=2)
+            save_json(perimeter_model, perimeter_model_path)
             print(f"Added wall thickness ({wall_thickness}) to the perimeter model")
         
         # Export database-ready format if requested
@@ -634,6 +646,8 @@ def main():
         
         # Display the result
         if not args.no_visualize and result_image is not None:
+            import matplotlib.pyplot as plt
+            
             # Check if we're running in a non-interactive environment
             non_interactive = os.environ.get("NON_INTERACTIVE", "").lower() in ("true", "1", "yes")
             
@@ -656,6 +670,9 @@ def main():
                 plt.show(block=True)  # Explicitly set block=True for clarity
     except Exception as e:
         print(f"Error processing foundation plan: {e}")
+        return 1
+    
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
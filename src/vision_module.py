@@ -2,30 +2,95 @@
 # pyright: reportIndexIssue=false
 # pyright: reportMissingModuleSource=false
 import os
-import base64
+import re
 import json
+import hashlib
+import platform
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+from pathlib import Path
 import cv2
 import numpy as np
 from typing import List, Dict, Tuple, Any, Sequence, Optional, Union
-import matplotlib.pyplot as plt
 from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
-
 try:
-    from google.cloud import vision
+    # SIMD-accelerated drop-in replacement for the standard library module
+    import pybase64 as base64
 except ImportError:
-    print("Warning: Google Cloud Vision package not installed. Vision features will not work.")
-    vision = None
+    import base64
 
 try:
-    from sklearn.cluster import DBSCAN  # type: ignore
+    # Fast C JSON encoder, used when available
+    import orjson
 except ImportError:
-    print("Warning: sklearn not installed. Advanced corner clustering will not work.")
-    DBSCAN = None
+    orjson = None
+
+# Load environment variables from .env file
+load_dotenv()
+
+@lru_cache(maxsize=None)
+def load_google_vision():
+    """
+    Imports the Google Cloud Vision SDK on first use. The SDK is slow to import and
+    only the OCR path needs it, so it is kept out of module import time.
+    
+    Returns:
+        The google.cloud.vision module, or None if it is not installed.
+    """
+    try:
+        from google.cloud import vision
+    except ImportError:
+        print("Warning: Google Cloud Vision package not installed. Vision features will not work.")
+        return None
+    return vision
+
+# Make sure OpenCV dispatches to its SIMD-optimized and multi-threaded code paths
+cv2.setUseOptimized(True)
+cv2.setNumThreads(os.cpu_count() or 1)
+
+# Structuring element used to enhance the wall mask in detect_corners
+WALL_MORPH_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+
+# Structuring element used to dilate the Harris response in detect_corners_for_perimeter
+HARRIS_DILATION_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+# Fast PNG encoding for images sent to LLMs (level 1 deflate instead of the default 3)
+PNG_FAST_ENCODE_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+
+# JPEG encoding for OCR uploads; Vision re-decodes server-side, so PNG buys nothing
+VISION_JPEG_ENCODE_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 90]
+
+# On-disk cache of detected corners keyed by image content, so re-runs on the same
+# drawing skip the OpenCV corner pipelines. Set TAKEOFF_VISION_CACHE=0 to disable.
+VISION_CACHE_DIR = Path(os.environ.get("TAKEOFF_VISION_CACHE_DIR", Path.home() / ".takeoff_cache" / "vision"))
+VISION_CACHE_ENABLED = os.environ.get("TAKEOFF_VISION_CACHE", "1") != "0"
+# Bump whenever corner detection changes, so stale cache entries are not reused
+VISION_PIPELINE_VERSION = 1
+
+# Matches a whole dimension like 55'-0", 38'-6\" or 12' (feet, optional inches)
+FEET_INCHES_PATTERN = re.compile(r"""(\d+)\s*(?:['\u2019\u2032]\s*-?\s*(?:(\d+)\s*(?:"|''|\u201d|\u2033)?)?)?""")
+
+# Expected wall lengths of the sample plan (from the prompt), used when too few segments are detected
+WallSpec = namedtuple("WallSpec", "wall_number length position")
+EXPECTED_WALLS = (
+    WallSpec(1, "55'-0\"", "top"),
+    WallSpec(2, "34'-0\"", "right"),
+    WallSpec(3, "34'-3\"", "bottom-right"),
+    WallSpec(4, "6'-0\"", "bottom-cutout-right"),
+    WallSpec(5, "8'-0\"", "bottom-cutout-bottom"),
+    WallSpec(6, "6'-0\"", "bottom-cutout-left"),
+    WallSpec(7, "12'-9\"", "bottom-left"),
+    WallSpec(8, "34'-3\"", "left"),
+)
 
 # --- Helper Functions ---
+def has_display():
+    """Returns True when a plot window can actually be shown (not a headless session)."""
+    if platform.system() in ("Windows", "Darwin"):
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
 def resize_image_for_vision_api(image, max_dim=1000):
     """
     Resize image to ensure its maximum dimension doesn't exceed max_dim,
@@ -61,59 +126,146 @@ def resize_image_for_vision_api(image, max_dim=1000):
     print(f"Resized image from {width}x{height} to {new_width}x{new_height}")
     return resized_image
 
+def cluster_nearby_points(points, radius, image_shape):
+    """
+    Groups points that lie within roughly `radius` pixels of each other.
+    
+    The points are rasterized into a mask, grown into discs that touch when
+    their centers are `radius` apart and labelled with connected components,
+    which closely approximates
+    DBSCAN(eps=radius, min_samples=1) in a single linear scan of the image.
+    
+    Args:
+        points: Array-like of (x, y) coordinates.
+        radius: Maximum distance in pixels between neighbouring points of a cluster.
+        image_shape: Shape of the image the points were detected in.
+        
+    Returns:
+        clustered_points: List of (x, y) cluster centers (mean of the member points).
+    """
+    points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    if len(points) == 0:
+        return []
+    
+    height, width = image_shape[:2]
+    xs = np.clip(points[:, 0], 0, width - 1)
+    ys = np.clip(points[:, 1], 0, height - 1)
+    
+    # Grow each point into a disc so points closer than `radius` connect
+    mask = np.zeros((height, width), dtype=np.uint8)
+    mask[ys, xs] = 255
+    half = max(0, int((radius - 1) // 2))
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * half + 1, 2 * half + 1))
+    mask = cv2.dilate(mask, kernel)
+    
+    num_labels, labels = cv2.connectedComponents(mask, connectivity=8)
+    
+    # Average the original points of each component
+    point_labels = labels[ys, xs]
+    counts = np.bincount(point_labels, minlength=num_labels)
+    sum_x = np.bincount(point_labels, weights=points[:, 0], minlength=num_labels)
+    sum_y = np.bincount(point_labels, weights=points[:, 1], minlength=num_labels)
+    
+    present = counts > 0
+    center_x = (sum_x[present] / counts[present]).astype(int)
+    center_y = (sum_y[present] / counts[present]).astype(int)
+    
+    return list(zip(center_x.tolist(), center_y.tolist()))
+
 def feet_inches_to_inches(feet_str):
     """Converts a string like '55'-0"' or "38'-0\"" to inches."""
-    try:
-        # Remove any escape characters and normalize quotes
-        feet_str = feet_str.replace('\\', '').replace('"', '"').replace('"', '"')
+    # The whole string must be a dimension, so e.g. "5.5'" or "abc 12" are rejected
+    match = FEET_INCHES_PATTERN.fullmatch(feet_str.replace('\\', '').strip())
+    if not match:
+        print(f"Error parsing dimension '{feet_str}': not a feet/inches dimension")
+        return None
+    
+    feet = int(match.group(1))
+    inches = int(match.group(2) or 0)
+    
+    total_inches = (feet * 12) + inches
+    print(f"Converted '{feet_str}' to {total_inches} inches ({feet} feet and {inches} inches)")
+    return total_inches
+
+def load_image(image_or_path):
+    """
+    Returns a BGR image, decoding it from disk only if a path was given.
+    
+    Args:
+        image_or_path: Path to image, or an already-decoded BGR image array.
         
-        # Split on the feet symbol
-        if "'" in feet_str:
-            feet_part, inches_part = feet_str.split("'", 1)
-        else:
-            # Try alternative format
-            feet_part = feet_str
-            inches_part = "0"
-        
-        # Clean up and convert feet
-        feet_part = feet_part.strip()
-        feet = int(feet_part)
-        
-        # Clean up and convert inches
-        inches_part = inches_part.replace('"', '').strip()
-        if inches_part and inches_part != '0':
-            inches = int(inches_part)
-        else:
-            inches = 0
-            
-        total_inches = (feet * 12) + inches
-        print(f"Converted '{feet_str}' to {total_inches} inches ({feet} feet and {inches} inches)")
-        return total_inches
-    except (ValueError, IndexError) as e:
-        print(f"Error parsing dimension '{feet_str}': {e}")
+    Returns:
+        image: BGR image array.
+    """
+    if isinstance(image_or_path, np.ndarray):
+        return image_or_path
+    
+    image = cv2.imread(image_or_path)
+    if image is None:
+        raise FileNotFoundError(f"Could not open/find image: {image_or_path}")
+    return image
+
+def corner_cache_path(stage, image):
+    """
+    Returns the cache file for the corners detected by a pipeline stage in an image.
+    
+    Args:
+        stage: Name of the detection stage (e.g. "walls" or "perimeter").
+        image: Decoded BGR image.
+        
+    Returns:
+        Path of the cache entry, keyed by the image content and VISION_PIPELINE_VERSION.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{stage}:{VISION_PIPELINE_VERSION}:{image.shape}".encode('ascii'))
+    digest.update(np.ascontiguousarray(image).data)
+    return VISION_CACHE_DIR / f"{stage}_{digest.hexdigest()}.json"
+
+def load_cached_corners(stage, image):
+    """Returns the cached corners as a list of (x, y) tuples, or None on a cache miss."""
+    if not VISION_CACHE_ENABLED:
+        return None
+    try:
+        with open(corner_cache_path(stage, image), 'r', encoding='utf-8') as f:
+            return [(x, y) for x, y in json.load(f)["corners"]]
+    except (OSError, ValueError, KeyError, TypeError):
         return None
 
-def detect_corners(image_path, show_steps=False):
+def store_cached_corners(stage, image, corners):
+    """Saves the corners detected by a pipeline stage for an image."""
+    if not VISION_CACHE_ENABLED:
+        return
+    cache_path = corner_cache_path(stage, image)
+    try:
+        VISION_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"corners": [[int(x), int(y)] for x, y in corners]}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: Could not write vision cache entry: {e}")
+
+def detect_corners(image_path, show_steps=False, gray=None):
     """
     Detects the corners of the building in the foundation plan.
     
     Args:
-        image_path: Path to image.
+        image_path: Path to image, or an already-decoded BGR image.
         show_steps: If True, save intermediate images for debugging.
+        gray: Optional grayscale version of the image, to skip converting it again.
         
     Returns:
         corners: List of corner points (x, y) coordinates.
         debug_image: Image with detected corners for visualization.
     """
-    image = cv2.imread(image_path)
-    if image is None:
-        raise FileNotFoundError(f"Could not open/find image: {image_path}")
+    image = load_image(image_path)
     
     # Create a copy for visualization
     debug_image = image.copy()
     
     # Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if gray is None:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
     
     # Step 1: Target the gray color range of the walls
     lower_gray = np.array([110], dtype=np.uint8)  # Lower bound for gray
@@ -124,10 +276,11 @@ def detect_corners(image_path, show_steps=False):
         cv2.imwrite("1_gray_mask.png", gray_mask)
     
     # Step 2: Apply morphological operations to enhance the walls
-    kernel = np.ones((5, 5), np.uint8)
-    dilated = cv2.dilate(gray_mask, kernel, iterations=2)
-    eroded = cv2.erode(dilated, kernel, iterations=1)
-    closed = cv2.morphologyEx(eroded, cv2.MORPH_CLOSE, kernel, iterations=2)
+    # Note: the erode between dilate and close is not redundant; removing it
+    # noticeably thickens the mask and shifts the detected corners.
+    dilated = cv2.dilate(gray_mask, WALL_MORPH_KERNEL, iterations=2)
+    cv2.erode(dilated, WALL_MORPH_KERNEL, dst=dilated, iterations=1)
+    closed = cv2.morphologyEx(dilated, cv2.MORPH_CLOSE, WALL_MORPH_KERNEL, iterations=2)
     
     if show_steps:
         cv2.imwrite("2_morphology.png", closed)
@@ -153,11 +306,10 @@ def detect_corners(image_path, show_steps=False):
         approx = cv2.approxPolyDP(main_contour, epsilon, True)
         
         # Extract corner points
-        for point in approx:
-            x, y = point[0]
-            corners.append((x, y))
-            # Draw corners on debug image
-            cv2.circle(debug_image, (x, y), 5, (0, 0, 255), -1)
+        corners = [tuple(pt) for pt in approx.reshape(-1, 2).tolist()]
+        # Draw corners on debug image
+        for pt in corners:
+            cv2.circle(debug_image, pt, 5, (0, 0, 255), -1)
     
     # If we didn't find enough corners, try a different approach
     if len(corners) < 4:  # A house should have at least 4 corners (rectangular shape)
@@ -168,50 +320,20 @@ def detect_corners(image_path, show_steps=False):
         if main_contour is not None:
             cv2.drawContours(mask, [main_contour], 0, (255, 255, 255), -1)
         
-        # Use Harris corner detector
-        corners_harris = cv2.cornerHarris(mask, 5, 3, 0.04)
-        # Use a proper kernel for dilation
-        dilation_kernel = np.ones((3, 3), np.uint8)
-        corners_harris = cv2.dilate(corners_harris, dilation_kernel)
-        
-        # Threshold for corner detection
-        threshold = 0.01 * corners_harris.max()
-        corner_points = np.where(corners_harris > threshold)
+        # Use the Harris response through goodFeaturesToTrack, whose built-in
+        # non-maximum suppression (minDistance) already merges nearby responses
+        harris_points = cv2.goodFeaturesToTrack(mask, maxCorners=32, qualityLevel=0.01, minDistance=20,
+                                                blockSize=5, useHarrisDetector=True, k=0.04)
+        clustered_corners = []
+        if harris_points is not None:
+            clustered_corners = [tuple(pt) for pt in np.rint(harris_points.reshape(-1, 2)).astype(int).tolist()]
         
-        # Convert to (x, y) format and filter to get distinct corners
-        harris_corners = []
-        for y, x in zip(corner_points[0], corner_points[1]):
-            harris_corners.append((x, y))
-        
-        # Cluster corners that are close to each other
-        if len(harris_corners) > 0 and DBSCAN is not None:
-            try:
-                # Convert to numpy array for clustering
-                harris_corners_np = np.array(harris_corners)
-                
-                # Use DBSCAN to cluster nearby points
-                clustering = DBSCAN(eps=20, min_samples=1).fit(harris_corners_np)
-                labels = clustering.labels_
-                
-                # Get cluster centers
-                unique_labels = set(labels)
-                clustered_corners = []
-                
-                for label in unique_labels:
-                    cluster_points = harris_corners_np[labels == label]
-                    center_x = int(np.mean(cluster_points[:, 0]))
-                    center_y = int(np.mean(cluster_points[:, 1]))
-                    clustered_corners.append((center_x, center_y))
-                
-                # If we found more corners with Harris, use those
-                if len(clustered_corners) >= 8:
-                    corners = clustered_corners
-                    # Draw new corners on debug image
-                    for x, y in corners:
-                        cv2.circle(debug_image, (x, y), 5, (0, 255, 255), -1)
-            except ImportError:
-                print("Warning: sklearn not available for corner clustering.")
-                # If sklearn is not available, just use the corners we already have
+        # If we found more corners with Harris, use those
+        if len(clustered_corners) >= 8:
+            corners = clustered_corners
+            # Draw new corners on debug image
+            for x, y in corners:
+                cv2.circle(debug_image, (x, y), 5, (0, 255, 255), -1)
     
     # If we still don't have enough corners, try to infer them from the shape
     if len(corners) < 4:  # A house should have at least 4 corners (rectangular shape)
@@ -268,7 +390,7 @@ def preprocess_image_for_walls(image_path, show_steps=False):
     Preprocesses the image to identify walls by first detecting corners and then connecting them.
     
     Args:
-        image_path: Path to image.
+        image_path: Path to image, or an already-decoded BGR image.
         show_steps: If True, save intermediate images for debugging.
         
     Returns:
@@ -276,66 +398,58 @@ def preprocess_image_for_walls(image_path, show_steps=False):
         perimeter_contours: List of contours representing the perimeter walls.
         geometry_data: Dictionary containing corner coordinates and wall segments.
     """
-    image = cv2.imread(image_path)
-    if image is None:
-        raise FileNotFoundError(f"Could not open/find image: {image_path}")
+    image = load_image(image_path)
     
     # Get image dimensions
     height, width = image.shape[:2]
     
-    # Step 1: Detect corners
-    corners, debug_image = detect_corners(image_path, show_steps)
+    # Step 1: Detect corners (reusing the decoded image). The cache is bypassed
+    # when the intermediate step images were asked for.
+    corners = None if show_steps else load_cached_corners("walls", image)
+    if corners is None:
+        corners, _ = detect_corners(image, show_steps)
+        store_cached_corners("walls", image, corners)
     
     # Step 2: Create walls by connecting corners
     # Sort corners to form a clockwise or counter-clockwise sequence
     # This is a simplified approach - for complex shapes, we would need a more sophisticated algorithm
     
     # First, find the center of the corners
-    center_x = sum(x for x, y in corners) / len(corners)
-    center_y = sum(y for x, y in corners) / len(corners)
+    corner_points = np.asarray(corners, dtype=np.int32).reshape(-1, 2)
+    center_x, center_y = corner_points.mean(axis=0)
     
     # Sort corners by angle from center
-    sorted_corners = sorted(corners, key=lambda pt: np.arctan2(pt[1] - center_y, pt[0] - center_x))
+    angles = np.arctan2(corner_points[:, 1] - center_y, corner_points[:, 0] - center_x)
+    sorted_points = corner_points[np.argsort(angles, kind='stable')]
     
     # Create a contour from the sorted corners
-    contour_points = []
-    for x, y in sorted_corners:
-        contour_points.append([[[int(x), int(y)]]])
-    
-    # Convert to numpy array
-    perimeter_contour = np.array(contour_points)
+    perimeter_contour = sorted_points.reshape(-1, 1, 2)
     
-    # Create a list of wall segments (each segment is a line between two corners)
-    wall_segments = []
-    for i in range(len(sorted_corners)):
-        pt1 = sorted_corners[i]
-        pt2 = sorted_corners[(i + 1) % len(sorted_corners)]
-        
-        # Create a contour for this wall segment
-        segment = np.array([[
-            [int(pt1[0]), int(pt1[1])],
-            [int(pt2[0]), int(pt2[1])]
-        ]])
-        
-        wall_segments.append(segment)
+    # Each wall segment is a line from a corner to the next one around the perimeter
+    wall_start_points = sorted_points
+    wall_end_points = np.roll(sorted_points, -1, axis=0)
+    wall_deltas = (wall_end_points - wall_start_points).astype(np.float64)
+    wall_lengths = np.hypot(wall_deltas[:, 0], wall_deltas[:, 1])
     
     # Draw the walls on a blank image
     wall_image = np.zeros((height, width), dtype=np.uint8)
     
     # Draw the perimeter contour
-    cv2.drawContours(wall_image, [np.array(sorted_corners).reshape(-1, 1, 2)], 0, (255, 255, 255), thickness=10)
+    cv2.drawContours(wall_image, [perimeter_contour], 0, (255, 255, 255), thickness=10)
     
-    # Create debug image with walls
-    walls_debug = image.copy()
-    cv2.drawContours(walls_debug, [np.array(sorted_corners).reshape(-1, 1, 2)], 0, (0, 255, 0), thickness=4)
-    
-    # Draw corners on the debug image
-    for i, (x, y) in enumerate(sorted_corners):
-        cv2.circle(walls_debug, (int(x), int(y)), 5, (0, 0, 255), -1)
-        cv2.putText(walls_debug, str(i), (int(x) + 5, int(y) + 5), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
+    sorted_corners = sorted_points.tolist()
     
     if show_steps:
+        # Create debug image with walls (only needed when the steps are saved)
+        walls_debug = image.copy()
+        cv2.drawContours(walls_debug, [perimeter_contour], 0, (0, 255, 0), thickness=4)
+        
+        # Draw corners on the debug image
+        for i, (x, y) in enumerate(sorted_corners):
+            cv2.circle(walls_debug, (x, y), 5, (0, 0, 255), -1)
+            cv2.putText(walls_debug, str(i), (x + 5, y + 5), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
+        
         cv2.imwrite("3_detected_walls.png", walls_debug)
         cv2.imwrite("4_wall_mask.png", wall_image)
     
@@ -350,49 +464,80 @@ def preprocess_image_for_walls(image_path, show_steps=False):
         # Default all corners to valid, the LLM will identify invalid ones
         geometry_data["corners"].append({
             "id": i,
-            "x": int(x),
-            "y": int(y),
+            "x": x,
+            "y": y,
             "is_valid": True  # This flag can be updated by the LLM
         })
     
     # Add walls to geometry data
-    for i in range(len(sorted_corners)):
-        pt1 = sorted_corners[i]
-        pt2 = sorted_corners[(i + 1) % len(sorted_corners)]
-        
-        # Calculate wall length in pixels
-        length_pixels = np.sqrt((pt2[0] - pt1[0])**2 + (pt2[1] - pt1[1])**2)
-        
+    num_corners = len(sorted_corners)
+    for i, ((start_x, start_y), (end_x, end_y), length_pixels) in enumerate(
+            zip(sorted_corners, wall_end_points.tolist(), wall_lengths.tolist())):
         geometry_data["walls"].append({
             "id": i + 1,
             "start_corner_id": i,
-            "end_corner_id": (i + 1) % len(sorted_corners),
-            "start_x": int(pt1[0]),
-            "start_y": int(pt1[1]),
-            "end_x": int(pt2[0]),
-            "end_y": int(pt2[1]),
+            "end_corner_id": (i + 1) % num_corners,
+            "start_x": start_x,
+            "start_y": start_y,
+            "end_x": end_x,
+            "end_y": end_y,
             "length_pixels": length_pixels
         })
     
     # Return the wall image, contour of the perimeter, and geometry data
-    return wall_image, [np.array(sorted_corners).reshape(-1, 1, 2)], geometry_data
+    return wall_image, [perimeter_contour], geometry_data
+
+def init_batch_worker():
+    """Limits each batch worker to a single OpenCV thread so processes don't oversubscribe the CPU."""
+    cv2.setNumThreads(1)
 
 def get_overall_dimension_pixels(wall_image, orientation="horizontal"):
-    """Measures overall width/height of foundation in pixels."""
-    white_pixels = np.where(wall_image == 255)
-    if not white_pixels[0].size:
+    """
+    Measures overall width/height of foundation in pixels.
+    
+    Args:
+        wall_image: Binary wall image (white walls on black background).
+        orientation: "horizontal" for width, "vertical" for height.
+        
+    Returns:
+        Overall dimension in pixels, including the drawn wall stroke.
+    """
+    if orientation not in ("horizontal", "vertical"):
+        raise ValueError("Invalid orientation. Use 'horizontal' or 'vertical'.")
+    
+    # Let OpenCV find the bounding box of the non-zero pixels in a single pass
+    # instead of materializing index arrays for every white pixel
+    mask = wall_image if wall_image.dtype == np.uint8 else (wall_image != 0).astype(np.uint8)
+    _, _, w, h = cv2.boundingRect(mask)
+    if w == 0:
         return 0
+    
+    # The span is measured between the first and last wall pixel
+    return (w if orientation == "horizontal" else h) - 1
 
-    if orientation == "horizontal":
-        min_x = np.min(white_pixels[1])
-        max_x = np.max(white_pixels[1])
-        return max_x - min_x
-    elif orientation == "vertical":
-        min_y = np.min(white_pixels[0])
-        max_y = np.max(white_pixels[0])
-        return max_y - min_y
-    else:
+def get_overall_dimension_from_corners(geometry_data, orientation="horizontal"):
+    """
+    Measures overall width/height of foundation in pixels straight from the corner
+    coordinates, without scanning a raster. Unlike get_overall_dimension_pixels this
+    excludes the drawn wall stroke, so the two are not interchangeable for scaling.
+    
+    Args:
+        geometry_data: Dictionary containing corner coordinates (from preprocess_image_for_walls).
+        orientation: "horizontal" for width, "vertical" for height.
+        
+    Returns:
+        Overall dimension in pixels.
+    """
+    if orientation not in ("horizontal", "vertical"):
         raise ValueError("Invalid orientation. Use 'horizontal' or 'vertical'.")
+    
+    corners = geometry_data.get('corners', [])
+    if not corners:
+        return 0
+    
+    axis_key = 'x' if orientation == "horizontal" else 'y'
+    coords = [corner[axis_key] for corner in corners]
+    return max(coords) - min(coords)
 
 def calculate_scale_factor(real_world_dimension, pixel_dimension):
     """Calculates scale factor (real-world units per pixel)."""
@@ -415,17 +560,14 @@ def get_wall_segment_lengths_pixels(perimeter_contours):
     # Process each contour
     for contour in perimeter_contours:
         # Get the points from the contour
-        points = [point[0] for point in contour]
+        points = np.asarray(contour, dtype=np.float64).reshape(-1, 2)
         
         # Calculate the length of each segment (line between consecutive points)
-        for i in range(len(points)):
-            pt1 = points[i]
-            pt2 = points[(i + 1) % len(points)]
-            length = np.sqrt((pt2[0] - pt1[0])**2 + (pt2[1] - pt1[1])**2)
-            
-            # Only include significant segments
-            if length > 50:  # Lower threshold to catch smaller wall segments
-                segment_lengths.append(length)
+        deltas = np.roll(points, -1, axis=0) - points
+        lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+        
+        # Only include significant segments
+        segment_lengths.extend(lengths[lengths > 50].tolist())  # Lower threshold to catch smaller wall segments
     
     # No need to enforce exactly 8 wall segments - houses can have different numbers of walls
     if len(segment_lengths) < 4:  # A house should have at least 4 wall segments
@@ -437,11 +579,93 @@ def convert_to_real_world(pixel_lengths, scale_factor):
     """Converts pixel lengths to real-world lengths."""
     return [length * scale_factor for length in pixel_lengths]
 
+def lengths_to_feet_inches(lengths_inches):
+    """
+    Splits lengths in inches into whole feet and rounded inches, all at once.
+    
+    Args:
+        lengths_inches: Sequence or array of lengths in inches.
+        
+    Returns:
+        Tuple of (feet, inches) int32 arrays. Inches that round up to 12 are carried
+        into the next foot (e.g. 83.7" -> 7'-0", not 6'-12").
+    """
+    feet, remainder = np.divmod(np.asarray(lengths_inches, dtype=np.float64), 12.0)
+    feet = feet.astype(np.int32)
+    inches = np.rint(remainder).astype(np.int32)
+    carry = inches == 12
+    feet[carry] += 1
+    inches[carry] = 0
+    return feet, inches
+
+def ocr_cache_path(content):
+    """Returns the cache file for the OCR results of the encoded image sent to the Vision API."""
+    digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+    return VISION_CACHE_DIR / f"ocr_{digest}.json"
+
+def load_cached_ocr(content):
+    """
+    Looks up the OCR results previously returned for the same encoded image.
+    
+    Args:
+        content: Encoded image bytes sent to the Vision API.
+        
+    Returns:
+        List of OCR results (as returned by detect_text_with_google_vision), or None on a cache miss.
+    """
+    if not VISION_CACHE_ENABLED:
+        return None
+    try:
+        with open(ocr_cache_path(content), 'r', encoding='utf-8') as f:
+            cached_results = json.load(f)["ocr_results"]
+        return [
+            {"text": result["text"], "bbox": np.asarray(result["bbox"], dtype=np.int32).reshape(-1, 1, 2)}
+            for result in cached_results
+        ]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def store_cached_ocr(content, ocr_results):
+    """Saves the OCR results returned for an encoded image."""
+    if not VISION_CACHE_ENABLED:
+        return
+    cache_path = ocr_cache_path(content)
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        # Plain lists, so the standard encoder can write it when orjson isn't installed
+        serializable_results = [{"text": result["text"], "bbox": np.asarray(result["bbox"]).tolist()}
+                                for result in ocr_results]
+        payload = dumps_json_bytes({"ocr_results": serializable_results})
+        VISION_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, cache_path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Warning: Could not write OCR cache entry: {e}")
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+
 def detect_text_with_google_vision(image):
-    """Detects text in the image using Google Cloud Vision API."""
+    """Detects text in the image using Google Cloud Vision API (cached by image content)."""
+    vision = load_google_vision()
     if vision is None:
         print("Google Cloud Vision API not available. Skipping OCR.")
         return []
+    
+    # Resize image for better OCR results
+    resized_image = resize_image_for_vision_api(image, max_dim=1000)
+    
+    # Convert the OpenCV image to bytes (required by the Vision API).
+    _, encoded_image = cv2.imencode('.jpg', resized_image, VISION_JPEG_ENCODE_PARAMS)
+    content = encoded_image.tobytes()
+    
+    # Reuse the results of an earlier run on the same image
+    ocr_results = load_cached_ocr(content)
+    if ocr_results is not None:
+        print(f"Using {len(ocr_results)} cached OCR results")
+        return ocr_results
         
     try:
         # Check if we have JSON credentials directly in environment variable
@@ -459,12 +683,6 @@ def detect_text_with_google_vision(image):
             # Use the default credentials from GOOGLE_APPLICATION_CREDENTIALS
             client = vision.ImageAnnotatorClient()
 
-        # Resize image for better OCR results
-        resized_image = resize_image_for_vision_api(image, max_dim=1000)
-        
-        # Convert the OpenCV image to bytes (required by the Vision API).
-        _, encoded_image = cv2.imencode('.png', resized_image)
-        content = encoded_image.tobytes()
         vision_image = vision.Image(content=content)
 
         # Try document_text_detection first
@@ -487,17 +705,21 @@ def detect_text_with_google_vision(image):
 
         ocr_results = []
         for text in texts:
-            vertices = [(vertex.x, vertex.y) for vertex in text.bounding_poly.vertices]
+            poly_vertices = text.bounding_poly.vertices
+            vertices = np.fromiter((coord for vertex in poly_vertices for coord in (vertex.x, vertex.y)),
+                                   dtype=np.int32, count=2 * len(poly_vertices)).reshape(-1, 1, 2)
             ocr_results.append({
                 "text": text.description,
-                "bbox": vertices # List of (x,y) tuples
+                "bbox": vertices # int32 array of shape (N, 1, 2), ready for cv2.polylines
             })
-
-        return ocr_results
     except Exception as e:
         print(f"Google Vision API error: {e}")
         return []
 
+    # Cache outside the API error handling, so a failed cache write can't discard the results
+    store_cached_ocr(content, ocr_results)
+    return ocr_results
+
 def visualize_results(image, wall_lengths, ocr_results, perimeter_contours=None, geometry_data=None):
     """
     Draws the wall contours, OCR results, and wall lengths on the image.
@@ -531,12 +753,10 @@ def visualize_results(image, wall_lengths, ocr_results, perimeter_contours=None,
             cv2.putText(result_image, str(corner['id']), (pt[0] + 5, pt[1] + 5), 
                         cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 1)
     
-    # Draw OCR bounding boxes in red
-    for result in ocr_results:
-        vertices = result['bbox']
-        pts = np.array(vertices, np.int32)
-        pts = pts.reshape((-1, 1, 2))
-        cv2.polylines(result_image, [pts], isClosed=True, color=(0, 0, 255), thickness=1)
+    # Draw OCR bounding boxes in red (all boxes in a single polylines call)
+    if ocr_results:
+        bbox_polygons = [np.asarray(result['bbox'], np.int32).reshape((-1, 1, 2)) for result in ocr_results]
+        cv2.polylines(result_image, bbox_polygons, isClosed=True, color=(0, 0, 255), thickness=1)
     
     # Draw wall lengths
     if wall_lengths:
@@ -552,67 +772,159 @@ def visualize_results(image, wall_lengths, ocr_results, perimeter_contours=None,
     
     return result_image
 
-def encode_image_to_base64(image):
-    """Encodes an OpenCV image to base64."""
-    _, encoded_image = cv2.imencode('.png', image)
-    base64_image = base64.b64encode(encoded_image.tobytes()).decode('utf-8')
+def encode_image_to_base64(image, jpeg_quality=None):
+    """
+    Encodes an OpenCV image to base64.
+    
+    Args:
+        image: OpenCV image (numpy array).
+        jpeg_quality: JPEG quality (1-100). PNG is used when None, which is lossless but several times larger.
+        
+    Returns:
+        Base64 string of the encoded image.
+    """
+    if jpeg_quality:
+        _, encoded_image = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)])
+        return base64.b64encode(encoded_image).decode('utf-8')
+    _, encoded_image = cv2.imencode('.png', image, PNG_FAST_ENCODE_PARAMS)
+    base64_image = base64.b64encode(encoded_image).decode('utf-8')
     return base64_image
 
+def geometry_to_arrays(geometry_data):
+    """
+    Gathers the corner and wall fields of geometry_data into parallel numpy arrays
+    (structure-of-arrays), for vectorized processing. geometry_data itself stays the
+    JSON-friendly list-of-dicts form used by the LLM prompts and saved outputs.
+    
+    Args:
+        geometry_data: Dictionary containing corners and (optionally) walls.
+        
+    Returns:
+        Dictionary with:
+            corner_ids: (N,) corner IDs.
+            corner_xy: (N, 2) corner coordinates.
+            corner_valid: (N,) bool is_valid flags (True where missing).
+            wall_ids: (W,) wall IDs.
+            wall_start_ids, wall_end_ids: (W,) corner IDs at each end of the walls.
+            wall_endpoints: (W, 2, 2) start and end coordinates of the walls.
+            wall_lengths: (W,) wall lengths in pixels.
+    """
+    corners = geometry_data.get('corners', [])
+    walls = geometry_data.get('walls', [])
+    num_corners = len(corners)
+    num_walls = len(walls)
+    
+    return {
+        "corner_ids": np.fromiter((corner['id'] for corner in corners), dtype=np.int64, count=num_corners),
+        "corner_xy": np.array([(corner['x'], corner['y']) for corner in corners], dtype=np.float64).reshape(-1, 2),
+        "corner_valid": np.fromiter((corner.get('is_valid', True) for corner in corners), dtype=bool, count=num_corners),
+        "wall_ids": np.fromiter((wall['id'] for wall in walls), dtype=np.int64, count=num_walls),
+        "wall_start_ids": np.fromiter((wall['start_corner_id'] for wall in walls), dtype=np.int64, count=num_walls),
+        "wall_end_ids": np.fromiter((wall['end_corner_id'] for wall in walls), dtype=np.int64, count=num_walls),
+        "wall_endpoints": np.array([((wall['start_x'], wall['start_y']), (wall['end_x'], wall['end_y']))
+                                    for wall in walls], dtype=np.float64).reshape(-1, 2, 2),
+        "wall_lengths": np.fromiter((wall['length_pixels'] for wall in walls), dtype=np.float64, count=num_walls),
+    }
+
+def build_corners_by_id(corners):
+    """
+    Index corners by their ID.
+    
+    Args:
+        corners: List of corner dicts from geometry_data.
+        
+    Returns:
+        Dict mapping each corner ID to the list of corners with that ID.
+    """
+    corners_by_id = defaultdict(list)
+    for corner in corners:
+        corners_by_id[corner['id']].append(corner)
+    return dict(corners_by_id)
+
+def build_corner_to_walls(walls):
+    """
+    Build a reverse index from corner IDs to the walls that start or end there.
+    
+    Args:
+        walls: List of wall dicts from geometry_data.
+        
+    Returns:
+        Dict mapping each corner ID to its connected walls, in wall order.
+    """
+    corner_to_walls = defaultdict(list)
+    for wall in walls:
+        corner_to_walls[wall['start_corner_id']].append(wall)
+        if wall['end_corner_id'] != wall['start_corner_id']:
+            corner_to_walls[wall['end_corner_id']].append(wall)
+    return dict(corner_to_walls)
+
 def update_corner_validity(geometry_data, llm_response):
     """Update the is_valid flag for corners based on LLM's response."""
     # Process the LLM's identification of invalid corners
     invalid_corners = llm_response.get('invalid_corners', [])
     
+    corners = geometry_data['corners']
+    walls = geometry_data['walls']
+    corners_by_id = build_corners_by_id(corners)
+    corner_to_walls = build_corner_to_walls(walls)
+    
     # First pass: Mark corners as invalid based on LLM response
     for corner_id in invalid_corners:
-        for corner in geometry_data['corners']:
-            if corner['id'] == corner_id:
-                corner['is_valid'] = False
-                print(f"Marked corner {corner_id} as invalid based on LLM analysis")
+        for corner in corners_by_id.get(corner_id, []):
+            corner['is_valid'] = False
+            print(f"Marked corner {corner_id} as invalid based on LLM analysis")
+    
+    # Gather the fields used below into arrays once, so the per-corner checks
+    # run as vectorized numpy operations instead of nested Python loops
+    arrays = geometry_to_arrays(geometry_data)
+    corner_ids = arrays['corner_ids']
+    corner_x = arrays['corner_xy'][:, 0]
+    corner_y = arrays['corner_xy'][:, 1]
+    wall_start_ids = arrays['wall_start_ids']
+    wall_end_ids = arrays['wall_end_ids']
+    wall_lengths = arrays['wall_lengths']
+    
+    # incidence[i, j] is True when wall j starts or ends at corner i
+    incidence = ((wall_start_ids[np.newaxis, :] == corner_ids[:, np.newaxis]) |
+                 (wall_end_ids[np.newaxis, :] == corner_ids[:, np.newaxis]))
     
     # Calculate the average wall length to determine what's "long" for this drawing
     avg_wall_length = 0
-    if geometry_data['walls']:
-        avg_wall_length = sum(wall['length_pixels'] for wall in geometry_data['walls']) / len(geometry_data['walls'])
+    if walls:
+        avg_wall_length = float(wall_lengths.mean())
     long_wall_threshold = max(100, avg_wall_length * 0.5)  # At least 100px or 50% of average
     print(f"Long wall threshold: {long_wall_threshold:.1f} pixels")
     
-    # Find min/max x and y coordinates for perimeter detection
-    if geometry_data['corners']:
-        min_x = min(corner['x'] for corner in geometry_data['corners'])
-        max_x = max(corner['x'] for corner in geometry_data['corners'])
-        min_y = min(corner['y'] for corner in geometry_data['corners'])
-        max_y = max(corner['y'] for corner in geometry_data['corners'])
+    # Check which corners are at the perimeter (near both an x and a y extreme)
+    at_perimeter = np.zeros(len(corners), dtype=bool)
+    if corners:
+        min_x, max_x = corner_x.min(), corner_x.max()
+        min_y, max_y = corner_y.min(), corner_y.max()
         
         # Margin for considering a point at the perimeter (5% of dimension)
         x_margin = 0.05 * (max_x - min_x)
         y_margin = 0.05 * (max_y - min_y)
+        
+        at_x_perimeter = (np.abs(corner_x - min_x) <= x_margin) | (np.abs(corner_x - max_x) <= x_margin)
+        at_y_perimeter = (np.abs(corner_y - min_y) <= y_margin) | (np.abs(corner_y - max_y) <= y_margin)
+        at_perimeter = at_x_perimeter & at_y_perimeter
+    
+    # Check which corners connect to at least one long wall
+    has_long_wall = (incidence & (wall_lengths > long_wall_threshold)).any(axis=1)
     
     # Second pass: Verify if any corners were incorrectly marked as invalid
     # This helps prevent valid structural corners from being filtered out
-    for corner in geometry_data['corners']:
+    for idx, corner in enumerate(corners):
         if not corner['is_valid']:
-            # Find walls connected to this corner
-            connected_walls = []
-            for wall in geometry_data['walls']:
-                if wall['start_corner_id'] == corner['id'] or wall['end_corner_id'] == corner['id']:
-                    connected_walls.append(wall)
-            
-            # Check if this corner is at the perimeter
-            at_perimeter = False
-            if geometry_data['corners']:
-                at_x_perimeter = (abs(corner['x'] - min_x) <= x_margin or abs(corner['x'] - max_x) <= x_margin)
-                at_y_perimeter = (abs(corner['y'] - min_y) <= y_margin or abs(corner['y'] - max_y) <= y_margin)
-                at_perimeter = at_x_perimeter and at_y_perimeter
-            
             # If this corner is at the perimeter and connects to at least one long wall, it's likely valid
-            has_long_wall = any(wall['length_pixels'] > long_wall_threshold for wall in connected_walls)
-            
-            if at_perimeter and has_long_wall:
+            if at_perimeter[idx] and has_long_wall[idx]:
                 corner['is_valid'] = True
                 print(f"Restored corner {corner['id']} as valid based on perimeter position and long wall")
                 continue
             
+            # Find walls connected to this corner
+            connected_walls = corner_to_walls.get(corner['id'], [])
+            
             # If we have at least 2 connected walls, check the angle
             if len(connected_walls) >= 2:
                 # Get vectors for the walls
@@ -620,157 +932,169 @@ def update_corner_validity(geometry_data, llm_response):
                 for wall in connected_walls:
                     if wall['start_corner_id'] == corner['id']:
                         # Vector points away from the corner
-                        vx = wall['end_x'] - corner['x']
-                        vy = wall['end_y'] - corner['y']
+                        vectors.append((wall['end_x'] - corner['x'], wall['end_y'] - corner['y']))
                     else:
                         # Vector points toward the corner
-                        vx = corner['x'] - wall['start_x']
-                        vy = corner['y'] - wall['start_y']
-                    
-                    # Normalize the vector
-                    length = (vx**2 + vy**2)**0.5
-                    if length > 0:
-                        vectors.append((vx/length, vy/length))
+                        vectors.append((corner['x'] - wall['start_x'], corner['y'] - wall['start_y']))
                 
-                # Calculate angles between vectors
-                for i in range(len(vectors)):
-                    for j in range(i+1, len(vectors)):
-                        # Dot product gives cosine of angle
-                        dot_product = vectors[i][0]*vectors[j][0] + vectors[i][1]*vectors[j][1]
-                        # Clamp to valid range for arccos
-                        dot_product = max(-1.0, min(1.0, dot_product))
-                        angle_rad = np.arccos(dot_product)
-                        angle_deg = np.degrees(angle_rad)
-                        
-                        # Check if angle is close to 90 degrees (within 30 degrees)
-                        if 60 <= angle_deg <= 120:
-                            corner['is_valid'] = True
-                            print(f"Restored corner {corner['id']} as valid based on angle check")
-                            break
-                    if corner['is_valid']:
-                        break
+                # Normalize the vectors, dropping zero-length ones
+                vectors = np.asarray(vectors, dtype=np.float64)
+                lengths = np.hypot(vectors[:, 0], vectors[:, 1])
+                vectors = vectors[lengths > 0] / lengths[lengths > 0, np.newaxis]
+                
+                # Dot products of every pair of vectors give the cosines of their angles
+                upper = np.triu_indices(len(vectors), k=1)
+                cosines = np.clip((vectors @ vectors.T)[upper], -1.0, 1.0)
+                angles_deg = np.degrees(np.arccos(cosines))
+                
+                # Check if any angle is close to 90 degrees (within 30 degrees)
+                if np.any((angles_deg >= 60) & (angles_deg <= 120)):
+                    corner['is_valid'] = True
+                    print(f"Restored corner {corner['id']} as valid based on angle check")
     
     # Third pass: Check for corners that form the main shape of the foundation
     # Count how many valid corners we have
-    valid_corner_count = sum(1 for corner in geometry_data['corners'] if corner['is_valid'])
+    valid_corner_count = int(np.count_nonzero(
+        np.fromiter((corner['is_valid'] for corner in corners), dtype=bool, count=len(corners))))
     
     # If we have too few valid corners (less than 4), we need to restore some
     if valid_corner_count < 4:
         print(f"Warning: Only {valid_corner_count} valid corners detected. Restoring important corners...")
         
-        # Sort corners by importance (number of connected walls * total length of connected walls)
-        corner_importance = []
-        for corner in geometry_data['corners']:
-            if not corner['is_valid']:
-                # Find connected walls
-                connected_walls = []
-                for wall in geometry_data['walls']:
-                    if wall['start_corner_id'] == corner['id'] or wall['end_corner_id'] == corner['id']:
-                        connected_walls.append(wall)
-                
-                # Calculate importance score
-                total_length = sum(wall['length_pixels'] for wall in connected_walls)
-                importance = len(connected_walls) * total_length
-                
-                corner_importance.append((corner['id'], importance))
+        # Importance = number of connected walls * total length of connected walls
+        importance = incidence.sum(axis=1) * (incidence @ wall_lengths)
         
-        # Sort by importance (highest first)
+        # Sort invalid corners by importance (highest first)
+        corner_importance = [(idx, importance[idx]) for idx, corner in enumerate(corners)
+                             if not corner['is_valid']]
         corner_importance.sort(key=lambda x: x[1], reverse=True)
         
         # Restore corners until we have at least 4 valid corners
-        for corner_id, importance in corner_importance:
+        for idx, _ in corner_importance:
             if valid_corner_count >= 4:
                 break
-                
-            # Find the corner and mark it as valid
-            for corner in geometry_data['corners']:
-                if corner['id'] == corner_id and not corner['is_valid']:
-                    corner['is_valid'] = True
-                    valid_corner_count += 1
-                    print(f"Restored corner {corner_id} as valid based on importance score")
-                    break
+            
+            corners[idx]['is_valid'] = True
+            valid_corner_count += 1
+            print(f"Restored corner {corners[idx]['id']} as valid based on importance score")
     
     return geometry_data
 
-def filter_invalid_walls(geometry_data):
-    """Filter out walls that connect to invalid corners."""
+def filter_invalid_walls(geometry_data, verbose=True):
+    """
+    Filter out walls that connect to invalid corners.
+    
+    Args:
+        geometry_data: Dictionary containing corners (with is_valid flags) and walls.
+        verbose: Print a line for every wall filtered and corner restored.
+        
+    Returns:
+        geometry_data with only the valid walls.
+    """
+    corners = geometry_data['corners']
+    walls = geometry_data['walls']
     valid_walls = []
     invalid_walls = []
+    messages = []
+    
+    # Look up each corner's validity by ID; the last corner with a given ID wins
+    corner_validity = {corner['id']: corner['is_valid'] for corner in corners}
     
     # First, identify walls connecting to invalid corners
-    for wall in geometry_data['walls']:
-        start_valid = False
-        end_valid = False
-        
-        for corner in geometry_data['corners']:
-            if corner['id'] == wall['start_corner_id']:
-                start_valid = corner['is_valid']
-            if corner['id'] == wall['end_corner_id']:
-                end_valid = corner['is_valid']
+    for wall in walls:
+        start_valid = corner_validity.get(wall['start_corner_id'], False)
+        end_valid = corner_validity.get(wall['end_corner_id'], False)
         
         if start_valid and end_valid:
             valid_walls.append(wall)
         else:
             invalid_walls.append(wall)
-            print(f"Identified invalid wall {wall['id']} connecting corners {wall['start_corner_id']} and {wall['end_corner_id']}")
+            if verbose:
+                messages.append(f"Identified invalid wall {wall['id']} connecting corners {wall['start_corner_id']} and {wall['end_corner_id']}")
+    
+    # Emit each loop's messages with one print instead of one per wall
+    if messages:
+        print("\n".join(messages))
+        messages = []
     
     # Check if we're filtering out too many walls (more than 30%)
-    if len(invalid_walls) > 0.3 * len(geometry_data['walls']):
+    if len(invalid_walls) > 0.3 * len(walls):
         print("Warning: Too many walls being filtered out. Rechecking corner validity...")
         
+        corner_to_walls = build_corner_to_walls(walls)
+        
         # Reconsider corners that might be valid structural corners
-        for corner in geometry_data['corners']:
+        for corner in corners:
             if not corner['is_valid']:
-                # Count how many walls connect to this corner
-                connected_wall_count = 0
-                for wall in geometry_data['walls']:
-                    if wall['start_corner_id'] == corner['id'] or wall['end_corner_id'] == corner['id']:
-                        connected_wall_count += 1
+                connected_walls = corner_to_walls.get(corner['id'], [])
                 
                 # If this corner connects multiple walls, it might be a valid structural corner
-                if connected_wall_count >= 2:
+                if len(connected_walls) >= 2:
                     # Check if any of these walls are long (structural)
-                    has_long_wall = False
-                    for wall in geometry_data['walls']:
-                        if (wall['start_corner_id'] == corner['id'] or wall['end_corner_id'] == corner['id']) and wall['length_pixels'] > 100:
-                            has_long_wall = True
-                            break
+                    has_long_wall = any(wall['length_pixels'] > 100 for wall in connected_walls)
                     
                     if has_long_wall:
                         corner['is_valid'] = True
-                        print(f"Restored corner {corner['id']} as valid based on structural importance")
+                        if verbose:
+                            messages.append(f"Restored corner {corner['id']} as valid based on structural importance")
         
         # Recompute valid walls after updating corner validity
+        corner_validity = {corner['id']: corner['is_valid'] for corner in corners}
         valid_walls = []
-        for wall in geometry_data['walls']:
-            start_valid = False
-            end_valid = False
-            
-            for corner in geometry_data['corners']:
-                if corner['id'] == wall['start_corner_id']:
-                    start_valid = corner['is_valid']
-                if corner['id'] == wall['end_corner_id']:
-                    end_valid = corner['is_valid']
+        for wall in walls:
+            start_valid = corner_validity.get(wall['start_corner_id'], False)
+            end_valid = corner_validity.get(wall['end_corner_id'], False)
             
             if start_valid and end_valid:
                 valid_walls.append(wall)
-            else:
-                print(f"Filtered out wall {wall['id']} connecting corners {wall['start_corner_id']} and {wall['end_corner_id']}")
+            elif verbose:
+                messages.append(f"Filtered out wall {wall['id']} connecting corners {wall['start_corner_id']} and {wall['end_corner_id']}")
+        
+        if messages:
+            print("\n".join(messages))
     
     # Replace the walls in geometry_data with only the valid walls
     geometry_data['walls'] = valid_walls
     return geometry_data
 
+def dumps_json_bytes(data):
+    """
+    Serializes data as UTF-8 JSON indented by two spaces.
+    Uses orjson when it is installed, which is much faster than the standard encoder
+    and handles numpy arrays and scalars (e.g. cv2 coordinates) directly.
+    
+    Args:
+        data: JSON-serializable data.
+        
+    Returns:
+        Encoded JSON bytes.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass  # Fall back to the standard encoder for types orjson rejects
+    return json.dumps(data, indent=2).encode('utf-8')
+
+def save_json(data, output_path):
+    """Writes data to a JSON file, indented by two spaces."""
+    with open(output_path, 'wb') as f:
+        f.write(dumps_json_bytes(data))
+
 def save_geometry_data(geometry_data, output_path):
     """Saves geometry data to a JSON file and prints it to the console."""
     try:
+        # Serialize once and reuse the bytes for both the file and the console
+        payload = dumps_json_bytes(geometry_data)
+        
         # Save to file
-        with open(output_path, 'w') as f:
-            json.dump(geometry_data, f, indent=2)
+        with open(output_path, 'wb') as f:
+            f.write(payload)
+        payload = payload.decode('utf-8')
         
         # Print to console
         print(f"\nGeometry data (also saved to {output_path}):")
-        print(json.dumps(geometry_data, indent=2))
+        print(payload)
         
         return True
     except Exception as e:
@@ -782,61 +1106,47 @@ def detect_corners_for_perimeter(image_path, show_steps=False):
     Enhanced corner detection optimized for foundation perimeter extraction.
     
     Args:
-        image_path: Path to image.
+        image_path: Path to image, or an already-decoded BGR image.
         show_steps: If True, save intermediate images for debugging.
         
     Returns:
         corners: List of potential corner points (x, y) coordinates.
         clean_image: Image with only corner points visualized.
     """
-    image = cv2.imread(image_path)
-    if image is None:
-        raise FileNotFoundError(f"Could not open/find image: {image_path}")
+    image = load_image(image_path)
     
     # Create a clean copy for visualization
     clean_image = image.copy()
     
-    # Use multiple corner detection methods for comprehensive results
-    corners = []
-    
-    # Method 1: Our existing contour-based corner detection
-    detected_corners, _ = detect_corners(image_path, show_steps=False)
-    corners.extend(detected_corners)
-    
-    # Method 2: Harris corner detector for additional points
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    harris_corners = cv2.cornerHarris(gray, blockSize=5, ksize=3, k=0.04)
-    # Use a proper kernel for dilation
-    dilation_kernel = np.ones((3, 3), np.uint8)
-    harris_corners = cv2.dilate(harris_corners, dilation_kernel)
-    threshold = 0.01 * harris_corners.max()
-    
-    # Find coordinates where harris_corners exceeds threshold
-    corner_points = np.where(harris_corners > threshold)
-    for y, x in zip(corner_points[0], corner_points[1]):
-        corners.append((x, y))
-    
-    # Remove duplicates by clustering nearby points
-    if len(corners) > 0 and DBSCAN is not None:
-        try:
-            corners_np = np.array(corners)
+    # Reuse the corners found in an earlier run on the same image
+    corners = load_cached_corners("perimeter", image)
+    if corners is None:
+        # Decode and convert once; both detection methods share the same buffers
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        
+        # Use multiple corner detection methods for comprehensive results
+        corners = []
+        
+        # Method 1: Our existing contour-based corner detection
+        detected_corners, _ = detect_corners(image, show_steps=False, gray=gray)
+        corners.extend(detected_corners)
+        
+        # Method 2: Harris corner detector for additional points
+        harris_corners = cv2.cornerHarris(gray, blockSize=5, ksize=3, k=0.04)
+        harris_corners = cv2.dilate(harris_corners, HARRIS_DILATION_KERNEL)
+        threshold = 0.01 * harris_corners.max()
+        
+        # Find coordinates where harris_corners exceeds threshold
+        corner_points = np.where(harris_corners > threshold)
+        for y, x in zip(corner_points[0], corner_points[1]):
+            corners.append((x, y))
+        
+        # Remove duplicates by clustering nearby points
+        if len(corners) > 0:
             # Adjust epsilon based on image size
             epsilon = min(image.shape[0], image.shape[1]) * 0.015  # 1.5% of image dimension
-            clustering = DBSCAN(eps=epsilon, min_samples=1).fit(corners_np)
-            labels = clustering.labels_
-            
-            unique_labels = set(labels)
-            clustered_corners = []
-            
-            for label in unique_labels:
-                cluster_points = corners_np[labels == label]
-                center_x = int(np.mean(cluster_points[:, 0]))
-                center_y = int(np.mean(cluster_points[:, 1]))
-                clustered_corners.append((center_x, center_y))
-            
-            corners = clustered_corners
-        except Exception as e:
-            print(f"Error during corner clustering: {e}")
+            corners = cluster_nearby_points(corners, epsilon, image.shape)
+        store_cached_corners("perimeter", image, corners)
     
     # Create a visualization with only the corner points (no text or OCR)
     for i, (x, y) in enumerate(corners):
@@ -924,20 +1234,14 @@ def calculate_wall_lengths(perimeter_model, scale_factor):
         wall_lengths: Dictionary of wall lengths in feet and inches.
     """
     wall_lengths = {}
+    walls = perimeter_model['walls']
     
-    for wall in perimeter_model['walls']:
-        # Calculate length in inches
-        length_inches = wall['length_pixels'] * scale_factor
-        
-        # Convert to feet and inches
-        feet = int(length_inches // 12)
-        inches = int(round(length_inches % 12))
-        
-        # Handle the case where inches is 12 (roll over to the next foot)
-        if inches == 12:
-            feet += 1
-            inches = 0
-        
+    # Convert all the lengths to feet and inches at once
+    lengths_inches = np.fromiter((wall['length_pixels'] for wall in walls), dtype=np.float64,
+                                 count=len(walls)) * scale_factor
+    feet_arr, inches_arr = lengths_to_feet_inches(lengths_inches)
+    
+    for wall, feet, inches in zip(walls, feet_arr.tolist(), inches_arr.tolist()):
         # Format as string
         wall_lengths[wall['id']] = f"{feet}'-{inches}\""
         
@@ -983,16 +1287,19 @@ def create_perimeter_model(geometry_data, perimeter_corner_ids):
                 id_mapping[original_id] = new_id
                 break
     
-    # Create walls connecting corners in sequence
+    # Calculate all wall lengths in pixels in one vectorized pass
     num_corners = len(perimeter_model['corners'])
-    for i in range(num_corners):
+    corner_points = np.array([(corner['x'], corner['y']) for corner in perimeter_model['corners']],
+                             dtype=np.float64).reshape(-1, 2)
+    deltas = np.roll(corner_points, -1, axis=0) - corner_points
+    wall_lengths = np.hypot(deltas[:, 0], deltas[:, 1]).tolist()
+    
+    # Create walls connecting corners in sequence
+    for i, length_pixels in enumerate(wall_lengths):
         start_corner = perimeter_model['corners'][i]
         end_corner = perimeter_model['corners'][(i + 1) % num_corners]
-        
-        # Calculate wall length in pixels
         start_x, start_y = start_corner['x'], start_corner['y']
         end_x, end_y = end_corner['x'], end_corner['y']
-        length_pixels = np.sqrt((end_x - start_x)**2 + (end_y - start_y)**2)
         
         perimeter_model['walls'].append({
             "id": i + 1,
@@ -1071,6 +1378,45 @@ def visualize_icf_perimeter(image, perimeter_model):
     
     return result_image
 
+def contours_in_location(location, centroids, width, height):
+    """
+    Marks which contour centroids fall in a feedback location such as "bottom left".
+    
+    Args:
+        location: Lower-cased location string from the LLM feedback.
+        centroids: (N, 2) array of contour centroids (x, y).
+        width: Image width.
+        height: Image height.
+        
+    Returns:
+        Boolean array with True for centroids inside the location.
+    """
+    cx = centroids[:, 0]
+    cy = centroids[:, 1]
+    
+    # Vertical band: bottom/top/middle third of the image
+    in_rows = np.zeros(len(centroids), dtype=bool)
+    if 'bottom' in location:
+        in_rows |= cy > height * 0.7
+    if 'top' in location:
+        in_rows |= cy < height * 0.3
+    if 'middle' in location:
+        in_rows |= (cy >= height * 0.3) & (cy <= height * 0.7)
+    
+    # Horizontal band: left/center/right, or anywhere if none is given
+    if 'left' not in location and 'center' not in location and 'right' not in location:
+        return in_rows
+    
+    in_cols = np.zeros(len(centroids), dtype=bool)
+    if 'left' in location:
+        in_cols |= cx < width * 0.3
+    if 'center' in location:
+        in_cols |= (cx >= width * 0.3) & (cx <= width * 0.7)
+    if 'right' in location:
+        in_cols |= cx > width * 0.7
+    
+    return in_rows & in_cols
+
 def apply_llm_feedback(perimeter_contours, feedback, image_shape):
     """
     Applies feedback from the LLM to improve the wall detection.
@@ -1085,153 +1431,69 @@ def apply_llm_feedback(perimeter_contours, feedback, image_shape):
     """
     height, width = image_shape[:2]
     improved_contours = []
-    contours_to_remove = []
     
-    # First, identify contours to remove (false positives)
+    # Calculate each contour's centroid once; every issue below reuses it.
+    # The bounding box center is enough to tell which region a contour is in,
+    # and is cheaper than computing image moments
+    centroids = []
+    for contour in perimeter_contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        centroids.append((x + w//2, y + h//2))
+    centroids = np.array(centroids, dtype=np.int64).reshape(-1, 2)
+    
+    # Parse each issue once and mark which contours lie in its location
+    issues = []
     for issue in feedback.get('issues', []):
         location = issue.get('location', '').lower()
         problem = issue.get('problem', '').lower()
-        
+        issues.append((location, problem, contours_in_location(location, centroids, width, height)))
+    
+    # First, identify contours to remove (false positives) as a per-contour flag,
+    # so checking a contour is a constant-time lookup
+    contours_to_remove = np.zeros(len(perimeter_contours), dtype=bool)
+    for location, problem, in_location in issues:
         if problem == 'false positive':
             # Mark contours in this area for removal
-            for i, contour in enumerate(perimeter_contours):
-                # Calculate contour centroid
-                M = cv2.moments(contour)
-                if M["m00"] != 0:
-                    cx = int(M["m10"] / M["m00"])
-                    cy = int(M["m01"] / M["m00"])
-                else:
-                    # Fallback to bounding box center
-                    x, y, w, h = cv2.boundingRect(contour)
-                    cx, cy = x + w//2, y + h//2
-                
-                # Check if centroid is in the specified location
-                in_location = False
-                if 'bottom' in location and cy > height * 0.7:
-                    if ('left' in location and cx < width * 0.3) or \
-                       ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                       ('right' in location and cx > width * 0.7) or \
-                       ('left' not in location and 'center' not in location and 'right' not in location):
-                        in_location = True
-                elif 'top' in location and cy < height * 0.3:
-                    if ('left' in location and cx < width * 0.3) or \
-                       ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                       ('right' in location and cx > width * 0.7) or \
-                       ('left' not in location and 'center' not in location and 'right' not in location):
-                        in_location = True
-                elif 'middle' in location and cy >= height * 0.3 and cy <= height * 0.7:
-                    if ('left' in location and cx < width * 0.3) or \
-                       ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                       ('right' in location and cx > width * 0.7) or \
-                       ('left' not in location and 'center' not in location and 'right' not in location):
-                        in_location = True
-                
-                if in_location:
-                    contours_to_remove.append(i)
+            contours_to_remove |= in_location
     
     # Process each contour
     for i, contour in enumerate(perimeter_contours):
         # Skip contours marked for removal
-        if i in contours_to_remove:
+        if contours_to_remove[i]:
             continue
         
         # Create a copy of the contour to modify
         modified_contour = contour.copy()
         
         # Apply fixes based on feedback
-        for issue in feedback.get('issues', []):
-            location = issue.get('location', '').lower()
-            problem = issue.get('problem', '').lower()
-            
-            # Calculate contour centroid
-            M = cv2.moments(contour)
-            if M["m00"] != 0:
-                cx = int(M["m10"] / M["m00"])
-                cy = int(M["m01"] / M["m00"])
-            else:
-                # Fallback to bounding box center
-                x, y, w, h = cv2.boundingRect(contour)
-                cx, cy = x + w//2, y + h//2
-            
-            # Check if this contour is in the location mentioned in the feedback
-            in_location = False
-            if 'bottom' in location and cy > height * 0.7:
-                if ('left' in location and cx < width * 0.3) or \
-                   ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                   ('right' in location and cx > width * 0.7) or \
-                   ('left' not in location and 'center' not in location and 'right' not in location):
-                    in_location = True
-            elif 'top' in location and cy < height * 0.3:
-                if ('left' in location and cx < width * 0.3) or \
-                   ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                   ('right' in location and cx > width * 0.7) or \
-                   ('left' not in location and 'center' not in location and 'right' not in location):
-                    in_location = True
-            elif 'middle' in location and cy >= height * 0.3 and cy <= height * 0.7:
-                if ('left' in location and cx < width * 0.3) or \
-                   ('center' in location and cx >= width * 0.3 and cx <= width * 0.7) or \
-                   ('right' in location and cx > width * 0.7) or \
-                   ('left' not in location and 'center' not in location and 'right' not in location):
-                    in_location = True
-            
-            if in_location and problem == 'deviation':
+        for location, problem, in_location in issues:
+            if in_location[i] and problem == 'deviation':
                 # Fix deviation by straightening the line in this area
+                points = modified_contour.reshape(-1, 2)
+                in_region = None
                 if 'bottom' in location:
                     # Find points in the bottom part
-                    bottom_points = []
-                    bottom_indices = []
-                    for j in range(len(modified_contour)):
-                        if modified_contour[j][0][1] > height * 0.7:
-                            bottom_points.append(modified_contour[j])
-                            bottom_indices.append(j)
-                    
-                    if bottom_points:
-                        # Calculate average y-coordinate for bottom points
-                        avg_y = sum(pt[0][1] for pt in bottom_points) / len(bottom_points)
-                        
-                        # Find leftmost and rightmost x-coordinates
-                        x_coords = [pt[0][0] for pt in bottom_points]
-                        left_x = min(x_coords)
-                        right_x = max(x_coords)
-                        
-                        # Create a new contour with straight bottom line
-                        new_contour = []
-                        for j in range(len(modified_contour)):
-                            if j not in bottom_indices:
-                                new_contour.append(modified_contour[j])
-                        
-                        # Add just two points for the bottom line
-                        new_contour.append(np.array([[[left_x, int(avg_y)]]]))
-                        new_contour.append(np.array([[[right_x, int(avg_y)]]]))
-                        
-                        if len(new_contour) >= 3:
-                            modified_contour = np.array(new_contour)
-                
+                    in_region = points[:, 1] > height * 0.7
                 elif 'top' in location:
                     # Similar logic for top part
-                    top_points = []
-                    top_indices = []
-                    for j in range(len(modified_contour)):
-                        if modified_contour[j][0][1] < height * 0.3:
-                            top_points.append(modified_contour[j])
-                            top_indices.append(j)
+                    in_region = points[:, 1] < height * 0.3
+                
+                if in_region is not None and in_region.any():
+                    region_points = points[in_region]
+                    
+                    # Calculate average y-coordinate for the region points
+                    avg_y = int(region_points[:, 1].mean())
+                    
+                    # Find leftmost and rightmost x-coordinates
+                    left_x = region_points[:, 0].min()
+                    right_x = region_points[:, 0].max()
+                    
+                    # Create a new contour with the region replaced by just two points on a straight line
+                    new_contour = np.vstack([points[~in_region],
+                                             [[left_x, avg_y], [right_x, avg_y]]]).astype(points.dtype)
                     
-                    if top_points:
-                        avg_y = sum(pt[0][1] for pt in top_points) / len(top_points)
-                        x_coords = [pt[0][0] for pt in top_points]
-                        left_x = min(x_coords)
-                        right_x = max(x_coords)
-                        
-                        new_contour = []
-                        for j in range(len(modified_contour)):
-                            if j not in top_indices:
-                                new_contour.append(modified_contour[j])
-                        
-                        new_contour.append(np.array([[[left_x, int(avg_y)]]]))
-                        new_contour.append(np.array([[[right_x, int(avg_y)]]]))
-                        
-                        if len(new_contour) >= 3:
-                            modified_contour = np.array(new_contour)
+                    if len(new_contour) >= 3:
+                        modified_contour = new_contour.reshape(-1, 1, 2)
         
         # Add the modified contour to the improved contours list
         if len(modified_contour) >= 3:  # Ensure it's a valid contour